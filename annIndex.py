@@ -0,0 +1,153 @@
+from pathlib import Path
+import argparse
+import numpy as np
+import json
+
+'''This file builds, saves and loads an approximate nearest-neighbour index (IVF-flat)
+that sits behind SearchIndex once the corpus is too large for brute-force search'''
+
+IVF_DIR = "ivf"
+IVF_MANIFEST_FILE = "ivf.json"
+CENTROIDS_FILE = "centroids.npy"
+LIST_OFFSETS_FILE = "listOffsets.npy"
+LIST_ROWS_FILE = "listRows.npy"
+
+
+class IVFIndex:
+    """An inverted-file index over an L2-normalized embedding matrix.
+
+    The rows are clustered with spherical k-means into `nlist` lists. A query is
+    compared to the centroids first and then only to the rows of the `nprobe`
+    closest lists, so `nprobe` trades recall for latency (nprobe == nlist is exact).
+    The index stores row numbers only; vectors are read from the SearchIndex matrix.
+    """
+
+    def __init__(self, centroids: np.ndarray, listOffsets: np.ndarray, listRows: np.ndarray, nprobe: int = 8):
+        """
+        Args:
+            centroids: An (nlist, D) float32 matrix of normalized cluster centroids.
+            listOffsets: nlist + 1 offsets into listRows; list i is listRows[offsets[i]:offsets[i + 1]].
+            listRows: The row numbers of every list, stored back to back.
+            nprobe: The default number of lists searched per query.
+        """
+        self.centroids = centroids
+        self.listOffsets = listOffsets
+        self.listRows = listRows
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist: int = None, iterations: int = 10,
+              trainingSize: int = None, nprobe: int = 8, seed: int = 0) -> "IVFIndex":
+        """Clusters the embedding matrix and builds the inverted lists.
+
+        Args:
+            embeddings: An (N, D) L2-normalized matrix (may be memory-mapped).
+            nlist: The number of clusters (default: about sqrt(N)).
+            iterations: The number of k-means iterations.
+            trainingSize: How many rows k-means is trained on (default: 64 per list).
+            nprobe: The default number of lists searched per query.
+            seed: The random seed for centroid initialisation and sampling.
+        """
+        rowCount = embeddings.shape[0]
+        nlist = nlist or max(1, int(np.sqrt(rowCount)))
+        nlist = min(nlist, rowCount)
+        rng = np.random.default_rng(seed)
+
+        # 1. Train spherical k-means on a sample of the rows
+        trainingSize = min(rowCount, trainingSize or 64 * nlist)
+        sample = np.asarray(embeddings[np.sort(rng.choice(rowCount, trainingSize, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(trainingSize, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = _assignToCentroids(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            # Re-seed empty clusters with random sample rows so every list stays in use
+            sums[empty] = sample[rng.choice(trainingSize, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        # 2. Assign every row to its closest centroid and store the lists back to back
+        assignment = _assignToCentroids(embeddings, centroids)
+        listRows = np.argsort(assignment, kind="stable").astype(np.int64)
+        listOffsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=listOffsets[1:])
+
+        return cls(centroids.astype(np.float32), listOffsets, listRows, nprobe=nprobe)
+
+    def candidateRows(self, query: np.ndarray, nprobe: int = None) -> np.ndarray:
+        """Returns the row numbers stored in the nprobe lists closest to a normalized query."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroidScores = self.centroids @ query
+        if nprobe < self.nlist:
+            probed = np.argpartition(-centroidScores, nprobe - 1)[:nprobe]
+        else:
+            probed = np.arange(self.nlist)
+        return np.concatenate([self.listRows[self.listOffsets[i]:self.listOffsets[i + 1]] for i in probed])
+
+    def save(self, indexDir: Path) -> None:
+        """Writes the IVF index next to a binary index (in indexDir/ivf/)."""
+        ivfDir = indexDir / IVF_DIR
+        ivfDir.mkdir(parents=True, exist_ok=True)
+        # Each file is renamed into place, so a server with the old lists memory-mapped keeps working
+        for fileName, array in [(CENTROIDS_FILE, self.centroids), (LIST_OFFSETS_FILE, self.listOffsets),
+                                (LIST_ROWS_FILE, self.listRows)]:
+            np.save(ivfDir / (fileName + ".tmp.npy"), array)
+            (ivfDir / (fileName + ".tmp.npy")).replace(ivfDir / fileName)
+        # The manifest is renamed into place last, so an interrupted save never leaves it truncated
+        temporaryPath = ivfDir / (IVF_MANIFEST_FILE + ".tmp")
+        with open(temporaryPath, "w") as f:
+            json.dump({"nlist": self.nlist, "nprobe": self.nprobe, "rowCount": int(len(self.listRows))}, f, indent=4)
+        temporaryPath.replace(ivfDir / IVF_MANIFEST_FILE)
+
+    @classmethod
+    def load(cls, indexDir: Path) -> "IVFIndex":
+        """Opens the IVF index saved in indexDir/ivf/, or returns None if there is none."""
+        ivfDir = indexDir / IVF_DIR
+        if not (ivfDir / IVF_MANIFEST_FILE).exists():
+            return None
+
+        with open(ivfDir / IVF_MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+        return cls(
+            np.load(ivfDir / CENTROIDS_FILE),
+            np.load(ivfDir / LIST_OFFSETS_FILE),
+            np.load(ivfDir / LIST_ROWS_FILE, mmap_mode="r"),
+            nprobe=manifest.get("nprobe", 8),
+        )
+
+
+def _assignToCentroids(embeddings: np.ndarray, centroids: np.ndarray, blockSize: int = 16384) -> np.ndarray:
+    """Returns the closest centroid of every row, working in blocks to bound memory."""
+    assignment = np.empty(embeddings.shape[0], dtype=np.int64)
+    for start in range(0, embeddings.shape[0], blockSize):
+        block = np.asarray(embeddings[start:start + blockSize], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    from indexStore import loadBinaryIndex
+
+    parser = argparse.ArgumentParser(description="Build an IVF-flat ANN index next to a binary index.")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory")
+    parser.add_argument("--nlist", type=int, default=None, help="Number of clusters (default: sqrt(N))")
+    parser.add_argument("--nprobe", type=int, default=8, help="Default number of lists searched per query")
+    parser.add_argument("--iterations", type=int, default=10, help="k-means iterations")
+    args = parser.parse_args()
+
+    binaryIndex = loadBinaryIndex(args.index)
+    if binaryIndex is None:
+        raise SystemExit(1)
+
+    print(f"Building IVF index over {binaryIndex['embeddings'].shape[0]} rows...")
+    ivfIndex = IVFIndex.build(binaryIndex['embeddings'], nlist=args.nlist, iterations=args.iterations, nprobe=args.nprobe)
+    ivfIndex.save(args.index)
+    print(f"✅ Saved IVF index with {ivfIndex.nlist} lists to {args.index / IVF_DIR}")
@@ -0,0 +1,204 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import hashlib
+import json
+import time
+from runtime import (loadSearchIndex, embedUserQueries, findTopNarratives, buildPrompt, _callGenerativeModel,
+                     GENERATION_MODEL, PROMPT_VERSION)
+from caches import QueryEmbeddingCache, ResponseCache, normalizeQuery, loadConceptList
+
+'''This file precomputes the answers for a known list of concepts (the syllabus terms
+in courseConcepts.txt) into a lookup table, so app.py and main.py can answer those
+concepts with a local read and no upstream calls'''
+
+ANSWER_TABLE_FILE = Path("./answerTable.json")
+ANSWER_TABLE_FORMAT_VERSION = 2
+SAVE_EVERY = 10 # Answers generated between intermediate saves (an interrupted run keeps its progress)
+
+
+class AnswerTable:
+    """Precomputed answers keyed by normalized concept.
+
+    Each entry holds the concept, the generated answer, the narrative's similarity
+    score, its docId and a fingerprint of the whole narrative, and the ResponseCache
+    key of (concept, narrative, prompt version, model), which tells a re-run whether
+    the entry is still current.
+    """
+
+    def __init__(self, entries: dict = None):
+        self.entries = entries or {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, concept: str) -> dict:
+        """Returns the entry for a concept (matched like the query cache: case and spacing insensitive), or None."""
+        return self.entries.get(normalizeQuery(concept))
+
+    @classmethod
+    def load(cls, tablePath: Path, searchIndex=None) -> "AnswerTable":
+        """Reads a table written by save; a missing or unreadable table is empty.
+
+        A table generated with another prompt or model is ignored, and when the
+        search index is given, entries whose narrative is no longer at their docId
+        (the index was rebuilt or compacted) are dropped, so stale answers are never
+        served ahead of live generation. Re-run answerTable.py to bring them back.
+        """
+        try:
+            with open(tablePath, "r", encoding="utf-8") as f:
+                table = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        except json.JSONDecodeError:
+            print(f"⚠️ Warning: The answer table '{tablePath}' is not valid JSON, ignoring it.")
+            return cls()
+        if table.get("formatVersion") != ANSWER_TABLE_FORMAT_VERSION:
+            print(f"⚠️ Warning: The answer table '{tablePath}' has an unsupported format, ignoring it.")
+            return cls()
+        if table.get("model") != GENERATION_MODEL or table.get("promptVersion") != PROMPT_VERSION:
+            print(f"⚠️ Warning: The answer table '{tablePath}' was generated with another prompt or model, ignoring it.")
+            return cls()
+
+        entries = table["entries"]
+        if searchIndex is not None:
+            entries = {key: entry for key, entry in entries.items()
+                       if narrativeFingerprint(searchIndex, entry['docId']) == entry['narrative']}
+            if len(entries) < len(table["entries"]):
+                print(f"⚠️ Warning: {len(table['entries']) - len(entries)} answers in '{tablePath}' no longer match "
+                      f"the index, ignoring them.")
+        return cls(entries)
+
+    def save(self, tablePath: Path) -> None:
+        """Writes the table under a temporary name and renames it into place."""
+        temporaryPath = tablePath.with_name(tablePath.name + ".tmp")
+        with open(temporaryPath, "w", encoding="utf-8") as f:
+            json.dump({"formatVersion": ANSWER_TABLE_FORMAT_VERSION, "model": GENERATION_MODEL,
+                       "promptVersion": PROMPT_VERSION, "entries": self.entries}, f, ensure_ascii=False,
+                      separators=(",", ":"))
+        temporaryPath.replace(tablePath)
+
+
+def narrativeFingerprint(searchIndex, docId: int) -> str:
+    """Identifies the whole narrative at docId (the parent essay in a passage-level index), or None if there is none."""
+    narratives = searchIndex.documents if searchIndex.isPassageLevel else searchIndex.texts
+    if not 0 <= docId < len(narratives):
+        return None
+    return hashlib.sha256(narratives[docId].encode("utf-8")).hexdigest()[:16]
+
+
+def buildAnswerTable(concepts: list, searchIndex, client, tablePath: Path = ANSWER_TABLE_FILE,
+                     queryCache: QueryEmbeddingCache = None, responseCache: ResponseCache = None,
+                     maxConcurrency: int = 4, force: bool = False) -> dict:
+    """
+    Precomputes (or brings up to date) the answer of every concept.
+
+    1. Embeds all concepts in bulk (100 per call; cached embeddings are reused).
+    2. Finds each concept's best narrative in one batched search, exactly as a default
+       /api/hawkai request would (hybrid search, k=1).
+    3. Generates only the answers whose concept, narrative, prompt or model changed
+       since the last run, with at most `maxConcurrency` generations in flight.
+       Answers already in the response cache are reused, and new ones are added to it.
+    4. Writes the table (concepts no longer in the list are dropped).
+
+    Returns:
+        A summary dictionary with 'unchanged', 'generated', 'reused', 'failed' and 'removed' counts.
+    """
+    table = AnswerTable.load(tablePath, searchIndex)
+    summary = {'unchanged': 0, 'generated': 0, 'reused': 0, 'failed': 0, 'removed': 0}
+    concepts = list(dict.fromkeys(concept for concept in concepts if normalizeQuery(concept)))
+
+    # 1. Embed in bulk, 2. search in one batch
+    embeddedQueries = embedUserQueries(concepts, client, cache=queryCache)
+    results = findTopNarratives(embeddedQueries, searchIndex, k=1, queryTexts=concepts)
+
+    entries = {}
+    toGenerate = [] # (normalized concept, entry without its answer, narrative text)
+    for concept, narratives in zip(concepts, results):
+        if not narratives:
+            print(f"  ⚠️ Warning: No narrative found for '{concept}', skipping it.")
+            summary['failed'] += 1
+            continue
+        narrative = narratives[0]
+        entry = {'concept': concept, 'score': narrative['score'], 'docId': narrative['docId'],
+                 'narrative': narrativeFingerprint(searchIndex, narrative['docId']),
+                 'key': ResponseCache.makeKey(concept, narrative['text'], PROMPT_VERSION, GENERATION_MODEL)}
+        if 'metadata' in narrative:
+            entry['metadata'] = narrative['metadata']
+
+        previous = table.entries.get(normalizeQuery(concept))
+        if previous is not None and previous['key'] == entry['key'] and not force:
+            entries[normalizeQuery(concept)] = {**previous, **entry} # the narrative may have moved to another row
+            summary['unchanged'] += 1
+            continue
+
+        cachedText = responseCache.get(entry['key']) if responseCache is not None else None
+        if cachedText is not None and not force:
+            entries[normalizeQuery(concept)] = {**entry, 'answer': cachedText}
+            summary['reused'] += 1
+            continue
+        if previous is not None:
+            entries[normalizeQuery(concept)] = previous # served until its replacement is generated
+        toGenerate.append((normalizeQuery(concept), entry, narrative['text']))
+
+    summary['removed'] = len(set(table.entries) - {normalizeQuery(concept) for concept in concepts})
+    table.entries = entries
+
+    # 3. Generate the changed entries with bounded concurrency
+    print(f"Generating {len(toGenerate)} answers ({summary['unchanged'] + summary['reused']} up to date)...")
+
+    def generate(item):
+        key, entry, narrativeText = item
+        text, succeeded = _callGenerativeModel(buildPrompt(entry['concept'], narrativeText), client)
+        return key, entry, text, succeeded
+
+    with ThreadPoolExecutor(max_workers=maxConcurrency) as pool:
+        futures = [pool.submit(generate, item) for item in toGenerate]
+        for done, future in enumerate(as_completed(futures), start=1):
+            key, entry, text, succeeded = future.result()
+            if not succeeded:
+                summary['failed'] += 1 # the previous answer (if any) stays; the next run retries
+                continue
+            table.entries[key] = {**entry, 'answer': text}
+            if responseCache is not None:
+                responseCache.put(entry['key'], text)
+            summary['generated'] += 1
+            print(f"  -> [{done}/{len(toGenerate)}] {entry['concept']}")
+            if summary['generated'] % SAVE_EVERY == 0:
+                table.save(tablePath)
+
+    # 4. Write the table
+    table.save(tablePath)
+    print(f"✅ Answer table written to {tablePath}: {summary}")
+    return summary
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the answers of a concept list into a lookup table.")
+    parser.add_argument("--concepts", type=Path, default=Path("./courseConcepts.txt"), help="One concept per line")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory")
+    parser.add_argument("--out", type=Path, default=ANSWER_TABLE_FILE, help="Answer table to write or update")
+    parser.add_argument("--concurrency", type=int, default=4, help="Generations in flight at once")
+    parser.add_argument("--force", action="store_true", help="Regenerate every answer")
+    parser.add_argument("--fake-client", action="store_true", help="Use fakeClient instead of the Gemini API (dry run)")
+    args = parser.parse_args()
+
+    searchIndex = loadSearchIndex(args.index, Path("./embeddingDatabase.json"))
+    if searchIndex is None:
+        raise SystemExit(1)
+
+    if args.fake_client:
+        from fakeClient import FakeClient
+        client = FakeClient(dimension=searchIndex.dimension)
+        queryCache = responseCache = None # keep fake embeddings and answers out of the real caches
+    else:
+        from google import genai
+        client = genai.Client()
+        queryCache = QueryEmbeddingCache(persistPath=Path("./queryCache.sqlite")) # shared with app.py
+        responseCache = ResponseCache(persistPath=Path("./responseCache.sqlite"))
+
+    start = time.perf_counter()
+    buildAnswerTable(loadConceptList(args.concepts), searchIndex, client, args.out, queryCache=queryCache,
+                     responseCache=responseCache, maxConcurrency=args.concurrency, force=args.force)
+    print(f"Done in {time.perf_counter() - start:.1f}s.")
@@ -1,89 +1,427 @@
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from contextlib import nullcontext
+import os
+import signal
+import threading
+import time
 from google import genai
 # Import your existing functions from runtime.py
-from runtime import loadJSONIndexFromCache, embedUserQuery, findNarrativeUsingDotProduct, generateFinalOutput
+from shardedIndex import watchedIndexFiles
+from runtime import loadSearchIndex, embedUserQuery, embedUserQueries, findTopNarratives, generateFinalOutputCached, streamFinalOutput, prewarmQueryCache, GENERATION_ERROR_MESSAGE
+from caches import QueryEmbeddingCache, ResponseCache, loadConceptList
+from metadata import FilterError
+from answerTable import AnswerTable, ANSWER_TABLE_FILE
+from serving import (INDEX_DIR, CACHE_FILE, QUERY_CACHE_FILE, RESPONSE_CACHE_FILE, RESPONSE_CACHE_TTL_SECONDS,
+                     parse_search_options, precomputed_answer as table_answer, precomputed_response, narrative_summary,
+                     sse_event)
+from metrics import MetricsRegistry, RequestTrace, SamplingProfiler, PROMPT_SIZE_BUCKETS
 
 # --- Configuration ---
-CACHE_FILE = Path("./embeddingDatabase.json") # Path to your cached index
+# The index, cache files and request limits shared with asyncApp.py are in serving.py
+MAX_BATCH_CONCEPTS = 500 # Largest number of concepts accepted by the batch endpoint
+COURSE_CONCEPTS_FILE = Path("./courseConcepts.txt") # Concepts embedded ahead of time at startup
+INDEX_RELOAD_CHECK_SECONDS = 2 # How often each worker checks whether the index was rebuilt
+ALLOW_PROFILING = bool(os.environ.get("HAWKAI_ALLOW_PROFILING")) # Lets ?profile=1 sample a single request
 
 # --- Flask App Setup ---
 app = Flask(__name__)
-client = genai.Client() # Assumes GOOGLE_API_KEY is set as env var
-searchIndex = None # Global variable to hold the loaded index
+searchIndex = None # Global variable to hold the loaded index (shared read-only by forked workers)
+answerTable = AnswerTable() # Precomputed syllabus answers (see answerTable.py), reloaded with the index
+indexStamp = None # Identifies the index files searchIndex was loaded from
+lastReloadCheck = 0.0
+reloadRequested = threading.Event()
+reloadLock = threading.Lock()
+
+# The API client and the SQLite caches must not cross a fork, so each worker opens its own
+client = None
+queryCache = None
+responseCache = None
+
+# --- Metrics (served at /metrics; each worker process reports its own) ---
+metrics = MetricsRegistry()
+REQUEST_SECONDS = metrics.histogram("hawkai_request_seconds", "Time to answer an API request (to the first byte for streams).", ("endpoint", "status"))
+STAGE_SECONDS = metrics.histogram("hawkai_stage_seconds", "Time spent in each runtime stage (embed, search, generate).", ("stage",))
+PROMPT_CHARS = metrics.histogram("hawkai_prompt_chars", "Size of the prompts sent to the generative model.", buckets=PROMPT_SIZE_BUCKETS)
+GENERATION_TOKENS = metrics.counter("hawkai_generation_tokens_total", "Tokens reported by the generative model.", ("kind",))
+INDEX_LOAD_SECONDS = metrics.gauge("hawkai_index_load_seconds", "Time the last index (re)load took.")
+INDEX_BYTES = metrics.gauge("hawkai_index_bytes", "Size of the loaded embedding matrix.")
+metrics.gauge("hawkai_index_rows", "Rows in the loaded search index.", function=lambda: len(searchIndex) if searchIndex is not None else 0)
+ANSWER_TABLE_HITS = metrics.counter("hawkai_answer_table_hits_total", "Requests answered from the precomputed answer table.")
+metrics.gauge("hawkai_answer_table_entries", "Concepts in the precomputed answer table.", function=lambda: len(answerTable))
+
+def cache_lookup_counts():
+    counts = {}
+    for name, cache in [("query", queryCache), ("response", responseCache)]:
+        stats = cache.stats()
+        counts[(name, "hit")] = stats["hits"]
+        counts[(name, "miss")] = stats["misses"]
+    return counts
+
+metrics.counter("hawkai_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"), function=cache_lookup_counts)
+metrics.gauge("hawkai_cache_hit_ratio", "Share of cache lookups that were hits.", ("cache",), function=lambda: {
+    ("query",): queryCache.stats()["hitRate"], ("response",): responseCache.stats()["hitRate"]
+})
+metrics.gauge("hawkai_cache_entries", "Entries held by each cache.", ("cache",), function=lambda: {
+    ("query",): len(queryCache), ("response",): len(responseCache)
+})
+
+def record_index_metrics(loadSeconds):
+    INDEX_LOAD_SECONDS.set(loadSeconds)
+    INDEX_BYTES.set(searchIndex.embeddings.nbytes)
+
+def record_generation_usage(usage):
+    """Adds a generation's prompt size and token counts (see runtime.generateFinalOutputCached) to the metrics."""
+    if 'promptChars' in usage:
+        PROMPT_CHARS.observe(usage['promptChars'])
+    for kind in ("prompt", "output"):
+        if kind + "Tokens" in usage:
+            GENERATION_TOKENS.inc(usage[kind + "Tokens"], kind=kind)
+
+def open_process_resources():
+    """Creates the Gemini client and opens the caches for the current process."""
+    global client, queryCache, responseCache
+    client = genai.Client() # Assumes GOOGLE_API_KEY is set as env var
+    queryCache = QueryEmbeddingCache(maxEntries=10000, persistPath=QUERY_CACHE_FILE)
+    responseCache = ResponseCache(persistPath=RESPONSE_CACHE_FILE, ttlSeconds=RESPONSE_CACHE_TTL_SECONDS)
+
+def close_process_resources():
+    """Closes the caches before forking (see gunicorn.conf.py)."""
+    if queryCache is not None:
+        queryCache.close()
+    if responseCache is not None:
+        responseCache.close()
 
 # --- Load Data On Startup ---
+def index_stamp():
+    """Identifies the current index files; rebuilding or re-tombstoning the index (or a shard, or the answer table) changes it."""
+    stamp = []
+    for path in watchedIndexFiles(INDEX_DIR) + [CACHE_FILE, ANSWER_TABLE_FILE]:
+        try:
+            stat = path.stat()
+            stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
 def load_data():
-    """Loads the search index from the cache file into memory."""
-    global searchIndex
+    """Opens the memory-mapped search index (or the JSON cache as a fallback) and the answer table."""
+    global searchIndex, indexStamp, answerTable
     # Using your existing function from runtime.py
-    searchIndex = loadJSONIndexFromCache(CACHE_FILE)
+    indexStamp = index_stamp()
+    loadStarted = time.perf_counter()
+    searchIndex = loadSearchIndex(INDEX_DIR, CACHE_FILE)
     if searchIndex is None:
         print("❌ CRITICAL ERROR: Failed to load search index. Exiting.")
         # In a real app, you might raise an exception or handle this differently
         exit() # Stop the app if data doesn't load
+    record_index_metrics(time.perf_counter() - loadStarted)
+    answerTable = AnswerTable.load(ANSWER_TABLE_FILE, searchIndex)
+
+def reload_index():
+    """Opens the rebuilt index and swaps it in; requests already running keep the old one.
+
+    If the new index cannot be opened the old one stays in service.
+    """
+    global searchIndex, indexStamp, answerTable
+    stamp = index_stamp()
+    loadStarted = time.perf_counter()
+    newIndex = loadSearchIndex(INDEX_DIR, CACHE_FILE)
+    if newIndex is None:
+        print("⚠️ Warning: The rebuilt index could not be loaded; still serving the previous one.")
+        return
+    searchIndex, indexStamp = newIndex, stamp # a single reference swap, so readers never see a mix
+    answerTable = AnswerTable.load(ANSWER_TABLE_FILE, searchIndex)
+    record_index_metrics(time.perf_counter() - loadStarted)
+    print(f"🔄 Worker {os.getpid()} reloaded the search index.")
+
+@app.before_request
+def reload_index_if_changed():
+    """Swaps in a rebuilt index when SIGUSR2 was received or the index files changed on disk."""
+    global lastReloadCheck
+    now = time.monotonic()
+    if not reloadRequested.is_set() and now - lastReloadCheck < INDEX_RELOAD_CHECK_SECONDS:
+        return
+    with reloadLock:
+        lastReloadCheck = now
+        if reloadRequested.is_set() or index_stamp() != indexStamp:
+            reloadRequested.clear()
+            reload_index()
+
+def install_reload_signal():
+    """Makes SIGUSR2 request an index reload (picked up by the next request in this process)."""
+    if hasattr(signal, "SIGUSR2"): # not available on Windows
+        signal.signal(signal.SIGUSR2, lambda signum, frame: reloadRequested.set())
+
+def prewarm_query_cache():
+    """Embeds the course concepts ahead of time so their first query skips the embedding call."""
+    if not COURSE_CONCEPTS_FILE.exists():
+        return
+    try:
+        embedded = prewarmQueryCache(queryCache, loadConceptList(COURSE_CONCEPTS_FILE), client)
+        print(f"Query cache pre-warmed ({embedded} new concepts embedded, {len(queryCache)} cached).")
+    except Exception as e:
+        # A cold cache only costs latency, so never stop the app over it
+        print(f"⚠️ Warning: Could not pre-warm the query cache. Error: {e}")
 
 load_data()
+open_process_resources()
+prewarm_query_cache()
+install_reload_signal()
+
+def precomputed_answer(data):
+    """The answer table's entry for the request's concept, if it asks for a default (k=1, unfiltered) search."""
+    entry = table_answer(data, answerTable)
+    if entry is not None:
+        ANSWER_TABLE_HITS.inc()
+    return entry
+
+def wants(flag):
+    """True when the request asked for a debug extra, e.g. /api/hawkai?timings=1."""
+    return request.args.get(flag, "").lower() in ("1", "true", "yes")
+
+def profiler_for_request():
+    """A SamplingProfiler when ?profile=1 was asked for and HAWKAI_ALLOW_PROFILING is set, else a no-op."""
+    return SamplingProfiler() if ALLOW_PROFILING and wants("profile") else nullcontext()
+
+@app.before_request
+def start_request_timer():
+    g.requestStarted = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    """Records the latency of every API request, by endpoint and status code."""
+    if request.path.startswith("/api/") and "requestStarted" in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.requestStarted, endpoint=request.path, status=response.status_code)
+    return response
 
 # --- Routes ---
 @app.route('/')
 def index():
     """Serves the main HTML page."""
     return render_template('index.html')
-@app.route('/api/hawkai', methods=['POST'])
-def handle_hawkai_query():
-    """API endpoint to process a concept and return results."""
+
+@app.route('/metrics')
+def handle_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), content_type=MetricsRegistry.CONTENT_TYPE)
+
+def retrieve_narratives(data, trace):
+    """Validates a single-concept request, embeds the concept and finds its top-k narratives.
+
+    Returns:
+        A tuple of (userConcept, k, narratives, error_response); error_response is a
+        (json, status) pair to return as-is, or None when retrieval succeeded.
+    """
     if searchIndex is None: # ensure database was loaded on startup
-        return jsonify({"error": "Search index not loaded"}), 500
+        return None, None, None, (jsonify({"error": "Search index not loaded"}), 500)
 
-    data = request.get_json() # get json data from js fetch request
     userConcept = data.get('concept') # extract concept from json data
 
     if not userConcept: # return error if no user concept was provided
-        return jsonify({"error": "No concept provided"}), 400
+        return None, None, None, (jsonify({"error": "No concept provided"}), 400)
 
+    k, minScore, mmrLambda, filters, optionsError = parse_search_options(data)
+    if optionsError:
+        return None, None, None, (jsonify({"error": optionsError}), 400)
+
+    # Embed the query
+    print(f"Embedding query: '{userConcept}'")
+    with trace.span("embed"):
+        embeddedQuery = embedUserQuery(userQuery=userConcept, client=client, cache=queryCache) # embed user query (cached)
+
+    # Find the k most relevant narratives (the best one is used for generation)
+    print("Finding relevant narratives...")
     try:
-        # Embed the query
-        print(f"Embedding query: '{userConcept}'")
-        embeddedQuery = embedUserQuery(userQuery=userConcept, client=client) # embed user query
-
-        # --- 1. UNPACK THE TUPLE ---
-        # Find the most relevant narrative based on dot product
-        print("Finding relevant narrative...")
-        mostRelatedNarrative, score = findNarrativeUsingDotProduct(
-            embeddedQuery=embeddedQuery,
-            searchIndex=searchIndex
-        )
-        # --- END CHANGE ---
-
-        # --- 2. UPDATE THE ERROR CHECK ---
-        # Check if the score is None, which indicates an error
-        if score is None:
-             # mostRelatedNarrative now holds the error message
-             print(f"❌ Error during search: {mostRelatedNarrative}")
-             return jsonify({"error": mostRelatedNarrative}), 500
-        # --- END CHANGE ---
-
-        # Generate the final output
-        print("Generating final output...")
-        finalOutput = generateFinalOutput(
-            userConcept=userConcept,
-            narrativeText=mostRelatedNarrative, # Pass only the text
-            client=client
-        )
-
-        # --- 3. USE THE REAL SCORE VARIABLE ---
+        with trace.span("search"):
+            narratives = findTopNarratives(
+                embeddedQueries=[embeddedQuery],
+                searchIndex=searchIndex,
+                k=k,
+                minScore=minScore,
+                queryTexts=[userConcept], # hybrid BM25 + vector search when a lexical index exists
+                mmrLambda=mmrLambda,
+                filters=filters
+            )[0]
+    except FilterError as e:
+        return None, None, None, (jsonify({"error": str(e)}), 400)
+    except ValueError as e:
+        print(f"❌ Error during search: {e}")
+        return None, None, None, (jsonify({"error": f"Error: {e}"}), 500)
+
+    if not narratives:
+        return None, None, None, (jsonify({"error": "No narrative matched the concept above the minimum score"}), 404)
+
+    return userConcept, k, narratives, None
+
+@app.route('/api/hawkai', methods=['POST'])
+def handle_hawkai_query():
+    """API endpoint to process a concept and return results.
+
+    With ?timings=1 the response also carries per-stage timings and the prompt size
+    and token counts; with ?profile=1 (if HAWKAI_ALLOW_PROFILING is set) the request
+    is sampled and the hottest stacks are returned under "profile".
+    """
+    data = request.get_json(silent=True) or {} # get json data from js fetch request
+    trace = RequestTrace(STAGE_SECONDS)
+    usage = {}
+
+    # Syllabus concepts are answered from the precomputed table, with no upstream calls
+    precomputed = precomputed_answer(data)
+    if precomputed is not None:
+        response = precomputed_response(precomputed)
+        if wants("timings"):
+            response["timings"] = trace.timings()
+        return jsonify(response)
+
+    try:
+        with profiler_for_request() as profiler:
+            userConcept, k, narratives, errorResponse = retrieve_narratives(data, trace)
+            if errorResponse:
+                return errorResponse
+
+            mostRelatedNarrative = narratives[0]['text']
+            score = narratives[0]['score']
+
+            # Generate the final output
+            print("Generating final output...")
+            with trace.span("generate"):
+                finalOutput, cacheHit = generateFinalOutputCached(
+                    userConcept=userConcept,
+                    narrativeText=mostRelatedNarrative, # Pass only the text
+                    client=client,
+                    cache=responseCache,
+                    usage=usage
+                )
+            record_generation_usage(usage)
+
         # Return the result as JSON - containing final output string
         print("✅ Request processed successfully.")
-        return jsonify({"result": finalOutput, "score": score}) # Use the variable 'score'
-        # --- END CHANGE ---
+        response = {"result": finalOutput, "score": score, "cached": cacheHit}
+        if 'metadata' in narratives[0]: # trace the answer back to its source essay
+            response["metadata"] = narratives[0]['metadata']
+        if k > 1: # only list the other candidates when the caller asked for them
+            response["narratives"] = [narrative_summary(n) for n in narratives]
+        if wants("timings"):
+            response["timings"] = trace.timings()
+            response["usage"] = usage
+        if profiler is not None:
+            response["profile"] = profiler.report()
+        return jsonify(response)
 
     except Exception as e:
         print(f"❌ An unexpected error occurred: {e}")
         # Log the full error in a real application
         return jsonify({"error": "An internal server error occurred"}), 500
-    
-    
+
+
+@app.route('/api/hawkai/stream', methods=['POST'])
+def handle_hawkai_stream_query():
+    """Streaming variant of /api/hawkai, answered as Server-Sent Events.
+
+    Retrieval happens before the stream opens, so bad requests still get a JSON
+    error with the right status. The stream then sends:
+        event: narrative  {"score": ..., "narratives": [...] (only when k > 1)}
+        event: chunk      {"text": "..."} for every piece of the analysis
+        event: done       {} (or {"timings": ..., "usage": ...} with ?timings=1)
+    If generation fails part way, the stream ends with
+        event: error      {"error": "..."} instead of done.
+    """
+    data = request.get_json(silent=True) or {}
+    trace = RequestTrace(STAGE_SECONDS)
+    includeTimings = wants("timings")
+
+    precomputed = precomputed_answer(data)
+    if precomputed is not None:
+        def replay():
+            yield sse_event("narrative", {"score": precomputed['score']})
+            yield sse_event("chunk", {"text": precomputed['answer']})
+            yield sse_event("done", {"timings": trace.timings()} if includeTimings else {})
+        return Response(replay(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    try:
+        userConcept, k, narratives, errorResponse = retrieve_narratives(data, trace)
+        if errorResponse:
+            return errorResponse
+    except Exception as e:
+        print(f"❌ An unexpected error occurred: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+    def generate():
+        narrativeEvent = {"score": narratives[0]['score']}
+        if k > 1:
+            narrativeEvent["narratives"] = [narrative_summary(n) for n in narratives]
+        yield sse_event("narrative", narrativeEvent)
+
+        print("Streaming final output...")
+        usage = {}
+        try:
+            with trace.span("generate"):
+                for text in streamFinalOutput(userConcept, narratives[0]['text'], client, cache=responseCache, usage=usage):
+                    yield sse_event("chunk", {"text": text})
+        except Exception as e:
+            print(f"❌ An error occurred during AI generation: {e}")
+            yield sse_event("error", {"error": GENERATION_ERROR_MESSAGE})
+            return
+        finally:
+            # Also counts the tokens of a stream that failed or whose client went away
+            record_generation_usage(usage)
+        yield sse_event("done", {"timings": trace.timings(), "usage": usage} if includeTimings else {})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # stop proxies such as nginx from buffering the stream
+    })
+
+
+@app.route('/api/hawkai/batch', methods=['POST'])
+def handle_hawkai_batch_query():
+    """API endpoint to retrieve the top-k narratives for many concepts at once.
+
+    Expects {"concepts": [...], "k": 5, "minScore": 0.6}. All concepts are embedded in
+    one API call and scored with one matrix product; no text is generated.
+    """
+    if searchIndex is None:
+        return jsonify({"error": "Search index not loaded"}), 500
+
+    data = request.get_json(silent=True) or {}
+    concepts = data.get('concepts')
+
+    if not isinstance(concepts, list) or not concepts or not all(isinstance(c, str) and c.strip() for c in concepts):
+        return jsonify({"error": "'concepts' must be a non-empty list of strings"}), 400
+    if len(concepts) > MAX_BATCH_CONCEPTS:
+        return jsonify({"error": f"At most {MAX_BATCH_CONCEPTS} concepts can be sent at once"}), 400
+
+    k, minScore, mmrLambda, filters, optionsError = parse_search_options({'k': 5, **data})
+    if optionsError:
+        return jsonify({"error": optionsError}), 400
+
+    trace = RequestTrace(STAGE_SECONDS)
+    try:
+        with profiler_for_request() as profiler:
+            print(f"Embedding {len(concepts)} concepts...")
+            with trace.span("embed"):
+                embeddedQueries = embedUserQueries(userQueries=concepts, client=client, cache=queryCache)
+            with trace.span("search"):
+                results = findTopNarratives(embeddedQueries, searchIndex, k=k, minScore=minScore, queryTexts=concepts,
+                                            mmrLambda=mmrLambda, filters=filters)
+    except FilterError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"❌ An unexpected error occurred: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+    response = {"results": [
+        {"concept": concept, "narratives": [narrative_summary(n) for n in narratives]}
+        for concept, narratives in zip(concepts, results)
+    ]}
+    if wants("timings"):
+        response["timings"] = trace.timings()
+    if profiler is not None:
+        response["profile"] = profiler.report()
+    return jsonify(response)
+
+
 if __name__ == '__main__':
-    load_data() # Load embedded database before starting the server
+    # The index was already loaded above; use gunicorn.conf.py to serve with several workers
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
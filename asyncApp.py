@@ -0,0 +1,269 @@
+from quart import Quart, Response, render_template, request, jsonify
+import asyncio
+import os
+from runtime import loadSearchIndex, embedUserQueryAsync, findTopNarratives, generateFinalOutputAsync, streamFinalOutputAsync, GENERATION_MODEL, PROMPT_VERSION, GENERATION_ERROR_MESSAGE
+from caches import QueryEmbeddingCache, ResponseCache, normalizeQuery
+from concurrency import UpstreamLimiter, UpstreamBusyError, RequestCoalescer
+from metadata import FilterError
+from answerTable import AnswerTable, ANSWER_TABLE_FILE
+from serving import (INDEX_DIR, CACHE_FILE, QUERY_CACHE_FILE, RESPONSE_CACHE_FILE, RESPONSE_CACHE_TTL_SECONDS,
+                     parse_search_options, precomputed_answer as table_answer, precomputed_response, narrative_summary,
+                     sse_event)
+
+'''The async serving path: the same API as app.py on Quart (an asyncio
+re-implementation of Flask), for many simultaneous users.
+
+Run it on an ASGI server, e.g.
+    hypercorn asyncApp:app --bind 0.0.0.0:5001
+Set HAWKAI_FAKE_CLIENT=1 (and optionally HAWKAI_FAKE_LATENCY=<seconds>) to serve
+from fakeClient.FakeClient for load tests without touching the Gemini API.'''
+
+# --- Configuration ---
+# The index, cache files and request limits shared with app.py are in serving.py
+MAX_UPSTREAM_CONCURRENCY = int(os.environ.get("HAWKAI_MAX_UPSTREAM", 8)) # Gemini calls in flight at once
+MAX_UPSTREAM_WAITING = int(os.environ.get("HAWKAI_MAX_WAITING", 64)) # Requests queued for a slot before 429s
+UPSTREAM_WAIT_TIMEOUT = 10.0 # Seconds a request waits for a slot before a 429
+RETRY_AFTER_SECONDS = "2" # Retry-After header sent with 429 responses
+
+# --- Quart App Setup ---
+app = Quart(__name__)
+client = None
+searchIndex = None
+queryCache = None
+responseCache = None
+upstreamLimiter = None
+embedCoalescer = None
+generateCoalescer = None
+answerTable = AnswerTable()
+generationUsage = {"generations": 0, "promptChars": 0, "promptTokens": 0, "outputTokens": 0} # Totals for /status
+
+def make_client():
+    """Returns the Gemini client, or the offline fake client when HAWKAI_FAKE_CLIENT is set."""
+    if os.environ.get("HAWKAI_FAKE_CLIENT"):
+        from fakeClient import FakeClient
+        latency = float(os.environ.get("HAWKAI_FAKE_LATENCY", 0.5))
+        print(f"Using the fake Gemini client ({latency}s latency per call).")
+        return FakeClient(embedLatency=latency / 5, generateLatency=latency)
+
+    from google import genai
+    return genai.Client() # Assumes GOOGLE_API_KEY is set as env var
+
+# --- Load Data On Startup ---
+@app.before_serving
+async def load_data():
+    """Opens the index and caches and creates the limiter once the event loop is running."""
+    global client, searchIndex, queryCache, responseCache, upstreamLimiter, embedCoalescer, generateCoalescer, answerTable
+    client = make_client()
+    searchIndex = loadSearchIndex(INDEX_DIR, CACHE_FILE)
+    if searchIndex is None:
+        raise RuntimeError("Failed to load search index")
+    answerTable = AnswerTable.load(ANSWER_TABLE_FILE, searchIndex)
+
+    queryCache = QueryEmbeddingCache(maxEntries=10000, persistPath=QUERY_CACHE_FILE)
+    responseCache = ResponseCache(persistPath=RESPONSE_CACHE_FILE, ttlSeconds=RESPONSE_CACHE_TTL_SECONDS)
+    upstreamLimiter = UpstreamLimiter(MAX_UPSTREAM_CONCURRENCY, MAX_UPSTREAM_WAITING, UPSTREAM_WAIT_TIMEOUT)
+    embedCoalescer = RequestCoalescer()
+    generateCoalescer = RequestCoalescer()
+
+def precomputed_answer(data):
+    """The answer table's entry for a default (k=1, unfiltered) request (see serving.py)."""
+    return table_answer(data, answerTable)
+
+def record_generation_usage(usage):
+    """Adds one model call's prompt size and token counts (see runtime.generateFinalOutputCached) to the totals."""
+    if not usage:
+        return # answered from the cache, or failed before the call
+    generationUsage["generations"] += 1
+    for key in ("promptChars", "promptTokens", "outputTokens"):
+        generationUsage[key] += usage.get(key, 0)
+
+def too_many_requests(message):
+    """A 429 response telling the client to back off and retry."""
+    return jsonify({"error": message}), 429, {"Retry-After": RETRY_AFTER_SECONDS}
+
+def is_upstream_rate_limit(error):
+    """True for Gemini API errors carrying HTTP 429 (google.genai.errors.APIError sets `code`)."""
+    return getattr(error, "code", None) == 429
+
+async def embed_concept(userConcept):
+    """Embeds a concept; concurrent requests for the same normalized concept share one API call."""
+    cachedVector = await asyncio.to_thread(queryCache.get, userConcept)
+    if cachedVector is not None:
+        return cachedVector
+
+    async def call():
+        async with upstreamLimiter.slot():
+            # Looked up once above, so a miss is not counted twice in the cache stats
+            vector = await embedUserQueryAsync(userConcept, client)
+        await asyncio.to_thread(queryCache.put, userConcept, vector)
+        return vector
+    return await embedCoalescer.run(normalizeQuery(userConcept), call)
+
+async def generate_answer(userConcept, narrativeText):
+    """Generates (or fetches from the cache) the answer; identical in-flight requests share one call."""
+    key = ResponseCache.makeKey(userConcept, narrativeText, PROMPT_VERSION, GENERATION_MODEL)
+    cachedText = await asyncio.to_thread(responseCache.get, key)
+    if cachedText is not None:
+        return cachedText, True
+
+    async def call():
+        usage = {}
+        try:
+            async with upstreamLimiter.slot():
+                # Looked up once above, so a miss is not counted twice in the cache stats
+                output, _ = await generateFinalOutputAsync(userConcept, narrativeText, client, usage=usage)
+        finally:
+            record_generation_usage(usage)
+        await asyncio.to_thread(responseCache.put, key, output)
+        return output, False
+    return await generateCoalescer.run(key, call)
+
+async def retrieve_narratives(data):
+    """Validates a single-concept request, embeds the concept and finds its top-k narratives.
+
+    Returns:
+        A tuple of (userConcept, k, narratives, error_response); error_response is
+        returned as-is, or None when retrieval succeeded.
+    """
+    userConcept = data.get('concept')
+    if not userConcept:
+        return None, None, None, (jsonify({"error": "No concept provided"}), 400)
+
+    k, minScore, mmrLambda, filters, optionsError = parse_search_options(data)
+    if optionsError:
+        return None, None, None, (jsonify({"error": optionsError}), 400)
+
+    embeddedQuery = await embed_concept(userConcept)
+    try:
+        # The search is CPU-bound numpy work (and may page the index in from disk), so it runs off the event loop
+        narratives = (await asyncio.to_thread(findTopNarratives, [embeddedQuery], searchIndex, k=k, minScore=minScore,
+                                              queryTexts=[userConcept], mmrLambda=mmrLambda, filters=filters))[0]
+    except FilterError as e:
+        return None, None, None, (jsonify({"error": str(e)}), 400)
+    except ValueError as e:
+        print(f"❌ Error during search: {e}")
+        return None, None, None, (jsonify({"error": f"Error: {e}"}), 500)
+
+    if not narratives:
+        return None, None, None, (jsonify({"error": "No narrative matched the concept above the minimum score"}), 404)
+    return userConcept, k, narratives, None
+
+# --- Routes ---
+@app.route('/')
+async def index():
+    """Serves the main HTML page."""
+    return await render_template('index.html')
+
+@app.route('/api/hawkai', methods=['POST'])
+async def handle_hawkai_query():
+    """API endpoint to process a concept and return results (see app.py)."""
+    data = await request.get_json(silent=True) or {}
+
+    precomputed = precomputed_answer(data)
+    if precomputed is not None:
+        return jsonify(precomputed_response(precomputed))
+
+    try:
+        userConcept, k, narratives, errorResponse = await retrieve_narratives(data)
+        if errorResponse:
+            return errorResponse
+
+        finalOutput, cacheHit = await generate_answer(userConcept, narratives[0]['text'])
+        response = {"result": finalOutput, "score": narratives[0]['score'], "cached": cacheHit}
+        if 'metadata' in narratives[0]:
+            response["metadata"] = narratives[0]['metadata']
+        if k > 1:
+            response["narratives"] = [narrative_summary(n) for n in narratives]
+        return jsonify(response)
+
+    except UpstreamBusyError as e:
+        return too_many_requests(f"The server is busy, please retry shortly ({e})")
+    except Exception as e:
+        if is_upstream_rate_limit(e):
+            return too_many_requests("The Gemini API is rate limiting requests, please retry shortly")
+        print(f"❌ An unexpected error occurred: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+@app.route('/api/hawkai/stream', methods=['POST'])
+async def handle_hawkai_stream_query():
+    """Streaming variant of /api/hawkai as Server-Sent Events (see app.py for the event format).
+
+    Streams are not coalesced (each client reads its own chunks), but every stream
+    holds an upstream slot until the model finishes. The slot is taken inside the
+    body, so a client that disconnects before the body starts never holds one; a
+    server whose wait queue is already full still answers 429 up front.
+    """
+    data = await request.get_json(silent=True) or {}
+
+    precomputed = precomputed_answer(data)
+    if precomputed is not None:
+        async def replay():
+            yield sse_event("narrative", {"score": precomputed['score']})
+            yield sse_event("chunk", {"text": precomputed['answer']})
+            yield sse_event("done", {})
+        return Response(replay(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    try:
+        userConcept, k, narratives, errorResponse = await retrieve_narratives(data)
+        if errorResponse:
+            return errorResponse
+        if upstreamLimiter.full:
+            upstreamLimiter.rejected += 1
+            raise UpstreamBusyError(f"{upstreamLimiter.waiting} requests are already waiting for the Gemini API")
+    except UpstreamBusyError as e:
+        return too_many_requests(f"The server is busy, please retry shortly ({e})")
+    except Exception as e:
+        if is_upstream_rate_limit(e):
+            return too_many_requests("The Gemini API is rate limiting requests, please retry shortly")
+        print(f"❌ An unexpected error occurred: {e}")
+        return jsonify({"error": "An internal server error occurred"}), 500
+
+    async def generate():
+        narrativeEvent = {"score": narratives[0]['score']}
+        if k > 1:
+            narrativeEvent["narratives"] = [narrative_summary(n) for n in narratives]
+        yield sse_event("narrative", narrativeEvent)
+
+        # The 200 status is already sent, so a busy server or a failed generation ends the stream with an
+        # error event (with the Retry-After seconds when retrying later will help) instead of a 429 or a 500
+        usage = {}
+        try:
+            async with upstreamLimiter.slot():
+                async for text in streamFinalOutputAsync(userConcept, narratives[0]['text'], client,
+                                                         cache=responseCache, usage=usage):
+                    yield sse_event("chunk", {"text": text})
+        except UpstreamBusyError as e:
+            yield sse_event("error", {"error": f"The server is busy, please retry shortly ({e})",
+                                      "retryAfter": int(RETRY_AFTER_SECONDS)})
+            return
+        except Exception as e:
+            if is_upstream_rate_limit(e):
+                yield sse_event("error", {"error": "The Gemini API is rate limiting requests, please retry shortly",
+                                          "retryAfter": int(RETRY_AFTER_SECONDS)})
+            else:
+                print(f"❌ An error occurred during AI generation: {e}")
+                yield sse_event("error", {"error": GENERATION_ERROR_MESSAGE})
+            return
+        finally:
+            record_generation_usage(usage)
+        yield sse_event("done", {})
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@app.route('/api/hawkai/status')
+async def handle_status():
+    """Reports the upstream limiter, coalescing and generation usage counters (useful while load testing)."""
+    return jsonify({
+        "upstream": upstreamLimiter.stats(),
+        "usage": generationUsage,
+        "embedCoalescing": embedCoalescer.stats(),
+        "generateCoalescing": generateCoalescer.stats(),
+    })
+
+
+if __name__ == '__main__':
+    # For local development only; use hypercorn (see above) to serve real traffic
+    app.run(host='0.0.0.0', port=5001)
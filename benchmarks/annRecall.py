@@ -0,0 +1,80 @@
+from pathlib import Path
+import argparse
+import time
+import numpy as np
+from runtime import SearchIndex, loadSearchIndex
+from annIndex import IVFIndex
+
+''' Recall@k benchmark of the IVF ANN index against exact brute-force search.
+Run from the repo root:  python -m benchmarks.annRecall --synthetic 100000 '''
+
+
+def syntheticCorpus(rowCount: int, dimension: int, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Returns clustered, L2-normalized random vectors (uniform noise has no structure to exploit)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    embeddings = centers[rng.integers(clusters, size=rowCount)]
+    embeddings += 0.8 * rng.standard_normal((rowCount, dimension)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def perturbedQueries(searchIndex: SearchIndex, queryCount: int, seed: int = 1) -> np.ndarray:
+    """Builds queries near random corpus rows, standing in for real user queries."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(np.flatnonzero(searchIndex.valid), queryCount)
+    queries = np.asarray(searchIndex.embeddings[rows], dtype=np.float32)
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    return queries
+
+
+def timedSearch(searchIndex: SearchIndex, queries: np.ndarray, k: int, **searchOptions):
+    """Runs every query on its own and returns (list of row arrays, mean latency in ms)."""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        rows, _ = searchIndex.search(query, k=k, **searchOptions)
+        results.append(rows)
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of the IVF index versus exact search.")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory")
+    parser.add_argument("--synthetic", type=int, default=None, help="Use N synthetic vectors instead of --index")
+    parser.add_argument("--dim", type=int, default=3072, help="Dimension of synthetic vectors")
+    parser.add_argument("--nlist", type=int, default=None, help="Number of IVF lists (default: sqrt(N))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64], help="nprobe values to try")
+    parser.add_argument("--k", type=int, default=10, help="k of recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        print(f"Generating {args.synthetic} synthetic vectors of dimension {args.dim}...")
+        embeddings = syntheticCorpus(args.synthetic, args.dim)
+        searchIndex = SearchIndex(embeddings, [""] * len(embeddings), normalized=True)
+    else:
+        searchIndex = loadSearchIndex(args.index)
+        if searchIndex is None:
+            raise SystemExit(1)
+
+    print(f"Building IVF index over {len(searchIndex)} rows...")
+    start = time.perf_counter()
+    searchIndex.annIndex = IVFIndex.build(searchIndex.embeddings, nlist=args.nlist)
+    print(f"  -> {searchIndex.annIndex.nlist} lists built in {time.perf_counter() - start:.1f}s")
+
+    queries = perturbedQueries(searchIndex, args.queries)
+    exactRows, exactMs = timedSearch(searchIndex, queries, args.k, exact=True)
+    print(f"\nexact          recall@{args.k}=1.000  {exactMs:8.3f} ms/query")
+
+    for nprobe in args.nprobe:
+        if nprobe > searchIndex.annIndex.nlist:
+            break
+        approxRows, approxMs = timedSearch(searchIndex, queries, args.k, nprobe=nprobe)
+        hits = sum(len(np.intersect1d(exact, approx)) for exact, approx in zip(exactRows, approxRows))
+        recall = hits / sum(len(exact) for exact in exactRows)
+        print(f"nprobe={nprobe:<6}  recall@{args.k}={recall:.3f}  {approxMs:8.3f} ms/query  ({exactMs / approxMs:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
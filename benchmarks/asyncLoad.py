@@ -0,0 +1,76 @@
+from pathlib import Path
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import numpy as np
+
+''' Load test of the async server (asyncApp.py) against the fake Gemini client.
+Fires --requests POSTs at /api/hawkai with at most --concurrency in flight, drawn
+from --concepts distinct concepts, and reports latency, 429s and how many upstream
+calls coalescing saved. Run from the repo root:
+    python -m benchmarks.asyncLoad --requests 500 --concurrency 100 --latency 0.5 '''
+
+
+async def runLoad(app, requestCount: int, concurrency: int, conceptCount: int) -> tuple:
+    """Sends the requests through Quart's in-process test client; returns (latencies, statusCounts, seconds)."""
+    testClient = app.test_client()
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    statusCounts = {}
+
+    async def oneRequest(i):
+        async with gate:
+            start = time.perf_counter()
+            response = await testClient.post('/api/hawkai', json={"concept": f"load test concept {i % conceptCount}"})
+            await response.get_data()
+            latencies.append(time.perf_counter() - start)
+            statusCounts[response.status_code] = statusCounts.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(oneRequest(i) for i in range(requestCount)))
+    return np.array(latencies), statusCounts, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load-test the async server with the fake Gemini client.")
+    parser.add_argument("--requests", type=int, default=500, help="Total number of requests")
+    parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight at once")
+    parser.add_argument("--concepts", type=int, default=20, help="Distinct concepts (fewer means more coalescing)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake generation latency in seconds")
+    parser.add_argument("--max-upstream", type=int, default=8, help="Upstream concurrency limit")
+    parser.add_argument("--max-waiting", type=int, default=64, help="Upstream wait-queue limit")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory")
+    args = parser.parse_args()
+
+    os.environ["HAWKAI_FAKE_CLIENT"] = "1"
+    os.environ["HAWKAI_FAKE_LATENCY"] = str(args.latency)
+    import asyncApp
+
+    # Fresh caches, so every concept really goes upstream once
+    scratchDir = Path(tempfile.mkdtemp(prefix="hawkaiLoad"))
+    asyncApp.INDEX_DIR = args.index
+    asyncApp.QUERY_CACHE_FILE = scratchDir / "queryCache.sqlite"
+    asyncApp.RESPONSE_CACHE_FILE = scratchDir / "responseCache.sqlite"
+    asyncApp.MAX_UPSTREAM_CONCURRENCY = args.max_upstream
+    asyncApp.MAX_UPSTREAM_WAITING = args.max_waiting
+
+    async with asyncApp.app.test_app():
+        latencies, statusCounts, elapsed = await runLoad(asyncApp.app, args.requests, args.concurrency, args.concepts)
+        models = asyncApp.client.models
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, {args.concepts} concepts, "
+              f"{args.latency}s fake latency\n")
+        print(f"throughput   {args.requests / elapsed:8.1f} req/s ({elapsed:.2f}s)")
+        print(f"latency      p50 {np.percentile(latencies, 50) * 1000:7.1f} ms   "
+              f"p95 {np.percentile(latencies, 95) * 1000:7.1f} ms   p99 {np.percentile(latencies, 99) * 1000:7.1f} ms")
+        print(f"status codes {dict(sorted(statusCounts.items()))}")
+        print(f"upstream     {models.embedCalls} embed calls, {models.generateCalls} generate calls")
+        print(f"coalesced    {asyncApp.embedCoalescer.stats()['coalesced']} embeddings, "
+              f"{asyncApp.generateCoalescer.stats()['coalesced']} generations")
+        print(f"limiter      {asyncApp.upstreamLimiter.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
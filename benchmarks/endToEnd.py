@@ -0,0 +1,182 @@
+from pathlib import Path
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+from indexStore import INDEX_FORMAT_VERSION, MANIFEST_FILE, EMBEDDINGS_FILE, VALID_FILE, TEXT_BLOB_FILE, TEXT_TABLE_FILE
+from textStore import writeTextStore
+from runtime import loadSearchIndex, embedUserQuery, findTopNarratives, generateFinalOutput
+from fakeClient import FakeClient
+
+''' End-to-end latency benchmark of the runtime pipeline (index load, embed, search,
+generate) on synthetic corpora, with fakeClient standing in for the Gemini API.
+Reports p50/p95/p99 per stage and writes the results to benchmarks/results/ as JSON,
+named after the current commit, so runs can be compared across commits.
+Run from the repo root:
+    python -m benchmarks.endToEnd --sizes 1000 10000 100000
+    python -m benchmarks.endToEnd --sizes 1000000 --dtype float16   (about 6 GB on disk) '''
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def writeSyntheticIndex(indexDir: Path, rowCount: int, dimension: int, dtype: str,
+                        clusters: int = 200, blockSize: int = 20000, seed: int = 0) -> None:
+    """Writes a clustered, L2-normalized synthetic binary index block by block (never all in memory).
+
+    An existing corpus with the same shape and dtype is reused.
+    """
+    manifestPath = indexDir / MANIFEST_FILE
+    if manifestPath.exists():
+        with open(manifestPath, "r") as f:
+            manifest = json.load(f)
+        if (manifest.get("count"), manifest.get("dimension"), manifest.get("dtype")) == (rowCount, dimension, dtype):
+            return
+
+    print(f"Writing a synthetic {rowCount:,} x {dimension} {dtype} corpus to {indexDir}...")
+    indexDir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+
+    embeddings = np.lib.format.open_memmap(indexDir / EMBEDDINGS_FILE, mode="w+", dtype=dtype, shape=(rowCount, dimension))
+    for start in range(0, rowCount, blockSize):
+        stop = min(rowCount, start + blockSize)
+        block = centers[rng.integers(clusters, size=stop - start)]
+        block += 0.8 * rng.standard_normal(block.shape, dtype=np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        embeddings[start:stop] = block
+    embeddings.flush()
+    del embeddings
+
+    np.save(indexDir / VALID_FILE, np.ones(rowCount, dtype=bool))
+    writeTextStore(indexDir / TEXT_BLOB_FILE, indexDir / TEXT_TABLE_FILE,
+                   [f"Synthetic narrative {row}." for row in range(rowCount)])
+    with open(manifestPath, "w") as f:
+        json.dump({"formatVersion": INDEX_FORMAT_VERSION, "count": rowCount, "dimension": dimension, "dtype": dtype,
+                   "normalized": True, "passageLevel": False, "documentCount": rowCount,
+                   "textCompression": "zlib"}, f, indent=4)
+
+
+def percentiles(seconds: list) -> dict:
+    """Summarizes latencies (in seconds) as milliseconds."""
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        "count": len(milliseconds),
+        "mean": round(float(milliseconds.mean()), 3),
+        "p50": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99": round(float(np.percentile(milliseconds, 99)), 3),
+    }
+
+
+def benchmarkCorpus(indexDir: Path, args) -> dict:
+    """Times index loading, search and full requests against one corpus."""
+    loadTimes = []
+    for _ in range(args.load_repeats):
+        start = time.perf_counter()
+        searchIndex = loadSearchIndex(indexDir)
+        loadTimes.append(time.perf_counter() - start)
+
+    # Search: queries near random corpus rows, so the top-k is meaningful
+    rng = np.random.default_rng(1)
+    queries = np.asarray(searchIndex.embeddings[np.sort(rng.choice(len(searchIndex), args.queries))], dtype=np.float32)
+    queries += 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    findTopNarratives([queries[0]], searchIndex, k=args.k) # warm-up: touches every mapped page once
+    searchTimes = []
+    for query in queries:
+        start = time.perf_counter()
+        findTopNarratives([query], searchIndex, k=args.k)
+        searchTimes.append(time.perf_counter() - start)
+
+    # End to end: the same stages as /api/hawkai, uncached, against the fake client
+    client = FakeClient(dimension=searchIndex.dimension, embedLatency=args.embed_latency,
+                        generateLatency=args.generate_latency)
+    embedTimes, requestSearchTimes, generateTimes, endToEndTimes = [], [], [], []
+    for i in range(args.requests):
+        start = time.perf_counter()
+        embeddedQuery = embedUserQuery(f"benchmark concept {i}", client)
+        embedded = time.perf_counter()
+        narratives = findTopNarratives([embeddedQuery], searchIndex, k=args.k)[0]
+        searched = time.perf_counter()
+        generateFinalOutput(f"benchmark concept {i}", narratives[0]['text'], client)
+        generated = time.perf_counter()
+
+        embedTimes.append(embedded - start)
+        requestSearchTimes.append(searched - embedded)
+        generateTimes.append(generated - searched)
+        endToEndTimes.append(generated - start)
+
+    return {
+        "rows": len(searchIndex),
+        "dimension": searchIndex.dimension,
+        "dtype": str(searchIndex.embeddings.dtype),
+        "indexBytes": sum(path.stat().st_size for path in indexDir.iterdir() if path.is_file()),
+        "load": percentiles(loadTimes),
+        "search": percentiles(searchTimes),
+        "request": {
+            "embed": percentiles(embedTimes),
+            "search": percentiles(requestSearchTimes),
+            "generate": percentiles(generateTimes),
+            "endToEnd": percentiles(endToEndTimes),
+        },
+    }
+
+
+def gitCommit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark with a fake Gemini client.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Corpus sizes (rows)")
+    parser.add_argument("--dimension", type=int, default=3072, help="Embedding dimension")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="On-disk dtype")
+    parser.add_argument("--queries", type=int, default=200, help="Search-only queries per corpus")
+    parser.add_argument("--requests", type=int, default=20, help="End-to-end requests per corpus")
+    parser.add_argument("--k", type=int, default=5, help="Narratives retrieved per query")
+    parser.add_argument("--load-repeats", type=int, default=5, help="Index loads timed per corpus")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Fake embedding latency (seconds)")
+    parser.add_argument("--generate-latency", type=float, default=0.5, help="Fake generation latency (seconds)")
+    parser.add_argument("--workdir", type=Path, default=Path("./benchmarkCorpora"), help="Where corpora are kept")
+    parser.add_argument("--out", type=Path, default=Path("./benchmarks/results"), help="Results directory")
+    args = parser.parse_args()
+
+    commit = gitCommit()
+    results = {
+        "benchmark": "endToEnd",
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "numpy": np.__version__, "cpus": os.cpu_count()},
+        "settings": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "corpora": [],
+    }
+
+    for rowCount in args.sizes:
+        indexDir = args.workdir / f"synthetic-{rowCount}-{args.dimension}-{args.dtype}"
+        writeSyntheticIndex(indexDir, rowCount, args.dimension, args.dtype)
+        corpus = benchmarkCorpus(indexDir, args)
+        results["corpora"].append(corpus)
+
+        request = corpus["request"]
+        print(f"{rowCount:>9,} rows  load p50 {corpus['load']['p50']:8.2f} ms  "
+              f"search p50/p95/p99 {corpus['search']['p50']:7.2f} / {corpus['search']['p95']:7.2f} / "
+              f"{corpus['search']['p99']:7.2f} ms  end-to-end p50/p95/p99 {request['endToEnd']['p50']:7.1f} / "
+              f"{request['endToEnd']['p95']:7.1f} / {request['endToEnd']['p99']:7.1f} ms")
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    outFile = args.out / f"endToEnd-{commit}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(outFile, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"\nSaved results to {outFile}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+from pathlib import Path
+import argparse
+import os
+import time
+from setup import extractDocuments, DOCUMENT_READERS
+
+''' Text-extraction throughput (files/sec) over the document corpus for several worker counts.
+Run from the repo root:  python -m benchmarks.extractionThroughput '''
+
+DEFAULT_FOLDERS = [Path("./documentNarrativeDatabase/AllWordFiles"), Path("./documentNarrativeDatabase/AllPDFfiles")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure document extraction throughput.")
+    parser.add_argument("folders", nargs="*", type=Path, default=DEFAULT_FOLDERS, help="Folders of .docx/.pdf files")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}),
+                        help="Worker counts to compare")
+    args = parser.parse_args()
+
+    files = [file for folder in args.folders for file in sorted(folder.iterdir()) if file.suffix.lower() in DOCUMENT_READERS]
+    print(f"Extracting {len(files)} files from {len(args.folders)} folders\n")
+
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        errors = chars = 0
+        for _, text, metadata in extractDocuments(files, maxWorkers=workers):
+            if text is None:
+                errors += 1
+            else:
+                chars += metadata['chars']
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} {len(files) / elapsed:8.1f} files/sec  {elapsed:6.2f}s  "
+              f"({baseline / elapsed:4.1f}x, {chars / 1e6:.1f}M chars, {errors} errors)")
+
+
+if __name__ == "__main__":
+    main()
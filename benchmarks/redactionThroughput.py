@@ -0,0 +1,49 @@
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import spacy
+from exampleAPIUsage.process_files import process_docx, redact_docx_files, load_ner_model
+
+''' Compares the old per-paragraph redaction (full spaCy pipeline, one nlp call per
+paragraph) with the batched nlp.pipe redaction on a folder of .docx files.
+Run from the repo root:  python -m benchmarks.redactionThroughput ./documentNarrativeDatabase/papersToAdd/word '''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark .docx redaction throughput.")
+    parser.add_argument("folder", type=Path, nargs="?", default=Path("./documentNarrativeDatabase/papersToAdd/word"),
+                        help="Folder of sample .docx files")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy model name")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N files")
+    parser.add_argument("--batch-size", type=int, default=256, help="nlp.pipe batch size")
+    parser.add_argument("--n-process", type=int, default=1, help="nlp.pipe worker processes")
+    args = parser.parse_args()
+
+    files = sorted(args.folder.glob("*.docx"))[:args.limit]
+    print(f"Benchmarking redaction of {len(files)} files from '{args.folder}'\n")
+
+    with tempfile.TemporaryDirectory() as oldOutput, tempfile.TemporaryDirectory() as newOutput:
+        fullModel = spacy.load(args.model)
+        start = time.perf_counter()
+        for file in files:
+            process_docx(file, Path(oldOutput), fullModel)
+        oldSeconds = time.perf_counter() - start
+
+        nerModel = load_ner_model(args.model)
+        start = time.perf_counter()
+        redact_docx_files(files, newOutput, nerModel, batch_size=args.batch_size, n_process=args.n_process, use_cache=False)
+        newSeconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        redact_docx_files(files, newOutput, nerModel, batch_size=args.batch_size, n_process=args.n_process)
+        redact_docx_files(files, newOutput, nerModel, batch_size=args.batch_size, n_process=args.n_process)
+        cachedSeconds = (time.perf_counter() - start) / 2
+
+    print(f"\nold (per paragraph)   {len(files) / oldSeconds:8.1f} files/sec  {oldSeconds:6.2f}s")
+    print(f"new (nlp.pipe)        {len(files) / newSeconds:8.1f} files/sec  {newSeconds:6.2f}s  ({oldSeconds / newSeconds:.1f}x)")
+    print(f"new, cached re-run    {len(files) / cachedSeconds:8.1f} files/sec  {cachedSeconds:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+from pathlib import Path
+import argparse
+import os
+import numpy as np
+from runtime import SearchIndex, ShardedSearchIndex, loadSearchIndex
+from benchmarks.annRecall import syntheticCorpus, perturbedQueries, timedSearch
+
+''' Latency of a sharded index versus a single index, by shard-search thread count.
+Run from the repo root:  python -m benchmarks.shardedSearch --synthetic 200000 --shards 8 '''
+
+
+def splitIntoShards(searchIndex: SearchIndex, shardCount: int) -> list:
+    """Cuts a SearchIndex into shardCount contiguous SearchIndexes (views, nothing is copied)."""
+    bounds = np.linspace(0, len(searchIndex), shardCount + 1).astype(int)
+    return [SearchIndex(searchIndex.embeddings[start:end], list(searchIndex.texts[start:end]),
+                        searchIndex.valid[start:end], normalized=True)
+            for start, end in zip(bounds, bounds[1:])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search latency of a sharded index by thread count.")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary (or sharded) index directory")
+    parser.add_argument("--synthetic", type=int, default=None, help="Use N synthetic vectors instead of --index")
+    parser.add_argument("--dim", type=int, default=3072, help="Dimension of synthetic vectors")
+    parser.add_argument("--shards", type=int, default=8, help="Shards to split the corpus into")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="Thread counts to try (default: 1, 2, 4, ... cores)")
+    parser.add_argument("--k", type=int, default=10, help="Narratives per query")
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        print(f"Generating {args.synthetic} synthetic vectors of dimension {args.dim}...")
+        embeddings = syntheticCorpus(args.synthetic, args.dim)
+        searchIndex = SearchIndex(embeddings, [""] * len(embeddings), normalized=True)
+    else:
+        searchIndex = loadSearchIndex(args.index)
+        if searchIndex is None:
+            raise SystemExit(1)
+    if isinstance(searchIndex, ShardedSearchIndex):
+        shards = searchIndex.shards
+        searchIndex = SearchIndex(np.asarray(searchIndex.embeddings[np.arange(len(searchIndex))]),
+                                  list(searchIndex.texts), searchIndex.valid, normalized=True)
+    else:
+        shards = splitIntoShards(searchIndex, args.shards)
+
+    cores = os.cpu_count() or 1
+    workerCounts = args.workers or sorted({1, *[2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores], cores})
+    queries = perturbedQueries(searchIndex, args.queries)
+    timedSearch(searchIndex, queries[:10], args.k) # warm-up (pages the matrix in)
+
+    exactRows, singleMs = timedSearch(searchIndex, queries, args.k, exact=True)
+    print(f"\n{len(searchIndex)} rows, {len(shards)} shards, {cores} cores")
+    print(f"single index        {singleMs:8.3f} ms/query")
+    for workers in workerCounts:
+        shardedIndex = ShardedSearchIndex(shards, maxWorkers=workers)
+        timedSearch(shardedIndex, queries[:10], args.k)
+        shardedRows, shardedMs = timedSearch(shardedIndex, queries, args.k, exact=True)
+        same = all(np.array_equal(exact, sharded) for exact, sharded in zip(exactRows, shardedRows))
+        print(f"sharded, {workers:>2} threads {shardedMs:8.3f} ms/query  ({singleMs / shardedMs:4.1f}x)"
+              f"{'' if same else '  (results differ!)'}")
+
+
+if __name__ == "__main__":
+    main()
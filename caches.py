@@ -0,0 +1,229 @@
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+
+'''This file holds the caches that sit in front of the Gemini API calls'''
+
+
+def normalizeQuery(query: str) -> str:
+    """Normalizes a concept so trivially different spellings share a cache entry.
+
+    "  Looking-Glass  Self? " and "looking glass self" both become "looking glass self".
+    """
+    query = query.lower().replace("-", " ").replace("_", " ")
+    query = re.sub(r"\s+", " ", query)
+    return query.strip(" \t\n.,;:!?\"'")
+
+
+class QueryEmbeddingCache:
+    """A normalized-query -> embedding cache with LRU eviction and optional SQLite persistence.
+
+    The in-memory LRU holds the `maxEntries` most recently used vectors. When a
+    `persistPath` is given every vector is also written to SQLite, so the cache
+    survives restarts and is shared by every worker process using the same file.
+    """
+
+    def __init__(self, maxEntries: int = 10000, persistPath: Path = None, model: str = "gemini-embedding-001"):
+        """
+        Args:
+            maxEntries: The maximum number of vectors kept in memory.
+            persistPath: An optional SQLite file backing the cache.
+            model: The embedding model; entries from another model are never returned.
+        """
+        self.maxEntries = maxEntries
+        self.model = model
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+
+        if persistPath is not None:
+            persistPath.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(persistPath), check_same_thread=False, timeout=30)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS queryEmbeddings "
+                "(model TEXT, query TEXT, vector BLOB, PRIMARY KEY (model, query))"
+            )
+            self.connection.commit()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, query: str) -> bool:
+        return self.get(query, countStats=False) is not None
+
+    def get(self, query: str, countStats: bool = True) -> np.ndarray:
+        """Returns the cached float32 vector for a query, or None on a miss."""
+        key = normalizeQuery(query)
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+            elif self.connection is not None:
+                row = self.connection.execute(
+                    "SELECT vector FROM queryEmbeddings WHERE model = ? AND query = ?", (self.model, key)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+
+            if countStats:
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return vector
+
+    def put(self, query: str, vector) -> None:
+        """Stores a query's embedding in memory (and on disk if persistence is enabled)."""
+        key = normalizeQuery(query)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self.lock:
+            self._remember(key, vector)
+            if self.connection is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO queryEmbeddings (model, query, vector) VALUES (?, ?, ?)",
+                    (self.model, key, vector.tobytes())
+                )
+                self.connection.commit()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """Adds to the in-memory LRU, evicting the least recently used entry if full (lock held)."""
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "maxEntries": self.maxEntries,
+            }
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class ResponseCache:
+    """A SQLite-backed cache of generated answers with TTL and size-based (LRU) eviction.
+
+    Keys come from makeKey, so a different concept, narrative, prompt template or
+    model always produces a different key. Without a `persistPath` the cache lives
+    in an in-memory SQLite database.
+    """
+
+    def __init__(self, persistPath: Path = None, ttlSeconds: float = 30 * 24 * 3600, maxEntries: int = 50000):
+        """
+        Args:
+            persistPath: The SQLite file backing the cache (None keeps it in memory).
+            ttlSeconds: How long an answer stays valid (None never expires).
+            maxEntries: The number of answers kept; the least recently used are evicted.
+        """
+        self.ttlSeconds = ttlSeconds
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if persistPath is not None:
+            persistPath.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(persistPath) if persistPath else ":memory:",
+                                          check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT, createdAt REAL, lastUsed REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responsesLastUsed ON responses (lastUsed)")
+        self.connection.commit()
+
+    @staticmethod
+    def makeKey(concept: str, narrativeText: str, promptVersion: str, model: str) -> str:
+        """Builds the cache key from the normalized concept, a narrative fingerprint, the prompt version and the model.
+
+        The narrative is identified by the SHA-256 of its text rather than its row
+        number, so keys stay valid when the index is rebuilt or compacted.
+        """
+        narrativeId = hashlib.sha256(narrativeText.encode("utf-8")).hexdigest()
+        return "|".join([normalizeQuery(concept), narrativeId, promptVersion, model])
+
+    def get(self, key: str) -> str:
+        """Returns the cached answer, or None if it is missing or expired."""
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT response, createdAt FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttlSeconds is not None and now - row[1] > self.ttlSeconds:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.connection.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET lastUsed = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """Stores an answer, evicting expired and then least recently used entries."""
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, createdAt, lastUsed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            if self.ttlSeconds is not None:
+                self.connection.execute("DELETE FROM responses WHERE createdAt < ?", (now - self.ttlSeconds,))
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY lastUsed DESC LIMIT -1 OFFSET ?)", (self.maxEntries,)
+            )
+            self.connection.commit()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        entries = len(self)
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "maxEntries": self.maxEntries,
+            }
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def loadConceptList(conceptFile: Path) -> list:
+    """Reads one concept per line, skipping blank lines and '#' comments."""
+    concepts = []
+    with open(conceptFile, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                concepts.append(line)
+    return concepts
@@ -0,0 +1,113 @@
+import re
+
+'''This file splits narratives into overlapping passages (sentence windows) so each
+passage can be embedded and retrieved on its own'''
+
+# A sentence ends at . ! or ? (optionally followed by a closing quote/bracket) and whitespace
+SENTENCE_END = re.compile(r'[.!?]["\'”’)\]]*\s+|\n\s*\n')
+
+
+def splitIntoSentences(text: str) -> list:
+    """Returns (start, end) character offsets of every sentence in the text."""
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        end = match.end()
+        if text[start:end].strip():
+            spans.append((start, end))
+        start = end
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+def splitNarrativeIntoPassages(text: str, maxChars: int = 1200, overlapSentences: int = 1) -> list:
+    """Splits a narrative into overlapping windows of whole sentences.
+
+    Args:
+        text: The full narrative text.
+        maxChars: The target maximum passage length; a single longer sentence becomes its own passage.
+        overlapSentences: How many sentences consecutive passages share.
+
+    Returns:
+        A list of dictionaries with 'text', 'start' and 'end' keys, where start/end are
+        character offsets into the original narrative.
+    """
+    sentences = splitIntoSentences(text)
+    passages = []
+    first = 0
+    previousLast = -1
+
+    while first < len(sentences):
+        last = first
+        # Grow the window one sentence at a time until it would exceed maxChars
+        while last + 1 < len(sentences) and sentences[last + 1][1] - sentences[first][0] <= maxChars:
+            last += 1
+
+        # An overlapping window that adds no new sentence would repeat the previous passage
+        if last <= previousLast:
+            first = previousLast + 1
+            continue
+        previousLast = last
+
+        start, end = sentences[first][0], sentences[last][1]
+        passages.append({'text': text[start:end].strip(), 'start': start, 'end': end})
+
+        if last + 1 >= len(sentences):
+            break
+        # Step forward, keeping `overlapSentences` sentences of context, but always make progress
+        first = max(first + 1, last + 1 - overlapSentences)
+
+    return passages
+
+
+def chunkNarratives(narrativeData: list, maxChars: int = 1200, overlapSentences: int = 1) -> list:
+    """Splits every narrative into passages tagged with the index of their parent narrative.
+
+    Args:
+        narrativeData: A list of dictionaries with a 'text' key.
+
+    Returns:
+        A list of passage dictionaries with 'text', 'docId', 'start' and 'end' keys
+        (plus the parent's 'metadata', if it has any).
+    """
+    passageData = []
+    for docId, narrative in enumerate(narrativeData):
+        for passage in splitNarrativeIntoPassages(narrative['text'], maxChars, overlapSentences):
+            passage['docId'] = docId
+            if 'metadata' in narrative:
+                passage['metadata'] = narrative['metadata']
+            passageData.append(passage)
+    return passageData
+
+
+def buildExcerpt(documentText: str, spans: list, contextChars: int = 300) -> str:
+    """Cuts the given passages plus a little surrounding context out of a narrative.
+
+    Args:
+        documentText: The full parent narrative.
+        spans: (start, end) character offsets of the selected passages.
+        contextChars: How much text to keep on either side of each passage.
+
+    Returns:
+        The excerpts in document order, with overlapping windows merged and gaps marked by "[...]".
+    """
+    windows = sorted((max(0, start - contextChars), min(len(documentText), end + contextChars)) for start, end in spans)
+    merged = []
+    for start, end in windows:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    excerpts = []
+    for start, end in merged:
+        # Snap the context edges to whitespace so the excerpt never starts or ends mid-word
+        if start > 0 and not documentText[start - 1].isspace():
+            nextSpace = documentText.find(" ", start, end)
+            start = nextSpace + 1 if nextSpace != -1 else start
+        if end < len(documentText) and not documentText[end].isspace():
+            lastSpace = documentText.rfind(" ", start, end)
+            end = lastSpace if lastSpace > start else end
+        excerpts.append(documentText[start:end].strip())
+    return "\n[...]\n".join(excerpts)
@@ -0,0 +1,263 @@
+from pathlib import Path
+import argparse
+import time
+import numpy as np
+import json
+
+'''This file builds, saves and loads a compact copy of the embedding matrix
+(truncated dimensions and/or int8 values) used as a cheap first pass before the
+best candidates are re-ranked with the full-precision vectors'''
+
+COMPACT_DIR = "compact"
+COMPACT_MANIFEST_FILE = "compact.json"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+
+
+class CompactIndex:
+    """A reduced-dimension and/or int8-quantized copy of an L2-normalized embedding matrix.
+
+    Gemini embeddings are trained Matryoshka-style, so their leading dimensions
+    carry most of the signal: keeping the first `dimension` values (renormalized)
+    gives a usable approximation. With quantization each row is further stored as
+    int8 with one float32 scale per row (4x smaller than float32).
+
+    A query scores every compact row, the best `rerankCount` rows are kept and
+    SearchIndex re-scores only those with the full-precision matrix, which stays
+    on disk (memory-mapped) apart from the candidate rows.
+    """
+
+    def __init__(self, vectors: np.ndarray, scales: np.ndarray = None, rerankCount: int = 100):
+        """
+        Args:
+            vectors: An (N, d) matrix of truncated rows, int8 if quantized, else float32.
+            scales: The per-row float32 scales of a quantized matrix (None otherwise).
+            rerankCount: The default number of candidates re-ranked with the full vectors.
+        """
+        self.vectors = vectors
+        self.scales = scales
+        self.rerankCount = rerankCount
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def quantized(self) -> bool:
+        return self.scales is not None
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, dimension: int = 768, quantize: bool = True,
+              rerankCount: int = 100, blockSize: int = 16384) -> "CompactIndex":
+        """Truncates (and optionally quantizes) an (N, D) normalized matrix block by block.
+
+        Args:
+            embeddings: The full matrix (may be memory-mapped).
+            dimension: The number of leading dimensions kept (at most D).
+            quantize: Store int8 values with a per-row scale instead of float32.
+            rerankCount: The default number of candidates re-ranked with the full vectors.
+        """
+        rowCount = embeddings.shape[0]
+        dimension = min(dimension, embeddings.shape[1])
+        vectors = np.empty((rowCount, dimension), dtype=np.int8 if quantize else np.float32)
+        scales = np.empty(rowCount, dtype=np.float32) if quantize else None
+
+        for start in range(0, rowCount, blockSize):
+            block = np.array(embeddings[start:start + blockSize, :dimension], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            block /= norms
+            if quantize:
+                # Symmetric scalar quantization: each row's largest magnitude maps to 127
+                rowScales = np.abs(block).max(axis=1) / 127.0
+                rowScales[rowScales == 0] = 1.0
+                vectors[start:start + len(block)] = np.round(block / rowScales[:, np.newaxis])
+                scales[start:start + len(block)] = rowScales
+            else:
+                vectors[start:start + len(block)] = block
+
+        return cls(vectors, scales, rerankCount)
+
+    def scores(self, query: np.ndarray, blockSize: int = 16384) -> np.ndarray:
+        """Returns approximate cosine similarities of a normalized full-dimension query to every row."""
+        compactQuery = np.asarray(query[:self.dimension], dtype=np.float32)
+        norm = np.linalg.norm(compactQuery)
+        compactQuery = compactQuery / norm if norm > 0 else compactQuery
+
+        if not self.quantized:
+            return np.asarray(self.vectors @ compactQuery, dtype=np.float32)
+
+        # int8 has no BLAS kernel, so rows are widened to float32 one block at a time
+        similarityScores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), blockSize):
+            block = self.vectors[start:start + blockSize].astype(np.float32)
+            similarityScores[start:start + len(block)] = block @ compactQuery
+        return similarityScores * self.scales
+
+    def candidateRows(self, query: np.ndarray, count: int = None, valid: np.ndarray = None) -> np.ndarray:
+        """Returns (unordered) the `count` rows with the best approximate scores, skipping invalid rows."""
+        similarityScores = self.scores(query)
+        if valid is not None:
+            similarityScores[~valid] = -np.inf
+        count = min(count or self.rerankCount, int(valid.sum()) if valid is not None else len(self))
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+        if count < len(similarityScores):
+            return np.argpartition(-similarityScores, count - 1)[:count]
+        return np.arange(len(similarityScores))
+
+    def save(self, indexDir: Path) -> None:
+        """Writes the compact index next to a binary index (in indexDir/compact/)."""
+        compactDir = indexDir / COMPACT_DIR
+        compactDir.mkdir(parents=True, exist_ok=True)
+        # Each file is renamed into place, so a server with the old vectors memory-mapped keeps working
+        arrays = [(VECTORS_FILE, self.vectors)] + ([(SCALES_FILE, self.scales)] if self.quantized else [])
+        for fileName, array in arrays:
+            np.save(compactDir / (fileName + ".tmp.npy"), array)
+            (compactDir / (fileName + ".tmp.npy")).replace(compactDir / fileName)
+        # The manifest is renamed into place last, so an interrupted save never leaves it truncated
+        temporaryPath = compactDir / (COMPACT_MANIFEST_FILE + ".tmp")
+        with open(temporaryPath, "w") as f:
+            json.dump({"rowCount": len(self), "dimension": self.dimension, "quantized": self.quantized,
+                       "rerankCount": self.rerankCount}, f, indent=4)
+        temporaryPath.replace(compactDir / COMPACT_MANIFEST_FILE)
+
+    @classmethod
+    def load(cls, indexDir: Path) -> "CompactIndex":
+        """Opens the compact index saved in indexDir/compact/, or returns None if there is none."""
+        compactDir = indexDir / COMPACT_DIR
+        if not (compactDir / COMPACT_MANIFEST_FILE).exists():
+            return None
+
+        with open(compactDir / COMPACT_MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+        return cls(
+            np.load(compactDir / VECTORS_FILE, mmap_mode="r"),
+            np.load(compactDir / SCALES_FILE) if manifest.get("quantized") else None,
+            rerankCount=manifest.get("rerankCount", 100),
+        )
+
+
+def evaluateCompactIndex(searchIndex, compactIndex: CompactIndex, queries: np.ndarray, k: int = 5) -> dict:
+    """Compares compact-index search (with and without re-ranking) against exact search.
+
+    Args:
+        searchIndex: A runtime.SearchIndex (its exact brute-force results are the reference).
+        compactIndex: The compact index to evaluate.
+        queries: An (M, D) matrix of query embeddings.
+        k: The number of results compared per query.
+
+    Returns:
+        A dictionary of memory sizes, top-1 agreement and recall@k for the first
+        pass alone and after re-ranking, and the mean query latency of each method.
+    """
+    queries = searchIndex._normalizeQueries(queries)
+    valid = searchIndex.valid if searchIndex.hasInvalidRows else None
+    top1FirstPass = top1Reranked = recallFirstPass = recallReranked = 0.0
+    exactSeconds = compactSeconds = 0.0
+
+    # Search through the compact index alone, whatever is attached to the SearchIndex
+    attached = searchIndex.annIndex, searchIndex.compactIndex
+    searchIndex.annIndex, searchIndex.compactIndex = None, compactIndex
+    try:
+        for query in queries:
+            start = time.perf_counter()
+            exactRows, _ = searchIndex.search(query, k=k, exact=True)
+            exactSeconds += time.perf_counter() - start
+
+            firstPassScores = compactIndex.scores(query)
+            if valid is not None:
+                firstPassScores[~valid] = -np.inf
+            firstPassRows = np.argsort(-firstPassScores)[:k]
+
+            start = time.perf_counter()
+            rerankedRows, _ = searchIndex.search(query, k=k)
+            compactSeconds += time.perf_counter() - start
+
+            exactSet = set(exactRows.tolist())
+            top1FirstPass += firstPassRows[0] == exactRows[0]
+            top1Reranked += rerankedRows[0] == exactRows[0]
+            recallFirstPass += len(exactSet.intersection(firstPassRows.tolist())) / len(exactSet)
+            recallReranked += len(exactSet.intersection(rerankedRows.tolist())) / len(exactSet)
+    finally:
+        searchIndex.annIndex, searchIndex.compactIndex = attached
+
+    queryCount = len(queries)
+    fullBytes = len(searchIndex) * searchIndex.dimension * 4 # float32 at query time
+    return {
+        "queries": queryCount,
+        "k": k,
+        "fullBytes": fullBytes,
+        "compactBytes": compactIndex.nbytes,
+        "memorySaved": 1 - compactIndex.nbytes / fullBytes,
+        "firstPass": {"top1Agreement": top1FirstPass / queryCount, "recallAtK": recallFirstPass / queryCount},
+        "reranked": {"top1Agreement": top1Reranked / queryCount, "recallAtK": recallReranked / queryCount,
+                     "rerankCount": compactIndex.rerankCount},
+        "exactMsPerQuery": exactSeconds / queryCount * 1000,
+        "compactMsPerQuery": compactSeconds / queryCount * 1000,
+    }
+
+
+def evaluationQueries(searchIndex, queryCacheFile: Path, count: int = 200, seed: int = 1) -> tuple:
+    """Returns (queries, description): real cached user queries if there are any, else perturbed corpus rows."""
+    if queryCacheFile.exists():
+        import sqlite3
+        connection = sqlite3.connect(str(queryCacheFile))
+        rows = connection.execute("SELECT vector FROM queryEmbeddings LIMIT ?", (count,)).fetchall()
+        connection.close()
+        vectors = [np.frombuffer(row[0], dtype=np.float32) for row in rows]
+        vectors = [vector for vector in vectors if len(vector) == searchIndex.dimension]
+        if vectors:
+            return np.stack(vectors), f"{len(vectors)} cached user queries from {queryCacheFile.name}"
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(np.flatnonzero(searchIndex.valid), count)
+    queries = np.asarray(searchIndex.embeddings[rows], dtype=np.float32)
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    return queries, f"{count} perturbed corpus rows"
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    from runtime import loadSearchIndex
+
+    parser = argparse.ArgumentParser(description="Build (and evaluate) a compact first-pass index next to a binary index.")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory")
+    parser.add_argument("--dimension", type=int, default=768, help="Leading dimensions kept")
+    parser.add_argument("--no-int8", action="store_true", help="Keep float32 values (truncation only)")
+    parser.add_argument("--rerank", type=int, default=100, help="Candidates re-ranked with full vectors")
+    parser.add_argument("--k", type=int, default=5, help="k used for the evaluation")
+    parser.add_argument("--queries", type=Path, default=Path("./queryCache.sqlite"), help="Query cache used as evaluation queries")
+    parser.add_argument("--evaluate-only", action="store_true", help="Evaluate without saving the compact index")
+    args = parser.parse_args()
+
+    searchIndex = loadSearchIndex(args.index)
+    if searchIndex is None:
+        raise SystemExit(1)
+
+    print(f"Building a {args.dimension}-dimension {'float32' if args.no_int8 else 'int8'} compact index "
+          f"over {len(searchIndex)} rows...")
+    compactIndex = CompactIndex.build(searchIndex.embeddings, dimension=args.dimension,
+                                      quantize=not args.no_int8, rerankCount=args.rerank)
+
+    queries, description = evaluationQueries(searchIndex, args.queries)
+    report = evaluateCompactIndex(searchIndex, compactIndex, queries, k=args.k)
+    print(f"Evaluated on {description} (k={args.k}):")
+    print(f"  memory        {report['fullBytes'] / 1e6:9.1f} MB -> {report['compactBytes'] / 1e6:.1f} MB "
+          f"({report['memorySaved']:.0%} saved)")
+    print(f"  first pass    top-1 agreement {report['firstPass']['top1Agreement']:.3f}   "
+          f"recall@{args.k} {report['firstPass']['recallAtK']:.3f}")
+    print(f"  re-ranked     top-1 agreement {report['reranked']['top1Agreement']:.3f}   "
+          f"recall@{args.k} {report['reranked']['recallAtK']:.3f}   ({args.rerank} candidates)")
+    print(f"  latency       exact {report['exactMsPerQuery']:.2f} ms/query, compact {report['compactMsPerQuery']:.2f} ms/query")
+
+    if not args.evaluate_only:
+        compactIndex.save(args.index)
+        print(f"✅ Saved the compact index to {args.index / COMPACT_DIR}")
@@ -0,0 +1,127 @@
+from contextlib import asynccontextmanager
+import asyncio
+
+'''This file holds the asyncio building blocks of the async server: a bounded
+limiter in front of the Gemini API and a coalescer for identical in-flight requests'''
+
+
+class UpstreamBusyError(Exception):
+    """Raised when the upstream limiter's wait queue is full or a wait times out (answered with 429)."""
+
+
+class UpstreamLimiter:
+    """Bounds the number of concurrent calls to the Gemini API, with a bounded wait queue.
+
+    At most `maxConcurrent` calls run at once. Up to `maxWaiting` more callers may
+    wait for a free slot, each for at most `waitTimeout` seconds. Anything beyond
+    that is rejected right away with UpstreamBusyError, so overload turns into fast
+    429 responses instead of an ever-growing queue.
+    """
+
+    def __init__(self, maxConcurrent: int = 8, maxWaiting: int = 64, waitTimeout: float = 10.0):
+        """
+        Args:
+            maxConcurrent: The number of upstream calls allowed in flight at once.
+            maxWaiting: The number of callers allowed to queue for a slot.
+            waitTimeout: How long (in seconds) a caller waits for a slot before giving up.
+        """
+        self.maxConcurrent = maxConcurrent
+        self.maxWaiting = maxWaiting
+        self.waitTimeout = waitTimeout
+        self.semaphore = asyncio.Semaphore(maxConcurrent)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @property
+    def full(self) -> bool:
+        """True when every slot is taken and the wait queue is full, so a new caller would be rejected."""
+        return self.active + self.waiting >= self.maxConcurrent + self.maxWaiting
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one upstream slot for the duration of the `async with` block."""
+        # Counted synchronously, so a burst arriving before any waiter has run is still bounded
+        if self.full:
+            self.rejected += 1
+            raise UpstreamBusyError(f"{self.waiting} requests are already waiting for the Gemini API")
+
+        # The acquire runs as its own task rather than under asyncio.wait_for, which before
+        # Python 3.12 can time out (or be cancelled) just after the acquire succeeded and
+        # so leak the permit; an abandoned acquire is cancelled and released if it won
+        acquire = asyncio.ensure_future(self.semaphore.acquire())
+        self.waiting += 1
+        try:
+            done, _ = await asyncio.wait({acquire}, timeout=self.waitTimeout)
+        except asyncio.CancelledError:
+            self._abandon(acquire)
+            raise
+        finally:
+            self.waiting -= 1
+        if not done:
+            self._abandon(acquire)
+            self.rejected += 1
+            raise UpstreamBusyError(f"No Gemini API slot became free within {self.waitTimeout} seconds")
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    def _abandon(self, acquire: asyncio.Future) -> None:
+        """Gives back the permit of an acquire nobody will use, whenever (and if ever) it is granted."""
+        def releaseIfAcquired(task):
+            if not task.cancelled() and task.exception() is None:
+                self.semaphore.release()
+        acquire.cancel()
+        acquire.add_done_callback(releaseIfAcquired)
+
+    def stats(self) -> dict:
+        """Returns the current load and the number of rejected callers."""
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "maxConcurrent": self.maxConcurrent,
+            "maxWaiting": self.maxWaiting,
+        }
+
+
+class RequestCoalescer:
+    """Shares one in-flight call between every caller asking for the same key.
+
+    The first caller for a key starts the work as a task; callers arriving while it
+    runs await the same task instead of repeating the call. The key is forgotten as
+    soon as the task finishes, so results are never reused after the fact (that is
+    the caches' job).
+    """
+
+    def __init__(self):
+        self.inFlight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, callFactory):
+        """Returns the result of `await callFactory()`, shared with concurrent callers of the same key.
+
+        Args:
+            key: Identifies identical work (e.g. the normalized concept).
+            callFactory: A zero-argument function returning the coroutine to run.
+        """
+        task = self.inFlight.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(callFactory())
+            self.inFlight[key] = task
+            task.add_done_callback(lambda _: self.inFlight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shield the shared task, so one caller disconnecting does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Returns how many calls were started and how many callers joined one already running."""
+        return {"inFlight": len(self.inFlight), "started": self.started, "coalesced": self.coalesced}
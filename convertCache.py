@@ -0,0 +1,40 @@
+from pathlib import Path
+import argparse
+from indexStore import convertJSONCachesToBinary
+from shardedIndex import convertJSONCachesToShards
+
+''' One-shot converter from the JSON embedding caches (backupDBs/, embeddingDatabase.json)
+to the memory-mapped binary index used by app.py and main.py'''
+
+DEFAULT_JSON_CACHES = sorted(Path("./backupDBs/batchWordEmbeddings").glob("*.json")) + \
+                      sorted(Path("./backupDBs/batchPDFEmbeddings").glob("*.json"))
+DEFAULT_INDEX_DIR = Path("./embeddingIndex")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON embedding caches to a binary index.")
+    parser.add_argument("jsonFiles", nargs="*", type=Path,
+                        help="JSON caches to merge (default: every batch in backupDBs/)")
+    parser.add_argument("--out", type=Path, default=DEFAULT_INDEX_DIR,
+                        help="Output index directory (default: ./embeddingIndex)")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="On-disk dtype of the embedding matrix")
+    parser.add_argument("--shards", action="store_true",
+                        help="Write one shard per JSON cache instead of a single index (see shardedIndex.py)")
+    args = parser.parse_args()
+
+    jsonFiles = args.jsonFiles or DEFAULT_JSON_CACHES
+    if not jsonFiles:
+        print("❌ Error: No JSON caches found to convert.")
+        return
+
+    print(f"Converting {len(jsonFiles)} JSON caches into '{args.out}'...")
+    if args.shards:
+        count = convertJSONCachesToShards(jsonFiles, args.out, dtype=args.dtype)
+    else:
+        count = convertJSONCachesToBinary(jsonFiles, args.out, dtype=args.dtype)
+    print(f"✅ Wrote {count} narratives to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+from pathlib import Path
+import argparse
+import re
+import time
+import zlib
+import numpy as np
+
+'''This file finds near-duplicate narratives (drafts, resubmissions and copies of the
+same essay) with MinHash signatures over word shingles and locality-sensitive hashing,
+so only documents that share an LSH bucket are ever compared'''
+
+SHINGLE_WORDS = 5 # Words per shingle
+NUM_PERMUTATIONS = 64 # MinHash values per signature
+LSH_BANDS = 16 # NUM_PERMUTATIONS / LSH_BANDS signature values per band
+DUPLICATE_THRESHOLD = 0.8 # Estimated Jaccard similarity above which two documents are duplicates
+MIN_WORDS = 50 # Shorter texts (often failed extractions) are never treated as duplicates
+MAX_BUCKET_PAIRS = 64 # Buckets larger than this are checked against one representative instead of pairwise
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Fixed seed: signatures are stored in the source registry and must stay comparable between runs
+_rng = np.random.default_rng(20240501)
+_PERMUTATION_A = _rng.integers(1, 1 << 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _rng.integers(0, 1 << 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingleHashes(text: str, size: int = SHINGLE_WORDS) -> np.ndarray:
+    """Returns the unique 32-bit hashes of the text's overlapping `size`-word shingles."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        words = words + [""] * (size - len(words))
+    hashes = {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def minhashSignature(text: str) -> np.ndarray:
+    """Returns the text's MinHash signature: NUM_PERMUTATIONS minimum hash values.
+
+    Each permutation is the universal hash (a * x + b) mod (2^61 - 1); a and x are
+    below 2^32, so the products never overflow uint64. Texts shorter than MIN_WORDS
+    words (often failed extractions) get None and are never treated as duplicates.
+    """
+    if len(_WORD_PATTERN.findall(text)) < MIN_WORDS:
+        return None
+    hashes = shingleHashes(text)
+    permuted = (_PERMUTATION_A[:, np.newaxis] * hashes[np.newaxis, :] + _PERMUTATION_B[:, np.newaxis]) % _MERSENNE_PRIME
+    return (permuted & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+
+def estimatedJaccard(signatureA: np.ndarray, signatureB: np.ndarray) -> float:
+    """The share of equal MinHash values estimates the Jaccard similarity of the shingle sets."""
+    return float(np.mean(signatureA == signatureB))
+
+
+def findDuplicateClusters(signatures: np.ndarray, threshold: float = DUPLICATE_THRESHOLD,
+                          bands: int = LSH_BANDS) -> list:
+    """Groups documents whose signatures are estimated to be at least `threshold` similar.
+
+    Signatures are cut into `bands` bands; documents that agree on a whole band land
+    in the same bucket and only those pairs are verified, so the cost grows with the
+    number of candidate pairs rather than N². Every pair in a bucket of up to
+    MAX_BUCKET_PAIRS documents is verified, so the clusters do not depend on the
+    order of the documents. A larger bucket (a shared template or boilerplate band)
+    would cost its size squared, so each of its members is only verified against the
+    bucket's first document; pairs missed there can still meet in another band.
+
+    Args:
+        signatures: An (N, NUM_PERMUTATIONS) array of MinHash signatures.
+        threshold: The minimum estimated Jaccard similarity of a duplicate pair.
+        bands: The number of LSH bands (must divide the signature length).
+
+    Returns:
+        A list of clusters (lists of row numbers, ascending) with at least two members.
+    """
+    signatures = np.asarray(signatures, dtype=np.uint32)
+    documentCount, length = signatures.shape
+    rowsPerBand = length // bands
+    parent = np.arange(documentCount)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    verified = set()
+    for band in range(bands):
+        buckets = {}
+        bandValues = signatures[:, band * rowsPerBand:(band + 1) * rowsPerBand]
+        for row, key in enumerate(map(bytes, bandValues)):
+            buckets.setdefault(key, []).append(row)
+        for bucket in buckets.values():
+            if len(bucket) > MAX_BUCKET_PAIRS:
+                pairs = ((bucket[0], i) for i in bucket[1:])
+            else:
+                pairs = ((first, i) for position, first in enumerate(bucket) for i in bucket[position + 1:])
+            for first, i in pairs:
+                if (first, i) in verified or find(first) == find(i):
+                    continue
+                verified.add((first, i))
+                if estimatedJaccard(signatures[first], signatures[i]) >= threshold:
+                    parent[find(i)] = find(first)
+
+    clusters = {}
+    for row in range(documentCount):
+        clusters.setdefault(find(row), []).append(row)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def chooseCanonical(members: list, lengths: list, indexed: set = frozenset()) -> int:
+    """Picks the document a cluster keeps: an already-indexed one (no re-embedding), else the longest draft."""
+    return max(members, key=lambda row: (row in indexed, lengths[row], -row))
+
+
+def collapseDuplicates(sources: list, signatures: list, lengths: list, indexed: set = frozenset(),
+                       threshold: float = DUPLICATE_THRESHOLD) -> dict:
+    """Finds near-duplicate clusters and maps every collapsed document to its canonical one.
+
+    Args:
+        sources: The document names, in row order.
+        signatures: Their MinHash signatures (None for texts that are too short to compare).
+        lengths: Their text lengths; among new documents a cluster keeps the longest.
+        indexed: Rows that are already in the index; a cluster keeps one of these if it can.
+        threshold: The minimum estimated Jaccard similarity of a duplicate pair.
+
+    Returns:
+        {collapsed source: canonical source} for every document that is left out.
+    """
+    collapsed = {}
+    eligible = [row for row, signature in enumerate(signatures) if signature is not None]
+    if not eligible:
+        return collapsed
+
+    for members in findDuplicateClusters(np.stack([signatures[row] for row in eligible]), threshold):
+        members = [eligible[member] for member in members]
+        canonical = chooseCanonical(members, lengths, indexed)
+        for row in members:
+            if row != canonical:
+                collapsed[sources[row]] = sources[canonical]
+    return collapsed
+
+
+def printDuplicateReport(collapsed: dict, applied: bool = True) -> None:
+    """Prints each canonical document followed by the documents collapsed (or, unless `applied`, collapsible) into it."""
+    byCanonical = {}
+    for source, canonical in sorted(collapsed.items()):
+        byCanonical.setdefault(canonical, []).append(source)
+    if applied:
+        print(f"Collapsed {len(collapsed)} near-duplicate documents into {len(byCanonical)} canonical ones:")
+    else:
+        print(f"Found {len(collapsed)} near-duplicate documents of {len(byCanonical)} canonical ones "
+              f"(report only, all are embedded):")
+    for canonical, duplicates in sorted(byCanonical.items()):
+        print(f"  ✅ {canonical}")
+        for source in duplicates:
+            print(f"     - {source}")
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    from setup import extractDocuments, DOCUMENT_READERS
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate documents in one or more folders.")
+    parser.add_argument("folders", type=Path, nargs="+", help="Folders of .docx/.pdf files")
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD, help="Minimum estimated Jaccard similarity")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes")
+    args = parser.parse_args()
+
+    files = [file for folder in args.folders for file in sorted(folder.rglob("*")) if file.suffix.lower() in DOCUMENT_READERS]
+    documents = sorted((source, text) for source, text, _ in extractDocuments(files, maxWorkers=args.workers)
+                       if text is not None)
+    sources = [source for source, _ in documents]
+    texts = [text for _, text in documents]
+
+    start = time.perf_counter()
+    signatures = [minhashSignature(text) for text in texts]
+    signed = time.perf_counter()
+    collapsed = collapseDuplicates(sources, signatures, [len(text) for text in texts], threshold=args.threshold)
+    print(f"Signed {len(texts)} documents in {signed - start:.2f}s, clustered in {time.perf_counter() - signed:.3f}s.")
+    printDuplicateReport(collapsed, applied=False)
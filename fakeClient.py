@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+import types
+import numpy as np
+
+'''A deterministic, offline stand-in for genai.Client, used to exercise the
+embedding pipeline, the server and the benchmarks without network calls'''
+
+
+class FakeAPIError(Exception):
+    """Mimics google.genai.errors.APIError: carries the HTTP status in `code`."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def fakeUsage(prompt: str, text: str):
+    """Mimics response.usage_metadata, counting roughly four characters per token."""
+    return types.SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4,
+                                 total_token_count=(len(prompt) + len(text)) // 4)
+
+
+def fakeEmbedding(text: str, dimension: int = 3072) -> list:
+    """Returns a unit-length vector that depends only on the text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeModels:
+    """Implements the parts of client.models that HawkAI calls."""
+
+    def __init__(self, dimension: int = 3072, embedLatency: float = 0.0, generateLatency: float = 0.0,
+                 failureRate: float = 0.0, maxBatchSize: int = 100, seed: int = 0):
+        """
+        Args:
+            dimension: The embedding dimension returned.
+            embedLatency: Seconds each embed_content call sleeps.
+            generateLatency: Seconds each generate_content call sleeps.
+            failureRate: Probability that a call raises a retryable 429/503 FakeAPIError.
+            maxBatchSize: Largest number of contents accepted by one embed_content call.
+            seed: Seed for the failure injection.
+        """
+        self.dimension = dimension
+        self.embedLatency = embedLatency
+        self.generateLatency = generateLatency
+        self.failureRate = failureRate
+        self.maxBatchSize = maxBatchSize
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.embedCalls = 0
+        self.generateCalls = 0
+
+    def _maybeFail(self):
+        with self.lock:
+            failed = self.random.random() < self.failureRate
+        if failed:
+            raise FakeAPIError(self.random.choice([429, 503]), "Injected failure")
+
+    def embed_content(self, model: str, contents, config=None):
+        contents = [contents] if isinstance(contents, str) else list(contents)
+        if len(contents) > self.maxBatchSize:
+            raise FakeAPIError(400, f"At most {self.maxBatchSize} requests can be in one batch.")
+        with self.lock:
+            self.embedCalls += 1
+        time.sleep(self.embedLatency)
+        self._maybeFail()
+        return types.SimpleNamespace(embeddings=[
+            types.SimpleNamespace(values=fakeEmbedding(text, self.dimension)) for text in contents
+        ])
+
+    def generate_content(self, model: str, contents, config=None):
+        with self.lock:
+            self.generateCalls += 1
+        time.sleep(self.generateLatency)
+        self._maybeFail()
+        prompt = contents if isinstance(contents, str) else str(contents)
+        text = f"[fake {model} response to a {len(prompt)}-character prompt]"
+        return types.SimpleNamespace(text=text, usage_metadata=fakeUsage(prompt, text))
+
+    def generate_content_stream(self, model: str, contents, config=None, chunkCount: int = 20):
+        """Yields the generate_content text in `chunkCount` pieces spread over generateLatency."""
+        with self.lock:
+            self.generateCalls += 1
+        self._maybeFail()
+        prompt = contents if isinstance(contents, str) else str(contents)
+        text = f"[fake {model} response to a {len(prompt)}-character prompt]"
+        pieceLength = max(1, -(-len(text) // chunkCount))
+        for start in range(0, len(text), pieceLength):
+            time.sleep(self.generateLatency / chunkCount)
+            yield types.SimpleNamespace(text=text[start:start + pieceLength],
+                                        usage_metadata=fakeUsage(prompt, text[:start + pieceLength]))
+
+
+class FakeAsyncModels:
+    """The client.aio.models counterpart of FakeModels; latency is awaited instead of slept.
+
+    Shares the counters and failure injection of the synchronous FakeModels it wraps.
+    """
+
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+    async def embed_content(self, model: str, contents, config=None):
+        contents = [contents] if isinstance(contents, str) else list(contents)
+        if len(contents) > self.models.maxBatchSize:
+            raise FakeAPIError(400, f"At most {self.models.maxBatchSize} requests can be in one batch.")
+        with self.models.lock:
+            self.models.embedCalls += 1
+        await asyncio.sleep(self.models.embedLatency)
+        self.models._maybeFail()
+        return types.SimpleNamespace(embeddings=[
+            types.SimpleNamespace(values=fakeEmbedding(text, self.models.dimension)) for text in contents
+        ])
+
+    async def generate_content(self, model: str, contents, config=None):
+        with self.models.lock:
+            self.models.generateCalls += 1
+        await asyncio.sleep(self.models.generateLatency)
+        self.models._maybeFail()
+        prompt = contents if isinstance(contents, str) else str(contents)
+        text = f"[fake {model} response to a {len(prompt)}-character prompt]"
+        return types.SimpleNamespace(text=text, usage_metadata=fakeUsage(prompt, text))
+
+    async def generate_content_stream(self, model: str, contents, config=None, chunkCount: int = 20):
+        with self.models.lock:
+            self.models.generateCalls += 1
+        self.models._maybeFail()
+        prompt = contents if isinstance(contents, str) else str(contents)
+        text = f"[fake {model} response to a {len(prompt)}-character prompt]"
+        pieceLength = max(1, -(-len(text) // chunkCount))
+
+        async def chunks():
+            for start in range(0, len(text), pieceLength):
+                await asyncio.sleep(self.models.generateLatency / chunkCount)
+                yield types.SimpleNamespace(text=text[start:start + pieceLength],
+                                            usage_metadata=fakeUsage(prompt, text[:start + pieceLength]))
+        return chunks()
+
+
+class FakeClient:
+    """Drop-in replacement for genai.Client() (only client.models and client.aio.models are provided)."""
+
+    def __init__(self, **options):
+        self.models = FakeModels(**options)
+        self.aio = types.SimpleNamespace(models=FakeAsyncModels(self.models))
@@ -0,0 +1,40 @@
+import gc
+import os
+
+'''Gunicorn settings for serving app.py with several worker processes:
+    gunicorn app:app        (this file is picked up automatically)
+
+The app is imported once in the master (preload_app), so the index is opened
+once and every worker inherits it on fork. The embedding matrix is a read-only
+memory map, so its pages stay shared; gc.freeze() keeps the garbage collector
+from touching (and thereby copying) the inherited text objects.
+
+To swap in a rebuilt index, rewrite embeddingIndex/ (writes are atomic renames);
+each worker notices the new manifest within INDEX_RELOAD_CHECK_SECONDS. To reload
+immediately, send SIGUSR2 to the workers (not the master, where USR2 upgrades gunicorn):
+    pkill -USR2 -P $(cat hawkai.pid)'''
+
+bind = os.environ.get("HAWKAI_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("HAWKAI_WORKERS", min(4, (os.cpu_count() or 1) * 2)))
+threads = int(os.environ.get("HAWKAI_THREADS", 4)) # Requests mostly wait on the Gemini API
+timeout = 120 # Generation with gemini-2.5-pro can take a while
+preload_app = True
+pidfile = "hawkai.pid"
+
+
+def pre_fork(server, worker):
+    import app
+    # SQLite connections must not be shared with a child process
+    app.close_process_resources()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app
+    app.open_process_resources()
+
+
+def post_worker_init(worker):
+    import app
+    # Gunicorn resets the worker's signal handlers (USR2 included) during worker start-up
+    app.install_reload_signal()
@@ -0,0 +1,406 @@
+from pathlib import Path
+import io
+import numpy as np
+import json
+from lexicalIndex import buildLexicalIndex
+from metadata import MetadataColumns, documentMetadata, removeMetadata
+from textStore import TextStore, writeTextStore, appendToTextStore
+
+'''This file reads and writes the binary search index: a memory-mapped embedding
+matrix (.npy) stored next to a compact text store and a small manifest'''
+
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+VALID_FILE = "valid.npy"
+TEXT_BLOB_FILE = "texts.bin"
+TEXT_TABLE_FILE = "textTable.npy"
+DOC_IDS_FILE = "docIds.npy"
+SPANS_FILE = "spans.npy"
+DOCUMENT_BLOB_FILE = "documents.bin"
+DOCUMENT_TABLE_FILE = "documentTable.npy"
+# Indexes written before the text store (no "textCompression" in the manifest) keep their texts in JSON
+TEXTS_FILE = "texts.json"
+DOCUMENTS_FILE = "documents.json"
+SOURCES_FILE = "sources.json"
+
+
+#1. Write the index
+def _embeddingMatrix(narrativeData: list, dtype: str, dimension: int = None):
+    """Stacks the 'embedding' lists into an L2-normalized matrix plus a validity mask.
+
+    Raises:
+        ValueError: If no narrative has a valid embedding or the dimensions disagree.
+    """
+    if dimension is None:
+        for narrative in narrativeData:
+            embedding = narrative.get('embedding')
+            if embedding is not None and isinstance(embedding, list):
+                dimension = len(embedding)
+                break
+
+    if dimension is None:
+        raise ValueError("No valid narrative embeddings found to write.")
+
+    # Rows without an embedding are stored as zeros and flagged in the validity mask
+    embeddings = np.zeros((len(narrativeData), dimension), dtype=np.float32)
+    valid = np.zeros(len(narrativeData), dtype=bool)
+
+    for row, narrative in enumerate(narrativeData):
+        embedding = narrative.get('embedding')
+        if embedding is not None and isinstance(embedding, list):
+            if len(embedding) != dimension:
+                raise ValueError(f"Embedding {row} has dimension {len(embedding)}, expected {dimension}.")
+            embeddings[row] = embedding
+            valid[row] = True
+
+    # Rows are stored L2-normalized so the runtime can search the mapped pages directly
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (embeddings / norms).astype(dtype), valid
+
+
+def _saveArray(path: Path, array: np.ndarray) -> None:
+    """Saves a .npy file under a temporary name and renames it into place.
+
+    Replacing (rather than overwriting) the file means a server that still has the
+    old file memory-mapped keeps reading the old data instead of crashing.
+    """
+    temporaryPath = path.with_name(path.name + ".tmp.npy")
+    np.save(temporaryPath, array)
+    temporaryPath.replace(path)
+
+
+def _writeIndexFiles(indexDir: Path, embeddings: np.ndarray, valid: np.ndarray, texts: list,
+                     docIds: np.ndarray = None, spans: np.ndarray = None, documents: list = None,
+                     metadata: MetadataColumns = None, textCompression: str = "zlib") -> None:
+    """Writes every index file; the manifest is written last so a half-written index is never picked up."""
+    indexDir.mkdir(parents=True, exist_ok=True)
+    _saveArray(indexDir / EMBEDDINGS_FILE, embeddings)
+    _saveArray(indexDir / VALID_FILE, valid)
+    writeTextStore(indexDir / TEXT_BLOB_FILE, indexDir / TEXT_TABLE_FILE, texts, textCompression)
+
+    # Passage-level indexes also store each row's parent narrative and character span
+    if documents is not None:
+        _saveArray(indexDir / DOC_IDS_FILE, docIds.astype(np.int32))
+        _saveArray(indexDir / SPANS_FILE, spans.astype(np.int64).reshape(-1, 2))
+        writeTextStore(indexDir / DOCUMENT_BLOB_FILE, indexDir / DOCUMENT_TABLE_FILE, documents, textCompression)
+
+    # The BM25 index is rebuilt with the rows it covers (see lexicalIndex.py)
+    buildLexicalIndex(indexDir, texts)
+    # Per-document metadata columns (see metadata.py); old columns would describe other documents
+    if metadata is not None:
+        metadata.save(indexDir)
+    else:
+        removeMetadata(indexDir)
+
+    _writeManifest(indexDir, {
+        "formatVersion": INDEX_FORMAT_VERSION,
+        "count": len(texts),
+        "dimension": embeddings.shape[1],
+        "dtype": str(embeddings.dtype),
+        "normalized": True,
+        "passageLevel": documents is not None,
+        "documentCount": len(documents) if documents is not None else len(texts),
+        "textCompression": textCompression,
+    })
+    _removeLegacyTextFiles(indexDir)
+
+
+def _writeManifest(indexDir: Path, manifest: dict) -> None:
+    temporaryPath = indexDir / (MANIFEST_FILE + ".tmp")
+    with open(temporaryPath, "w") as f:
+        json.dump(manifest, f, indent=4)
+    temporaryPath.replace(indexDir / MANIFEST_FILE)
+
+
+def _removeLegacyTextFiles(indexDir: Path) -> None:
+    """Deletes the JSON texts of an index that now has a text store (its manifest no longer points at them)."""
+    for fileName in [TEXTS_FILE, DOCUMENTS_FILE]:
+        (indexDir / fileName).unlink(missing_ok=True)
+
+
+def writeBinaryIndex(narrativeData: list, indexDir: Path, dtype: str = "float32", documents: list = None,
+                     textCompression: str = "zlib") -> None:
+    """Writes a list of narrative dictionaries to a binary index directory.
+
+    Args:
+        narrativeData: A list of dictionaries with 'text' and 'embedding' keys. For a
+                       passage-level index each dictionary also has 'docId', 'start'
+                       and 'end' keys (see chunking.chunkNarratives).
+        indexDir: The directory the index files are written to.
+        dtype: The on-disk dtype of the embedding matrix ("float32" or "float16").
+        documents: The full parent narrative texts of a passage-level index.
+        textCompression: How each text is stored in the text store ("zlib" or "none").
+
+    Raises:
+        ValueError: If no narrative has a valid embedding or the dimensions disagree.
+    """
+    embeddings, valid = _embeddingMatrix(narrativeData, dtype)
+    texts = [narrative.get('text', "") for narrative in narrativeData]
+
+    docIds = spans = None
+    if documents is not None:
+        docIds = np.array([narrative['docId'] for narrative in narrativeData], dtype=np.int32)
+        spans = np.array([(narrative['start'], narrative['end']) for narrative in narrativeData], dtype=np.int64)
+
+    records = documentMetadata(narrativeData, len(documents) if documents is not None else len(texts), documents is not None)
+    metadata = MetadataColumns.fromRecords(records) if records is not None else None
+    _writeIndexFiles(indexDir, embeddings, valid, texts, docIds, spans, documents, metadata, textCompression)
+
+
+#2. Open the index
+def loadBinaryIndex(indexDir: Path) -> dict:
+    """Opens a binary index directory without copying the embedding matrix.
+
+    The embedding matrix and the text store are memory-mapped read-only, so the
+    operating system shares their pages between every process that opens the same
+    index, and a text is only read and decoded when it is asked for.
+
+    Args:
+        indexDir: The directory written by writeBinaryIndex.
+
+    Returns:
+        A dictionary with 'embeddings' (memory-mapped array), 'valid' (bool array),
+        'texts' (a textStore.TextStore, or a list for an index written before the
+        text store) and 'manifest' keys, plus 'docIds', 'spans' and 'documents' for a
+        passage-level index, or None if the index could not be opened.
+    """
+    try:
+        with open(indexDir / MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("formatVersion") != INDEX_FORMAT_VERSION:
+            print(f"❌ Error: Unsupported index format version {manifest.get('formatVersion')} in '{indexDir}'.")
+            return None
+
+        # Rows appended after the manifest was written are ignored until the next manifest
+        count = manifest["count"]
+        embeddings = np.load(indexDir / EMBEDDINGS_FILE, mmap_mode="r")[:count]
+        valid = np.load(indexDir / VALID_FILE)[:count]
+        textCompression = manifest.get("textCompression")
+        if textCompression is not None:
+            texts = TextStore.open(indexDir / TEXT_BLOB_FILE, indexDir / TEXT_TABLE_FILE, count, textCompression)
+        else:
+            with open(indexDir / TEXTS_FILE, "r") as f:
+                texts = json.load(f)[:count]
+
+        passageData = {}
+        if manifest.get("passageLevel"):
+            passageData['docIds'] = np.load(indexDir / DOC_IDS_FILE)[:count]
+            passageData['spans'] = np.load(indexDir / SPANS_FILE)[:count]
+            if textCompression is not None:
+                passageData['documents'] = TextStore.open(indexDir / DOCUMENT_BLOB_FILE, indexDir / DOCUMENT_TABLE_FILE,
+                                                          manifest["documentCount"], textCompression)
+            else:
+                with open(indexDir / DOCUMENTS_FILE, "r") as f:
+                    passageData['documents'] = json.load(f)
+    except FileNotFoundError as e:
+        print(f"❌ Error: The index file '{Path(e.filename).name}' was not found in '{indexDir}'.")
+        return None
+    except (json.JSONDecodeError, ValueError, KeyError) as e:
+        print(f"❌ Error: The index in '{indexDir}' could not be read. {e}")
+        return None
+
+    if embeddings.shape[0] != count or valid.shape[0] != count or len(texts) != count:
+        print(f"❌ Error: The index in '{indexDir}' is inconsistent (row counts differ).")
+        return None
+
+    return {'embeddings': embeddings, 'valid': valid, 'texts': texts, 'manifest': manifest, **passageData}
+
+
+#3. Update the index in place
+def _appendNpyRows(npyPath: Path, rows: np.ndarray, count: int) -> None:
+    """Appends rows after the first `count` rows of a C-ordered .npy file without rewriting them.
+
+    NumPy pads .npy headers so the first axis can grow in place: the new rows are
+    written after row `count` and only the shape in the header is rewritten. Rows
+    past `count` (left by an append that crashed before its manifest was written)
+    are overwritten, so the matrix stays aligned with the manifest's texts.
+    """
+    with open(npyPath, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortranOrder, dtype = np.lib.format.read_array_header_2_0(f)
+        headerLength = f.tell()
+        if fortranOrder:
+            raise ValueError(f"Cannot append to Fortran-ordered array '{npyPath.name}'.")
+
+        rows = np.ascontiguousarray(rows, dtype=dtype)
+        if rows.shape[1:] != tuple(shape[1:]):
+            raise ValueError(f"Cannot append rows of shape {rows.shape[1:]} to '{npyPath.name}' of shape {shape}.")
+        if count > shape[0]:
+            raise ValueError(f"'{npyPath.name}' holds {shape[0]} rows, fewer than the manifest's {count}.")
+
+        header = io.BytesIO()
+        newHeader = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                     'shape': (count + rows.shape[0],) + tuple(shape[1:])}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, newHeader)
+        else:
+            np.lib.format.write_array_header_2_0(header, newHeader)
+        if len(header.getvalue()) != headerLength:
+            raise ValueError(f"The header of '{npyPath.name}' has no room to grow; rewrite the index.")
+
+        f.seek(headerLength + count * int(np.prod(shape[1:])) * dtype.itemsize)
+        f.truncate()
+        f.write(rows.tobytes())
+        f.flush()
+        f.seek(0)
+        f.write(header.getvalue())
+
+
+def appendToBinaryIndex(narrativeData: list, indexDir: Path, documents: list = None) -> range:
+    """Appends new rows to an existing binary index.
+
+    The embedding matrix and the text store grow in place; the small side files are
+    rewritten and the manifest is updated last, so readers either see the old or the
+    new row count. An index that still keeps its texts in JSON is moved to a text store.
+
+    Args:
+        narrativeData: Dictionaries with 'text' and 'embedding' keys (plus 'docId',
+                       'start' and 'end' for a passage-level index, where docId
+                       indexes into `documents`).
+        indexDir: An existing index directory.
+        documents: The parent narratives of the appended passages (passage-level only).
+
+    Returns:
+        The range of row numbers the new narratives were written to.
+    """
+    with open(indexDir / MANIFEST_FILE, "r") as f:
+        manifest = json.load(f)
+    count = manifest["count"]
+    if not narrativeData:
+        return range(count, count)
+
+    embeddings, valid = _embeddingMatrix(narrativeData, manifest["dtype"], manifest["dimension"])
+    _appendNpyRows(indexDir / EMBEDDINGS_FILE, embeddings, count)
+
+    _saveArray(indexDir / VALID_FILE, np.concatenate([np.load(indexDir / VALID_FILE)[:count], valid]))
+    newTexts = [narrative.get('text', "") for narrative in narrativeData]
+    textCompression = manifest.get("textCompression")
+    if textCompression is None:
+        with open(indexDir / TEXTS_FILE, "r") as f:
+            texts = json.load(f)[:count] + newTexts
+        writeTextStore(indexDir / TEXT_BLOB_FILE, indexDir / TEXT_TABLE_FILE, texts)
+    else:
+        appendToTextStore(indexDir / TEXT_BLOB_FILE, indexDir / TEXT_TABLE_FILE, newTexts, count, textCompression)
+        texts = TextStore.open(indexDir / TEXT_BLOB_FILE, indexDir / TEXT_TABLE_FILE, count + len(newTexts), textCompression)
+    # BM25 statistics (document frequencies, average length) are corpus-wide, so the postings are rebuilt
+    buildLexicalIndex(indexDir, texts)
+
+    if manifest.get("passageLevel"):
+        if textCompression is None:
+            with open(indexDir / DOCUMENTS_FILE, "r") as f:
+                existingDocuments = json.load(f)
+            writeTextStore(indexDir / DOCUMENT_BLOB_FILE, indexDir / DOCUMENT_TABLE_FILE, existingDocuments + list(documents))
+            previousDocuments = len(existingDocuments)
+        else:
+            previousDocuments = manifest["documentCount"]
+            appendToTextStore(indexDir / DOCUMENT_BLOB_FILE, indexDir / DOCUMENT_TABLE_FILE, list(documents),
+                              previousDocuments, textCompression)
+        docIds = np.array([narrative['docId'] for narrative in narrativeData], dtype=np.int32) + previousDocuments
+        spans = np.array([(narrative['start'], narrative['end']) for narrative in narrativeData], dtype=np.int64)
+        _saveArray(indexDir / DOC_IDS_FILE, np.concatenate([np.load(indexDir / DOC_IDS_FILE)[:count], docIds]))
+        _saveArray(indexDir / SPANS_FILE, np.concatenate([np.load(indexDir / SPANS_FILE)[:count], spans]))
+        manifest["documentCount"] = previousDocuments + len(documents)
+    else:
+        manifest["documentCount"] = count + len(narrativeData)
+
+    # Metadata columns grow with the documents; documents ingested without metadata get blank records
+    passageLevel = manifest.get("passageLevel", False)
+    previousDocuments = manifest["documentCount"] - (len(documents) if passageLevel else len(narrativeData))
+    existing = MetadataColumns.load(indexDir)
+    newRecords = documentMetadata(narrativeData, len(documents) if passageLevel else len(narrativeData), passageLevel)
+    if existing is not None or newRecords is not None:
+        oldRecords = existing.records()[:previousDocuments] if existing is not None else []
+        oldRecords += [None] * (previousDocuments - len(oldRecords))
+        newRecords = newRecords or [None] * (manifest["documentCount"] - previousDocuments)
+        MetadataColumns.fromRecords(oldRecords + newRecords).save(indexDir)
+
+    manifest["count"] = count + len(narrativeData)
+    manifest["textCompression"] = textCompression or "zlib"
+    _writeManifest(indexDir, manifest)
+    _removeLegacyTextFiles(indexDir)
+    return range(count, count + len(narrativeData))
+
+
+def removeRowsFromBinaryIndex(indexDir: Path, rows) -> None:
+    """Tombstones rows by clearing their validity flag; compactBinaryIndex reclaims the space."""
+    valid = np.load(indexDir / VALID_FILE)
+    valid[np.asarray(list(rows), dtype=np.int64)] = False
+    _saveArray(indexDir / VALID_FILE, valid)
+
+
+def compactBinaryIndex(indexDir: Path) -> None:
+    """Rewrites the index without its tombstoned rows and renumbers the source registry."""
+    binaryIndex = loadBinaryIndex(indexDir)
+    if binaryIndex is None:
+        raise ValueError(f"The index in '{indexDir}' could not be opened for compaction.")
+
+    keep = np.flatnonzero(binaryIndex['valid'])
+    newRowOf = np.full(len(binaryIndex['valid']), -1, dtype=np.int64)
+    newRowOf[keep] = np.arange(len(keep))
+
+    embeddings = np.array(binaryIndex['embeddings'][keep])
+    texts = [binaryIndex['texts'][row] for row in keep]
+    docIds = spans = documents = None
+    usedDocuments = keep
+    if binaryIndex['manifest'].get('passageLevel'):
+        usedDocuments, docIds = np.unique(binaryIndex['docIds'][keep], return_inverse=True)
+        documents = [binaryIndex['documents'][docId] for docId in usedDocuments]
+        spans = binaryIndex['spans'][keep]
+    metadata = MetadataColumns.load(indexDir)
+    if metadata is not None:
+        metadata = metadata.take(usedDocuments)
+
+    sources = loadSources(indexDir)
+    for record in sources.values():
+        # Each source's rows were appended together, so they remain one contiguous range
+        kept = newRowOf[record['rows'][0]:record['rows'][1]]
+        kept = kept[kept >= 0]
+        record['rows'] = [int(kept[0]), int(kept[-1]) + 1] if len(kept) else [0, 0]
+
+    _writeIndexFiles(indexDir, embeddings, np.ones(len(keep), dtype=bool), texts, docIds, spans, documents, metadata,
+                     binaryIndex['manifest'].get("textCompression", "zlib"))
+    writeSources(indexDir, sources)
+
+
+def loadSources(indexDir: Path) -> dict:
+    """Reads the source registry: {source path: {'hash', 'mtime', 'size', 'rows': [start, end]}}."""
+    try:
+        with open(indexDir / SOURCES_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def writeSources(indexDir: Path, sources: dict) -> None:
+    temporaryPath = indexDir / (SOURCES_FILE + ".tmp")
+    with open(temporaryPath, "w") as f:
+        json.dump(sources, f, indent=1)
+    temporaryPath.replace(indexDir / SOURCES_FILE)
+
+
+#4. Convert the old JSON caches
+def convertJSONCachesToBinary(jsonFiles: list, indexDir: Path, dtype: str = "float32") -> int:
+    """Merges one or more JSON embedding caches into a single binary index.
+
+    Args:
+        jsonFiles: Paths to JSON caches written by setup.buildCache.
+        indexDir: The directory the binary index is written to.
+        dtype: The on-disk dtype of the embedding matrix.
+
+    Returns:
+        The number of narratives written to the index.
+    """
+    narrativeData = []
+    for jsonFile in jsonFiles:
+        with open(jsonFile, "r") as f:
+            batch = json.load(f)
+        print(f"  -> Read {len(batch)} narratives from {Path(jsonFile).name}")
+        narrativeData.extend(batch)
+
+    writeBinaryIndex(narrativeData, indexDir, dtype=dtype)
+    return len(narrativeData)
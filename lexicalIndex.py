@@ -0,0 +1,198 @@
+from pathlib import Path
+import argparse
+import re
+import time
+import numpy as np
+import json
+
+'''This file builds, saves and loads a BM25 inverted index over the narrative texts,
+used next to the embedding search so exact names and terms ("Goffman", "anomie")
+are never missed'''
+
+LEXICAL_DIR = "lexical"
+LEXICAL_MANIFEST_FILE = "lexical.json"
+POSTING_OFFSETS_FILE = "postingOffsets.npy"
+POSTING_ROWS_FILE = "postingRows.npy"
+POSTING_WEIGHTS_FILE = "postingWeights.npy"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Lower-cases the text and returns its words without stopwords or possessive "'s"."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower().replace("’", "'")):
+        if token.endswith("'s"):
+            token = token[:-2]
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """An Okapi BM25 inverted index whose postings are stored as flat NumPy arrays.
+
+    Term t's postings are postingRows[postingOffsets[t]:postingOffsets[t + 1]]. The
+    BM25 weight of each (term, row) pair is precomputed at build time, so a query is
+    just a few array slices and a scatter-add: well under a millisecond per query.
+    """
+
+    def __init__(self, vocabulary: dict, postingOffsets: np.ndarray, postingRows: np.ndarray,
+                 postingWeights: np.ndarray, rowCount: int):
+        """
+        Args:
+            vocabulary: Maps each term to its term id.
+            postingOffsets: vocabulary size + 1 offsets into postingRows/postingWeights.
+            postingRows: The row numbers of every term's postings, stored back to back.
+            postingWeights: The BM25 weight of each posting.
+            rowCount: The number of rows (documents or passages) indexed.
+        """
+        self.vocabulary = vocabulary
+        self.postingOffsets = postingOffsets
+        self.postingRows = postingRows
+        self.postingWeights = postingWeights
+        self.rowCount = rowCount
+
+    def __len__(self) -> int:
+        return self.rowCount
+
+    @classmethod
+    def build(cls, texts: list, k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Tokenizes every text and builds the postings.
+
+        Args:
+            texts: The row texts, in row order.
+            k1: BM25 term-frequency saturation.
+            b: BM25 document-length normalization.
+        """
+        vocabulary = {}
+        termIds, rows, counts = [], [], []
+        rowLengths = np.zeros(len(texts), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            rowLengths[row] = len(tokens)
+            termCounts = {}
+            for token in tokens:
+                termId = vocabulary.setdefault(token, len(vocabulary))
+                termCounts[termId] = termCounts.get(termId, 0) + 1
+            termIds.extend(termCounts.keys())
+            rows.extend([row] * len(termCounts))
+            counts.extend(termCounts.values())
+
+        termIds = np.asarray(termIds, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int32)
+        counts = np.asarray(counts, dtype=np.float32)
+
+        # Group the postings by term (rows stay ascending within a term)
+        order = np.argsort(termIds, kind="stable")
+        termIds, rows, counts = termIds[order], rows[order], counts[order]
+        documentFrequency = np.bincount(termIds, minlength=len(vocabulary))
+        postingOffsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(documentFrequency, out=postingOffsets[1:])
+
+        averageLength = float(rowLengths.mean()) if len(texts) and rowLengths.mean() > 0 else 1.0
+        idf = np.log(1 + (len(texts) - documentFrequency + 0.5) / (documentFrequency + 0.5)).astype(np.float32)
+        lengthNorm = k1 * (1 - b + b * rowLengths[rows] / averageLength)
+        postingWeights = (idf[termIds] * counts * (k1 + 1) / (counts + lengthNorm)).astype(np.float32)
+
+        return cls(vocabulary, postingOffsets, rows, postingWeights, len(texts))
+
+    def scores(self, query: str) -> tuple:
+        """Returns (rows, scores) of every row containing at least one query term, unordered."""
+        termIds = [self.vocabulary[token] for token in set(tokenize(query)) if token in self.vocabulary]
+        if not termIds:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        slices = [slice(self.postingOffsets[termId], self.postingOffsets[termId + 1]) for termId in termIds]
+        rows = np.concatenate([self.postingRows[s] for s in slices])
+        weights = np.concatenate([self.postingWeights[s] for s in slices])
+        matchedRows, inverse = np.unique(rows, return_inverse=True)
+        return matchedRows, np.bincount(inverse, weights=weights).astype(np.float32)
+
+    def search(self, query: str, k: int = 10, valid: np.ndarray = None) -> tuple:
+        """Returns the row numbers and BM25 scores of the k best-matching rows, best first."""
+        rows, rowScores = self.scores(query)
+        if valid is not None:
+            keep = valid[rows]
+            rows, rowScores = rows[keep], rowScores[keep]
+        if len(rows) > k:
+            best = np.argpartition(-rowScores, k - 1)[:k]
+            rows, rowScores = rows[best], rowScores[best]
+        order = np.argsort(-rowScores, kind="stable")
+        return rows[order].astype(np.int64), rowScores[order]
+
+    def save(self, indexDir: Path) -> None:
+        """Writes the lexical index next to a binary index (in indexDir/lexical/)."""
+        lexicalDir = indexDir / LEXICAL_DIR
+        lexicalDir.mkdir(parents=True, exist_ok=True)
+        # Each file is renamed into place, so a server with the old postings memory-mapped keeps working
+        for fileName, array in [(POSTING_OFFSETS_FILE, self.postingOffsets), (POSTING_ROWS_FILE, self.postingRows),
+                                (POSTING_WEIGHTS_FILE, self.postingWeights)]:
+            np.save(lexicalDir / (fileName + ".tmp.npy"), array)
+            (lexicalDir / (fileName + ".tmp.npy")).replace(lexicalDir / fileName)
+        # The vocabulary is stored as a list: a term's position is its id
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        temporaryPath = lexicalDir / (LEXICAL_MANIFEST_FILE + ".tmp")
+        with open(temporaryPath, "w") as f:
+            json.dump({"rowCount": self.rowCount, "terms": terms}, f, separators=(",", ":"))
+        temporaryPath.replace(lexicalDir / LEXICAL_MANIFEST_FILE)
+
+    @classmethod
+    def load(cls, indexDir: Path) -> "BM25Index":
+        """Opens the lexical index saved in indexDir/lexical/, or returns None if there is none."""
+        lexicalDir = indexDir / LEXICAL_DIR
+        if not (lexicalDir / LEXICAL_MANIFEST_FILE).exists():
+            return None
+
+        with open(lexicalDir / LEXICAL_MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+        return cls(
+            {term: termId for termId, term in enumerate(manifest["terms"])},
+            np.load(lexicalDir / POSTING_OFFSETS_FILE),
+            np.load(lexicalDir / POSTING_ROWS_FILE, mmap_mode="r"),
+            np.load(lexicalDir / POSTING_WEIGHTS_FILE, mmap_mode="r"),
+            manifest["rowCount"],
+        )
+
+
+def buildLexicalIndex(indexDir: Path, texts: list) -> BM25Index:
+    """Builds the BM25 index over a binary index's row texts and saves it next to it."""
+    lexicalIndex = BM25Index.build(texts)
+    lexicalIndex.save(indexDir)
+    return lexicalIndex
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    from indexStore import loadBinaryIndex
+
+    parser = argparse.ArgumentParser(description="Build a BM25 lexical index next to a binary index.")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory")
+    parser.add_argument("--query", nargs="*", default=["Goffman", "Durkheim anomie", "white privilege"],
+                        help="Queries timed after building")
+    args = parser.parse_args()
+
+    binaryIndex = loadBinaryIndex(args.index)
+    if binaryIndex is None:
+        raise SystemExit(1)
+
+    start = time.perf_counter()
+    lexicalIndex = buildLexicalIndex(args.index, binaryIndex['texts'])
+    print(f"✅ Indexed {len(lexicalIndex)} rows ({len(lexicalIndex.vocabulary)} terms, "
+          f"{len(lexicalIndex.postingRows)} postings) in {time.perf_counter() - start:.2f}s")
+
+    for query in args.query:
+        lexicalIndex.search(query) # warm-up
+        start = time.perf_counter()
+        for _ in range(100):
+            rows, _ = lexicalIndex.search(query, k=10)
+        print(f"  '{query}': {len(rows)} rows in {(time.perf_counter() - start) * 10:.3f} ms/query")
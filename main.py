@@ -1,58 +1,271 @@
-# Import functions from your other modules
-from runtime import loadJSONIndexFromCache, embedUserQuery, findNarrativeUsingDotProduct, generateFinalOutput
-# Note: You don't actually need anything from setup.py here
+import time
+PROCESS_START = time.perf_counter() # Startup-to-first-result is measured from here
+
+# Only the standard library is imported up front; numpy, the runtime and google.genai
+# (about half a second on its own) are imported once a query needs them
 from pathlib import Path
-from google import genai
-def run():
-    """Contains the core logic for running the AI query."""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+import argparse
+import json
+import queue
+import sys
+import threading
+from serving import INDEX_DIR, CACHE_FILE, QUERY_CACHE_FILE, RESPONSE_CACHE_FILE # The same files the servers use
+
+'''Command-line entry point: answers one concept (python main.py "Anomie"), or streams
+concepts from a file or stdin (python main.py --queries concepts.txt) and writes one
+JSON result per line, several queries at a time'''
+
+DEFAULT_QUERY = 'Pay among genders'
+
+
+class LazyClient:
+    """Stands in for genai.Client and creates it on first use.
+
+    Queries answered from the answer table or the caches never touch the client, so
+    a run that needs no API call never imports google.genai.
+    """
+
+    def __init__(self, fake: bool = False, dimension: int = 3072):
+        self.fake = fake
+        self.dimension = dimension
+        self.client = None
+        self.lock = threading.Lock()
 
-    USER_QUERY = 'Pay among genders' # Or get input: input("Enter a sociological concept: ")
-    client = genai.Client()
+    @property
+    def models(self):
+        with self.lock:
+            if self.client is None:
+                if self.fake:
+                    from fakeClient import FakeClient
+                    self.client = FakeClient(dimension=self.dimension)
+                else:
+                    from google import genai
+                    self.client = genai.Client()
+        return self.client.models
 
-    # pull cache file (ie. Narrative database)
-    database = Path("./embeddingDatabase.json")
-    searchIndex = loadJSONIndexFromCache(cacheFile=database)
 
-    # Check if loading the cache failed
-    if searchIndex is None:
-        print("❌ Exiting: Failed to load the search index.")
-        return "Error: Could not load data." # Return an error message
+class QuerySession:
+    """The index, caches, answer table and client shared by every query of one run."""
 
-    # embed the query
-    print(f"\nEmbedding the query: '{USER_QUERY}'...")
-    embeddedQuery = embedUserQuery(userQuery=USER_QUERY, client=client)
+    def __init__(self, indexDir: Path = INDEX_DIR, fakeClient: bool = False, retrieveOnly: bool = False):
+        """
+        Args:
+            indexDir: The binary (or sharded) index directory; the JSON cache is the fallback.
+            fakeClient: Use fakeClient.FakeClient instead of the Gemini API (dry runs); its
+                        embeddings and answers are kept out of the shared caches.
+            retrieveOnly: Find each query's narrative but skip generation (evaluation runs).
 
-    print("Finding the most relevant narrative...")
-    # 1. Unpack the tuple into two separate variables
-    mostRelatedNarrativeToQuery, score = findNarrativeUsingDotProduct(
-        embeddedQuery=embeddedQuery,
-        searchIndex=searchIndex
-    )
+        Raises:
+            RuntimeError: If the search index cannot be loaded.
+        """
+        from runtime import loadSearchIndex
+        from caches import QueryEmbeddingCache, ResponseCache
+        from answerTable import AnswerTable, ANSWER_TABLE_FILE
 
-    # 2. Update the error check to look at the 'score' variable
-    if score is None:
-        # The 'mostRelatedNarrativeToQuery' variable now holds the error message
-        print(f"❌ {mostRelatedNarrativeToQuery}")
-        return mostRelatedNarrativeToQuery # Return the error message
-    # --- END UPDATED SECTION ---
+        # open the binary index (memory-mapped), falling back to the JSON cache
+        self.searchIndex = loadSearchIndex(indexDir=indexDir, cacheFile=CACHE_FILE)
+        if self.searchIndex is None:
+            raise RuntimeError("Failed to load the search index.")
+
+        self.retrieveOnly = retrieveOnly
+        self.client = LazyClient(fake=fakeClient, dimension=self.searchIndex.dimension)
+        self.answerTable = AnswerTable.load(ANSWER_TABLE_FILE, self.searchIndex)
+        if fakeClient:
+            self.queryCache = QueryEmbeddingCache()
+            self.responseCache = ResponseCache()
+        else:
+            self.queryCache = QueryEmbeddingCache(persistPath=QUERY_CACHE_FILE)
+            self.responseCache = ResponseCache(persistPath=RESPONSE_CACHE_FILE)
+
+    def answer(self, userQuery: str) -> dict:
+        """
+        Answers one concept.
+
+        Returns:
+            A dictionary with 'query', 'answer', 'score', 'source' ("table", "cache" or
+            "generated"; "retrieved" when generation is skipped) and 'seconds', plus the
+            narrative's 'metadata' when the index has it, or with 'error' on failure.
+        """
+        from runtime import embedUserQuery, findTopNarratives, generateFinalOutputCached, GENERATION_ERROR_MESSAGE
+
+        start = time.perf_counter()
+        result = {'query': userQuery}
+        try:
+            # syllabus concepts are answered from the precomputed table (see answerTable.py) without any API call
+            precomputed = self.answerTable.get(userQuery)
+            if precomputed is not None:
+                result.update(answer=precomputed['answer'], score=precomputed['score'], source="table")
+                if 'metadata' in precomputed:
+                    result['metadata'] = precomputed['metadata']
+            else:
+                embeddedQuery = embedUserQuery(userQuery=userQuery, client=self.client, cache=self.queryCache)
+                narratives = findTopNarratives([embeddedQuery], self.searchIndex, k=1, queryTexts=[userQuery])[0]
+                if not narratives:
+                    result['error'] = "No valid narrative embeddings found in the search index."
+                else:
+                    narrative = narratives[0]
+                    result['score'] = narrative['score']
+                    if 'metadata' in narrative:
+                        result['metadata'] = narrative['metadata']
+                    if self.retrieveOnly:
+                        result.update(docId=narrative['docId'], source="retrieved")
+                    else:
+                        finalOutput, cacheHit = generateFinalOutputCached(userQuery, narrative['text'], self.client,
+                                                                          self.responseCache)
+                        if finalOutput == GENERATION_ERROR_MESSAGE:
+                            result['error'] = finalOutput
+                        else:
+                            result.update(answer=finalOutput, source="cache" if cacheHit else "generated")
+        except Exception as e:
+            result['error'] = str(e)
+
+        result['seconds'] = round(time.perf_counter() - start, 4)
+        return result
+
+    def close(self) -> None:
+        self.queryCache.close()
+        self.responseCache.close()
+
+
+def run(userQuery: str = DEFAULT_QUERY, session: QuerySession = None):
+    """Contains the core logic for running the AI query."""
+
+    # Or get input: input("Enter a sociological concept: ")
+    if session is None:
+        try:
+            session = QuerySession()
+        except RuntimeError:
+            print("❌ Exiting: Failed to load the search index.")
+            return "Error: Could not load data." # Return an error message
+
+    print(f"\nAnswering the query: '{userQuery}'...")
+    result = session.answer(userQuery)
+    if 'error' in result:
+        print(f"❌ {result['error']}")
+        return f"Error: {result['error']}"
 
     # (Optional) You can print the score for debugging here
-    print(f"  -> Found narrative with score: {score:.4f}")
+    print(f"  -> Found narrative with score: {result['score']:.4f} ({result['source']}, {result['seconds']:.2f}s)")
+    return result.get('answer', "")
+
+
+def readQueries(source):
+    """Yields one concept per line of a file (or of stdin for "-"), skipping blank lines and '#' comments.
+
+    Lines are read as they arrive, so queries piped in one by one are answered one by one.
+    """
+    stream = sys.stdin if str(source) == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def answerStream(session: QuerySession, queries, concurrency: int = 4):
+    """
+    Answers a stream of queries with up to `concurrency` of them in flight.
 
-    # generate the final output
-    print("Generating the final output...")
-    # This line now works correctly, as 'mostRelatedNarrativeToQuery' holds only the text
-    finalOutput = generateFinalOutput(USER_QUERY, mostRelatedNarrativeToQuery, client)
+    A reader thread submits queries as they are read (at most 2 * concurrency ahead
+    of the output), while results are yielded in input order as soon as each one and
+    every query before it are done.
 
-    return finalOutput
+    Raises:
+        Whatever reading the queries raised (e.g. OSError for a missing --queries
+        file), once the results of the queries read before it have been yielded.
+    """
+    submitted = queue.Queue(maxsize=2 * concurrency)
+    readError = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        def submitQueries():
+            try:
+                for userQuery in queries:
+                    submitted.put(pool.submit(session.answer, userQuery))
+            except Exception as e:
+                readError.append(e)
+            finally:
+                submitted.put(None)
+
+        threading.Thread(target=submitQueries, daemon=True).start()
+        for future in iter(submitted.get, None):
+            yield future.result()
+    if readError:
+        raise readError[0]
+
+
+def runBatch(queries, output, session: QuerySession, concurrency: int = 4) -> dict:
+    """
+    Streams queries through answerStream and writes one JSON line per result to `output`.
+
+    Returns:
+        A summary with the query count, the time to the first result (since the
+        process started), the total time, the throughput and a count per source.
+    """
+    summary = {'queries': 0, 'firstResultSeconds': None, 'sources': {}}
+    start = time.perf_counter()
+    for result in answerStream(session, queries, concurrency):
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+        if summary['firstResultSeconds'] is None:
+            summary['firstResultSeconds'] = round(time.perf_counter() - PROCESS_START, 3)
+        summary['queries'] += 1
+        source = "error" if 'error' in result else result['source']
+        summary['sources'][source] = summary['sources'].get(source, 0) + 1
+
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    summary['queriesPerSecond'] = round(summary['queries'] / summary['seconds'], 2) if summary['seconds'] else None
+    return summary
 
 
 def main():
-    """Main function to execute the run logic and print the result."""
-    result = run()
-    print("\n--- HawkAI Response ---")
-    print(result) # Print the string returned by run()
+    """Main function: answers one concept and prints it, or runs a batch of concepts as JSONL."""
+    parser = argparse.ArgumentParser(description="Answer sociological concepts with the most relevant student narrative.")
+    parser.add_argument("concepts", nargs="*", help=f"Concepts to answer (default: '{DEFAULT_QUERY}')")
+    parser.add_argument("--queries", help="File with one concept per line, or - for stdin (JSONL output)")
+    parser.add_argument("--out", type=Path, default=None, help="JSONL file to write (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Queries embedded/generated at once")
+    parser.add_argument("--index", type=Path, default=INDEX_DIR, help="Binary (or sharded) index directory")
+    parser.add_argument("--retrieve-only", action="store_true", help="Find each narrative but skip generation")
+    parser.add_argument("--fake-client", action="store_true", help="Use fakeClient instead of the Gemini API (dry run)")
+    args = parser.parse_args()
+
+    if args.queries is None and len(args.concepts) <= 1:
+        try:
+            session = QuerySession(args.index, fakeClient=args.fake_client, retrieveOnly=args.retrieve_only)
+        except RuntimeError:
+            print("❌ Exiting: Failed to load the search index.")
+            return
+        result = run(args.concepts[0] if args.concepts else DEFAULT_QUERY, session)
+        session.close()
+        print("\n--- HawkAI Response ---")
+        print(result) # Print the string returned by run()
+        return
+
+    output = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    # Status messages (index warnings, API errors) go to stderr so stdout stays valid JSONL
+    with redirect_stdout(sys.stderr):
+        try:
+            session = QuerySession(args.index, fakeClient=args.fake_client, retrieveOnly=args.retrieve_only)
+        except RuntimeError as e:
+            raise SystemExit(f"❌ {e}")
+        print(f"Index opened {time.perf_counter() - PROCESS_START:.2f}s after launch.")
+        queries = readQueries(args.queries) if args.queries is not None else iter(args.concepts)
+        try:
+            summary = runBatch(queries, output, session, args.concurrency)
+        except (OSError, UnicodeDecodeError) as e:
+            raise SystemExit(f"❌ Could not read the queries: {e}")
+        finally:
+            session.close()
+        print(f"✅ {summary['queries']} queries in {summary['seconds']:.2f}s ({summary['queriesPerSecond']} queries/s), "
+              f"first result {summary['firstResultSeconds']}s after launch, by source: {summary['sources']}")
+    if output is not sys.stdout:
+        output.close()
 
 # --- FIX 2: Add this block to actually run main() ---
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
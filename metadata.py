@@ -0,0 +1,249 @@
+from pathlib import Path
+import argparse
+import hashlib
+import re
+import shutil
+import numpy as np
+import json
+
+'''This file parses document metadata (assignment, course, LATE flag, submission id,
+...) out of the submission filenames, stores it as columns next to the binary index
+and turns search filters into boolean masks'''
+
+METADATA_DIR = "metadata"
+METADATA_MANIFEST_FILE = "metadata.json"
+
+# Category columns are stored as integer codes into a list of distinct values
+CATEGORY_COLUMNS = ("source", "docType", "course", "assignment", "term")
+VALUE_COLUMNS = {"late": np.bool_, "submissionId": np.int64, "wordCount": np.int32}
+MISSING_VALUES = {"late": False, "submissionId": -1, "wordCount": 0}
+
+# Canvas bulk downloads: <student>_[LATE_]<student id>_<submission id>_<original file name>
+SUBMISSION_PATTERN = re.compile(r"^(?P<student>[^_]+)_(?:(?P<late>LATE)_)?(?P<studentId>\d+)_(?P<submissionId>\d+)_(?P<title>.*)$")
+COURSE_PATTERN = re.compile(r"\b(?:soc|sociology)\s*-?\s*(\d{3})(?!\d)", re.IGNORECASE)
+TERM_PATTERN = re.compile(r"\b(fall|spring|summer|winter)[ _-]?((?:20)?\d{2})\b", re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r"(?<!\d)(\d{1,2})(?!\d)")
+ORDINALS = {"first": 1, "one": 1, "1st": 1, "second": 2, "two": 2, "2nd": 2, "third": 3, "three": 3, "3rd": 3}
+
+# Checked in order; the first matching kind wins
+ASSIGNMENT_KINDS = [
+    ("Synthesis Paper", re.compile(r"synth[ae]sis")),
+    ("Midterm Paper", re.compile(r"mid[ -]?term")),
+    ("Reflection Essay", re.compile(r"reflection")),
+    ("Final Paper", re.compile(r"final(?!ly)")),
+    ("Essay Brief", re.compile(r"\bbri?ei?f|\bessay|\besssay|\beb\b")),
+    ("Paper", re.compile(r"\bpaper\b")),
+]
+NUMBERED_KINDS = {"Synthesis Paper", "Reflection Essay", "Essay Brief", "Paper"}
+
+
+class FilterError(ValueError):
+    """Raised for a search filter on an unknown column or with an unusable value."""
+
+
+def parseAssignment(title: str) -> str:
+    """Normalizes a submission title, e.g. "Synthasis paper 3" -> "Synthesis Paper 3"."""
+    title = COURSE_PATTERN.sub(" ", title.lower().replace("_", " "))
+    title = re.sub(r"\(\d+\)|-\d+\s*$|\bcopy\b", " ", title) # "(1)", "-1" and "Copy" mark duplicate downloads
+    kind = next((name for name, pattern in ASSIGNMENT_KINDS if pattern.search(title)), "Other")
+    if kind not in NUMBERED_KINDS:
+        return kind
+
+    number = NUMBER_PATTERN.search(title)
+    if number is None:
+        ordinal = next((value for word, value in ORDINALS.items() if re.search(rf"\b{word}\b", title)), None)
+        return f"{kind} {ordinal}" if ordinal else kind
+    return f"{kind} {int(number.group(1))}"
+
+
+def parseTerm(source: str) -> str:
+    """Reads a term such as "Fall 2024" from the file's path, or "" when there is none."""
+    match = TERM_PATTERN.search(source)
+    if match is None:
+        return ""
+    year = match.group(2)
+    return f"{match.group(1).capitalize()} {year if len(year) == 4 else '20' + year}"
+
+
+def describeDocument(source: str, text: str) -> dict:
+    """Parses one document's metadata record from its path and extracted text."""
+    path = Path(source)
+    match = SUBMISSION_PATTERN.match(path.stem)
+    title = match.group("title") if match else path.stem
+    course = COURSE_PATTERN.search(f"{title} {source}")
+    return {
+        "source": str(source),
+        "docType": path.suffix.lower().lstrip("."),
+        "course": f"SOC {course.group(1)}" if course else "",
+        "assignment": parseAssignment(title),
+        "term": parseTerm(str(source)),
+        "late": bool(match and match.group("late")),
+        "submissionId": int(match.group("submissionId")) if match else -1,
+        "wordCount": len(text.split()),
+    }
+
+
+class MetadataColumns:
+    """Per-document metadata stored column by column.
+
+    Category columns (CATEGORY_COLUMNS) are integer codes plus the list of distinct
+    values, so a filter compares small integers rather than strings; the other
+    columns (VALUE_COLUMNS) are plain NumPy arrays. Row i describes document i.
+    """
+
+    def __init__(self, codes: dict, categories: dict, values: dict):
+        self.codes = codes
+        self.categories = categories
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values["wordCount"])
+
+    @classmethod
+    def fromRecords(cls, records: list) -> "MetadataColumns":
+        """Builds the columns from describeDocument records (None for a document without metadata)."""
+        codes, categories = {}, {}
+        for column in CATEGORY_COLUMNS:
+            distinct = {}
+            codes[column] = np.array([distinct.setdefault((record or {}).get(column, ""), len(distinct))
+                                      for record in records], dtype=np.int32)
+            categories[column] = list(distinct)
+        values = {column: np.array([(record or {}).get(column, MISSING_VALUES[column]) for record in records], dtype=dtype)
+                  for column, dtype in VALUE_COLUMNS.items()}
+        return cls(codes, categories, values)
+
+    def record(self, document: int) -> dict:
+        """Returns one document's metadata as a dictionary."""
+        record = {column: self.categories[column][self.codes[column][document]] for column in CATEGORY_COLUMNS}
+        record.update({column: self.values[column][document].item() for column in VALUE_COLUMNS})
+        return record
+
+    def records(self) -> list:
+        return [self.record(document) for document in range(len(self))]
+
+    def concatenate(self, records: list) -> "MetadataColumns":
+        """Returns the columns with more documents appended."""
+        return MetadataColumns.fromRecords(self.records() + list(records))
+
+    def take(self, documents: np.ndarray) -> "MetadataColumns":
+        """Returns the columns of the given documents only (used when the index is compacted)."""
+        return MetadataColumns(
+            {column: codes[documents] for column, codes in self.codes.items()},
+            dict(self.categories),
+            {column: values[documents] for column, values in self.values.items()},
+        )
+
+    def mask(self, filters: dict) -> np.ndarray:
+        """Returns the boolean mask of documents matching every filter.
+
+        A filter value is a single value or a list of accepted values, e.g.
+        {"assignment": ["Synthesis Paper 1", "Synthesis Paper 3"], "late": False}; numeric
+        columns also accept a range, e.g. {"wordCount": {"min": 500, "max": 3000}}.
+
+        Raises:
+            FilterError: If a column is unknown or a value has the wrong type.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for column, accepted in filters.items():
+            if column in self.codes:
+                accepted = accepted if isinstance(accepted, list) else [accepted]
+                if not all(isinstance(value, str) for value in accepted):
+                    raise FilterError(f"Filter '{column}' takes a string or a list of strings.")
+                wanted = [self.categories[column].index(value) for value in accepted if value in self.categories[column]]
+                mask &= np.isin(self.codes[column], wanted)
+            elif column in self.values:
+                values = self.values[column]
+                if isinstance(accepted, dict):
+                    if not set(accepted) <= {"min", "max"} or column == "late":
+                        raise FilterError(f"Filter '{column}' takes a value, a list of values or {{'min', 'max'}}.")
+                    if not all(isinstance(bound, (int, float)) and not isinstance(bound, bool) for bound in accepted.values()):
+                        raise FilterError(f"The 'min' and 'max' of filter '{column}' must be numbers.")
+                    if "min" in accepted:
+                        mask &= values >= accepted["min"]
+                    if "max" in accepted:
+                        mask &= values <= accepted["max"]
+                else:
+                    accepted = accepted if isinstance(accepted, list) else [accepted]
+                    if not all(isinstance(value, (bool, int, float)) for value in accepted):
+                        raise FilterError(f"Filter '{column}' takes numbers (or true/false).")
+                    mask &= np.isin(values, accepted)
+            else:
+                raise FilterError(f"Unknown filter '{column}'; available: {', '.join(CATEGORY_COLUMNS + tuple(VALUE_COLUMNS))}.")
+        return mask
+
+    def save(self, indexDir: Path) -> None:
+        """Writes one .npy file per column plus a manifest with the category values (in indexDir/metadata/)."""
+        metadataDir = indexDir / METADATA_DIR
+        metadataDir.mkdir(parents=True, exist_ok=True)
+        # Each file is renamed into place, so a server with the old columns memory-mapped keeps working
+        for column, array in list(self.codes.items()) + list(self.values.items()):
+            np.save(metadataDir / f"{column}.tmp.npy", array)
+            (metadataDir / f"{column}.tmp.npy").replace(metadataDir / f"{column}.npy")
+        temporaryPath = metadataDir / (METADATA_MANIFEST_FILE + ".tmp")
+        with open(temporaryPath, "w") as f:
+            json.dump({"count": len(self), "categories": self.categories}, f, separators=(",", ":"))
+        temporaryPath.replace(metadataDir / METADATA_MANIFEST_FILE)
+
+    @classmethod
+    def load(cls, indexDir: Path) -> "MetadataColumns":
+        """Opens the columns saved in indexDir/metadata/, or returns None if there are none."""
+        metadataDir = indexDir / METADATA_DIR
+        if not (metadataDir / METADATA_MANIFEST_FILE).exists():
+            return None
+
+        with open(metadataDir / METADATA_MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+        return cls(
+            {column: np.load(metadataDir / f"{column}.npy") for column in CATEGORY_COLUMNS},
+            manifest["categories"],
+            {column: np.load(metadataDir / f"{column}.npy") for column in VALUE_COLUMNS},
+        )
+
+
+def documentMetadata(narrativeData: list, documentCount: int, passageLevel: bool) -> list:
+    """Collects one metadata record per document from the rows' 'metadata' keys.
+
+    Returns:
+        A list of records (None where a document has none), or None if no row has metadata.
+    """
+    records = [None] * documentCount
+    for row, narrative in enumerate(narrativeData):
+        if narrative.get('metadata') is not None:
+            records[narrative['docId'] if passageLevel else row] = narrative['metadata']
+    return records if any(record is not None for record in records) else None
+
+
+def removeMetadata(indexDir: Path) -> None:
+    shutil.rmtree(indexDir / METADATA_DIR, ignore_errors=True)
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    from indexStore import loadBinaryIndex
+    from setup import extractDocuments, DOCUMENT_READERS
+
+    parser = argparse.ArgumentParser(description="Backfill the metadata columns of an existing index by matching document texts.")
+    parser.add_argument("folders", type=Path, nargs="+", help="Folders of the .docx/.pdf files the index was built from")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes")
+    args = parser.parse_args()
+
+    binaryIndex = loadBinaryIndex(args.index)
+    if binaryIndex is None:
+        raise SystemExit(1)
+    passageLevel = binaryIndex['manifest'].get('passageLevel', False)
+    documents = binaryIndex['documents'] if passageLevel else binaryIndex['texts']
+
+    def fingerprint(text):
+        return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+    files = [file for folder in args.folders for file in sorted(folder.rglob("*")) if file.suffix.lower() in DOCUMENT_READERS]
+    byFingerprint = {}
+    for source, text, _ in extractDocuments(files, maxWorkers=args.workers):
+        if text is not None:
+            byFingerprint.setdefault(fingerprint(text), describeDocument(source, text))
+
+    records = [byFingerprint.get(fingerprint(text)) for text in documents]
+    MetadataColumns.fromRecords(records).save(args.index)
+    matched = sum(record is not None for record in records)
+    print(f"✅ Wrote metadata for {len(records)} documents ({matched} matched to a file, {len(records) - matched} left blank).")
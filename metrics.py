@@ -0,0 +1,237 @@
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+import bisect
+import math
+import os
+import sys
+import threading
+import time
+
+'''This file holds HawkAI's instrumentation: Prometheus-style metrics rendered in the
+text exposition format, per-request timing spans and a sampling profiler'''
+
+# Request and stage latencies, in seconds (a cached answer takes milliseconds, generation tens of seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Prompt sizes, in characters
+PROMPT_SIZE_BUCKETS = (1000, 2500, 5000, 10000, 20000, 40000, 80000, 160000)
+
+
+def _formatLabels(labelNames: tuple, labelValues: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelNames, labelValues)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    # Label values escape backslashes, double quotes and newlines
+    escaped = (name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _formatValue(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base class: a named metric with a fixed set of label names and a lock."""
+    metricType = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelNames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelNames = tuple(labelNames)
+        self.lock = threading.Lock()
+
+    def _labelValues(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelNames):
+            raise ValueError(f"Metric '{self.name}' expects labels {self.labelNames}, got {tuple(labels)}.")
+        return tuple(str(labels[name]) for name in self.labelNames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metricType}"]
+        return lines + self._samples()
+
+
+class _ValueMetric(_Metric):
+    """A metric with one value per label set. With `function`, the values are read at scrape time.
+
+    `function` returns a number, or for a labelled metric a dict of {label tuple: number}.
+    """
+
+    def __init__(self, name: str, documentation: str, labelNames: tuple = (), function=None):
+        super().__init__(name, documentation, labelNames)
+        self.values = {}
+        self.function = function
+
+    def _samples(self) -> list:
+        if self.function is not None:
+            values = self.function()
+            values = values if isinstance(values, dict) else {(): values}
+        else:
+            with self.lock:
+                values = dict(self.values)
+        return [f"{self.name}{_formatLabels(self.labelNames, key)} {_formatValue(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Counter(_ValueMetric):
+    """A monotonically increasing count, optionally split by labels."""
+    metricType = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._labelValues(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(_ValueMetric):
+    """A value that can go up and down, optionally split by labels."""
+    metricType = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._labelValues(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    """Counts observations into cumulative buckets, plus their sum and count."""
+    metricType = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelNames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelNames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {} # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._labelValues(labels)
+        with self.lock:
+            series = self.series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def _samples(self) -> list:
+        lines = []
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_formatLabels(self.labelNames, key, {'le': _formatValue(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_formatLabels(self.labelNames, key)} {_formatValue(values[-1])}")
+            lines.append(f"{self.name}_count{_formatLabels(self.labelNames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text exposition format."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelNames: tuple = (), function=None) -> Counter:
+        return self.register(Counter(name, documentation, labelNames, function))
+
+    def gauge(self, name: str, documentation: str, labelNames: tuple = (), function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelNames, function))
+
+    def histogram(self, name: str, documentation: str, labelNames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelNames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """Times the stages of one request; every finished span is also observed in a histogram.
+
+    Usage:
+        trace = RequestTrace(stageHistogram)
+        with trace.span("embed"):
+            ...
+        trace.timings()  # {"embedMs": 12.3, ..., "totalMs": 15.0}
+    """
+
+    def __init__(self, stageHistogram: Histogram = None):
+        self.stageHistogram = stageHistogram
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.stageHistogram is not None:
+            self.stageHistogram.observe(seconds, stage=stage)
+
+    def timings(self) -> dict:
+        """Returns each stage's duration and the time since the trace started, in milliseconds."""
+        timings = {f"{stage}Ms": round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        timings["totalMs"] = round((time.perf_counter() - self.started) * 1000, 3)
+        return timings
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval while active.
+
+    Sampling (rather than cProfile's tracing) keeps the overhead low enough to switch
+    on for a single production request. The report lists the most frequent stacks in
+    the collapsed "outer;inner" format that flame-graph tools read.
+    """
+
+    def __init__(self, interval: float = 0.005, threadId: int = None):
+        """
+        Args:
+            interval: Seconds between samples.
+            threadId: The thread to sample (default: the thread that enters the profiler).
+        """
+        self.interval = interval
+        self.threadId = threadId
+        self.samples = StackCounter()
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.threadId = self.threadId or threading.get_ident()
+        self.thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopEvent.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def report(self, limit: int = 20) -> dict:
+        """Returns the sampling interval, the sample count and the `limit` most frequent stacks."""
+        return {
+            "intervalMs": self.interval * 1000,
+            "samples": sum(self.samples.values()),
+            "stacks": [{"stack": stack, "samples": count} for stack, count in self.samples.most_common(limit)],
+        }
@@ -1,11 +1,34 @@
 from pathlib import Path
-from google import genai
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import asyncio
+import hashlib
+import heapq
+import itertools
 import json
+import os
+import threading
+from indexStore import loadBinaryIndex, MANIFEST_FILE
+from shardedIndex import loadShardManifest, shardDirectory
+from annIndex import IVFIndex
+from compactIndex import CompactIndex
+from lexicalIndex import BM25Index
+from metadata import MetadataColumns, FilterError
+from chunking import buildExcerpt
+from textStore import TextStore
+from caches import QueryEmbeddingCache, ResponseCache
 
 '''This file takes the text & embedding text database, embedds the user query, 
 finds the most similar narrative, and generates output using gemini flash'''
 
+PASSAGE_OVERSAMPLE = 8 # Passages fetched per requested narrative before grouping by parent essay
+PASSAGES_PER_NARRATIVE = 3 # Top passages of one essay sent to the generator
+PASSAGE_CONTEXT_CHARS = 300 # Surrounding context kept on either side of each passage
+HYBRID_CANDIDATES = 50 # Rows taken from each of the vector and BM25 rankings before they are fused
+RRF_K = 60 # Reciprocal rank fusion constant: a row ranked r-th in a list scores 1 / (RRF_K + r)
+MMR_CANDIDATES = 200 # Candidates re-ranked for diversity when an MMR lambda is given
+SHARD_SEARCH_WORKERS = os.cpu_count() or 1 # Threads searching the shards of a sharded index at once
+
 # 1.
 def loadJSONIndexFromCache(cacheFile: Path) -> list:
     """Loads the search index from a JSON cache file.
@@ -31,17 +54,110 @@ def loadJSONIndexFromCache(cacheFile: Path) -> list:
 
     return searchIndex
 
+def loadSearchIndex(indexDir: Path, cacheFile: Path = None):
+    """Loads the search index, preferring the memory-mapped binary index.
+
+    Args:
+        indexDir: The binary index directory written by indexStore.writeBinaryIndex,
+                  or a sharded index directory (see shardedIndex.py).
+        cacheFile: An optional JSON cache to fall back to if no binary index exists.
+
+    Returns:
+        A SearchIndex (a ShardedSearchIndex for a sharded directory) ready for
+        querying, or None on failure.
+    """
+    try:
+        shardNames = loadShardManifest(indexDir)
+    except (ValueError, json.JSONDecodeError) as e:
+        print(f"❌ Error: The shard manifest in '{indexDir}' could not be read. {e}")
+        return None
+    if shardNames is not None:
+        return loadShardedSearchIndex(indexDir, shardNames)
+
+    if (indexDir / MANIFEST_FILE).exists():
+        loadedIndex = loadBinaryIndex(indexDir)
+    elif cacheFile is not None:
+        print(f"⚠️ Warning: No binary index found in '{indexDir}', falling back to '{cacheFile.name}'.")
+        loadedIndex = loadJSONIndexFromCache(cacheFile)
+    else:
+        print(f"❌ Error: No binary index found in '{indexDir}'.")
+        return None
+
+    if loadedIndex is None:
+        return None
+
+    try:
+        searchIndex = buildSearchIndex(loadedIndex)
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        return None
+
+    # Use the approximate index when one has been built next to the binary index
+    annIndex = IVFIndex.load(indexDir)
+    if annIndex is not None and len(annIndex.listRows) != len(searchIndex):
+        print(f"⚠️ Warning: The IVF index in '{indexDir}' is stale (rebuild it with annIndex.py), using exact search.")
+        annIndex = None
+    searchIndex.annIndex = annIndex
+
+    # Use the compact first-pass index (see compactIndex.py) when one has been built
+    compactIndex = CompactIndex.load(indexDir)
+    if compactIndex is not None and len(compactIndex) != len(searchIndex):
+        print(f"⚠️ Warning: The compact index in '{indexDir}' is stale (rebuild it with compactIndex.py), using exact search.")
+        compactIndex = None
+    searchIndex.compactIndex = compactIndex
+
+    # Use the BM25 index (see lexicalIndex.py) for hybrid search when one has been built
+    lexicalIndex = BM25Index.load(indexDir)
+    if lexicalIndex is not None and len(lexicalIndex) != len(searchIndex):
+        print(f"⚠️ Warning: The lexical index in '{indexDir}' is stale (rebuild it with lexicalIndex.py), using vector search only.")
+        lexicalIndex = None
+    searchIndex.lexicalIndex = lexicalIndex
+
+    # Per-document metadata columns for filtered search (see metadata.py)
+    metadata = MetadataColumns.load(indexDir)
+    documentCount = len(searchIndex.documents) if searchIndex.isPassageLevel else len(searchIndex)
+    if metadata is not None and len(metadata) != documentCount:
+        print(f"⚠️ Warning: The metadata in '{indexDir}' is stale (rebuild it with metadata.py), filters are disabled.")
+        metadata = None
+    searchIndex.metadata = metadata
+    return searchIndex
+
+def loadShardedSearchIndex(indexDir: Path, shardNames: list):
+    """Opens every shard listed in a sharded index's manifest (each with its own side indexes)."""
+    shards = []
+    for name in shardNames:
+        shard = loadSearchIndex(shardDirectory(indexDir, name))
+        if shard is None:
+            print(f"❌ Error: The shard '{name}' of '{indexDir}' could not be loaded.")
+            return None
+        shards.append(shard)
+
+    try:
+        return ShardedSearchIndex(shards, shardNames)
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        return None
+
 # 2.
-def embedUserQuery(userQuery: str, client) -> list:
+QUERY_EMBED_BATCH_SIZE = 100 # The embedding API accepts at most 100 contents per request
+
+def embedUserQuery(userQuery: str, client, cache: QueryEmbeddingCache = None) -> list:
     """Embeds a single user query string using the Gemini API.
 
     Args:
         userQuery: The string of text to embed.
         client: The initialized Gemini API client.
+        cache: An optional QueryEmbeddingCache consulted before (and filled after) the API call.
 
     Returns:
-        A list of floats representing the embedding vector for the query.
+        A list of floats (or a float32 array, when served from the cache)
+        representing the embedding vector for the query.
     """
+    if cache is not None:
+        cachedVector = cache.get(userQuery)
+        if cachedVector is not None:
+            return cachedVector
+
     finalQuery = "Experience of " + userQuery
 
     embed_query = client.models.embed_content(
@@ -51,76 +167,674 @@ def embedUserQuery(userQuery: str, client) -> list:
         # Contents are set to the user query
         contents= [finalQuery]
     )
-    return embed_query.embeddings[0].values
+    vector = embed_query.embeddings[0].values
+
+    if cache is not None:
+        cache.put(userQuery, vector)
+    return vector
+
+
+def embedUserQueries(userQueries: list, client, cache: QueryEmbeddingCache = None) -> list:
+    """Embeds several user queries with as few Gemini API calls as possible.
+
+    Args:
+        userQueries: The strings of text to embed.
+        client: The initialized Gemini API client.
+        cache: An optional QueryEmbeddingCache; only cache misses are sent to the API.
+
+    Returns:
+        A list of embedding vectors, one per query, in the same order.
+    """
+    vectors = [cache.get(userQuery) if cache is not None else None for userQuery in userQueries]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+    for start in range(0, len(missing), QUERY_EMBED_BATCH_SIZE):
+        batch = missing[start:start + QUERY_EMBED_BATCH_SIZE]
+        result = client.models.embed_content(
+            model="gemini-embedding-001",
+            contents=["Experience of " + userQueries[i] for i in batch]
+        )
+        for i, embedding in zip(batch, result.embeddings):
+            vectors[i] = embedding.values
+            if cache is not None:
+                cache.put(userQueries[i], embedding.values)
+
+    return vectors
+
+
+def prewarmQueryCache(cache: QueryEmbeddingCache, concepts: list, client) -> int:
+    """Embeds every concept not already in the cache, in bulk.
+
+    Returns:
+        The number of concepts that had to be embedded.
+    """
+    missing = list(dict.fromkeys(concept for concept in concepts if concept not in cache))
+    # Embedded without cache lookups so pre-warming does not count as misses
+    for concept, vector in zip(missing, embedUserQueries(missing, client)):
+        cache.put(concept, vector)
+    return len(missing)
+
+
+# 3.
+class SearchIndex:
+    """An in-memory search structure built once when the index is loaded.
+
+    Holds a contiguous, L2-normalized float32 matrix of narrative embeddings, a
+    validity mask for narratives with missing embeddings and the parallel texts (a
+    textStore.TextStore for a binary index, which decodes only the texts a query
+    returns), so a query is a single matrix-vector product plus argpartition.
+
+    When `annIndex` is set (see annIndex.IVFIndex) queries only score the rows of
+    the probed lists instead of the whole matrix. Otherwise, when `compactIndex` is
+    set (see compactIndex.CompactIndex) a first pass over the compact vectors picks
+    candidates that are then re-ranked with the full-precision rows. When
+    `lexicalIndex` is set (see lexicalIndex.BM25Index) hybridSearch also ranks the
+    rows by BM25 and fuses both rankings. `metadata` (see metadata.MetadataColumns)
+    holds per-document columns that filterMask turns into row masks.
+
+    In a passage-level index each row is a passage: `docIds` maps it to its parent
+    narrative in `documents` and `spans` holds its character offsets in that narrative.
+    """
+
+    def __init__(self, embeddings: np.ndarray, texts: list, valid: np.ndarray = None, normalized: bool = False):
+        """
+        Args:
+            embeddings: An (N, D) matrix of narrative embeddings (may be memory-mapped).
+            texts: The N narrative texts, in the same order as the rows (a list or a TextStore).
+            valid: An optional boolean mask of rows that hold a real embedding.
+            normalized: True if the rows are already float32 and L2-normalized, in
+                        which case the (possibly memory-mapped) matrix is used as is.
+        """
+        if normalized and embeddings.dtype == np.float32:
+            matrix = embeddings
+        else:
+            matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+            # A float32 memmap (e.g. an index written before rows were stored normalized)
+            # comes back as is and is read-only, so normalize a copy
+            if not matrix.flags.writeable or np.may_share_memory(matrix, embeddings):
+                matrix = np.array(matrix, dtype=np.float32, copy=True)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+
+        self.embeddings = matrix
+        self.texts = texts if isinstance(texts, TextStore) else np.array(texts, dtype=object)
+        self.valid = np.ones(len(texts), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+        # Only pay for masking on queries when some rows are actually invalid
+        self.hasInvalidRows = not self.valid.all()
+        self.annIndex = None
+        self.compactIndex = None
+        self.lexicalIndex = None
+        self.metadata = None
+        self.docIds = None
+        self.spans = None
+        self.documents = None
+
+    @property
+    def isPassageLevel(self) -> bool:
+        return self.docIds is not None
+
+    @classmethod
+    def fromJSONList(cls, narrativeData: list) -> "SearchIndex":
+        """Builds a SearchIndex from the list of dictionaries in a JSON cache."""
+        dimension = None
+        for narrative in narrativeData:
+            embedding = narrative.get('embedding')
+            if embedding is not None and isinstance(embedding, list):
+                dimension = len(embedding)
+                break
+        if dimension is None:
+            raise ValueError("No valid narrative embeddings found in the search index.")
+
+        embeddings = np.zeros((len(narrativeData), dimension), dtype=np.float32)
+        valid = np.zeros(len(narrativeData), dtype=bool)
+        for row, narrative in enumerate(narrativeData):
+            embedding = narrative.get('embedding')
+            # Check if the embedding exists AND is a list (a valid vector)
+            if embedding is not None and isinstance(embedding, list) and len(embedding) == dimension:
+                embeddings[row] = embedding
+                valid[row] = True
+
+        return cls(embeddings, [narrative.get('text', "") for narrative in narrativeData], valid)
+
+    @classmethod
+    def fromBinaryIndex(cls, binaryIndex: dict) -> "SearchIndex":
+        """Builds a SearchIndex from the dictionary returned by indexStore.loadBinaryIndex."""
+        searchIndex = cls(
+            binaryIndex['embeddings'],
+            binaryIndex['texts'],
+            binaryIndex['valid'],
+            normalized=binaryIndex['manifest'].get('normalized', False),
+        )
+        if binaryIndex['manifest'].get('passageLevel'):
+            searchIndex.docIds = binaryIndex['docIds']
+            searchIndex.spans = binaryIndex['spans']
+            searchIndex.documents = binaryIndex['documents']
+        return searchIndex
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1]
+
+    def _normalizeQueries(self, embeddedQueries) -> np.ndarray:
+        """Converts one query vector or a list of them to an L2-normalized float32 matrix."""
+        queries = np.atleast_2d(np.asarray(embeddedQueries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return queries / norms
+
+    def scores(self, embeddedQuery) -> np.ndarray:
+        """Returns the cosine similarity of the query to every row (invalid rows are -inf)."""
+        similarityScores = self.embeddings @ self._normalizeQueries(embeddedQuery)[0]
+        if self.hasInvalidRows:
+            similarityScores[~self.valid] = -np.inf
+        return similarityScores
+
+    def filterMask(self, filters: dict) -> np.ndarray:
+        """Returns the boolean mask of rows whose document matches every metadata filter.
+
+        Raises:
+            metadata.FilterError: If the index has no metadata or a filter is invalid.
+        """
+        if self.metadata is None:
+            raise FilterError("This index has no metadata columns to filter on.")
+        documentMask = self.metadata.mask(filters)
+        return documentMask[self.docIds] if self.isPassageLevel else documentMask
+
+    def _allowedRows(self, rowMask: np.ndarray = None) -> np.ndarray:
+        """The rows a query may return: valid rows within rowMask, or None when every row is allowed."""
+        if rowMask is None:
+            return self.valid if self.hasInvalidRows else None
+        return self.valid & rowMask
+
+    def search(self, embeddedQuery, k: int = 1, minScore: float = None, nprobe: int = None, exact: bool = False,
+               rerank: int = None, rowMask: np.ndarray = None):
+        """Returns the row numbers and scores of the k best narratives, best first.
+
+        Narratives scoring below minScore (if given) are dropped, so fewer than k
+        rows may be returned. If an ANN or compact index is attached it is used unless
+        exact is True; nprobe overrides the ANN index's number of probed lists and
+        rerank the compact index's number of re-ranked candidates. rowMask (see
+        filterMask) restricts the search to some rows before they are scored.
+        """
+        allowed = self._allowedRows(rowMask)
+        if (self.annIndex is not None or self.compactIndex is not None) and not exact:
+            query = self._normalizeQueries(embeddedQuery)[0]
+            if self.annIndex is not None:
+                candidates = self.annIndex.candidateRows(query, nprobe)
+                if allowed is not None:
+                    candidates = candidates[allowed[candidates]]
+            else:
+                candidates = self.compactIndex.candidateRows(query, max(k, rerank or self.compactIndex.rerankCount), allowed)
+                # Sorted rows read the memory-mapped matrix front to back
+                candidates = np.sort(candidates)
+            # Exact scores of the candidates only, from the full-precision rows
+            candidateScores = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query
+            rows, scores = _topK(candidateScores[np.newaxis, :], k, len(candidates))
+            return _applyMinScore(candidates[rows[0]], scores[0], minScore)
+
+        similarityScores = self.embeddings @ self._normalizeQueries(embeddedQuery)[0]
+        if allowed is not None:
+            similarityScores[~allowed] = -np.inf
+        rows, scores = _topK(similarityScores[np.newaxis, :], k, len(self) if allowed is None else int(allowed.sum()))
+        return _applyMinScore(rows[0], scores[0], minScore)
+
+    def searchBatch(self, embeddedQueries, k: int = 1, minScore: float = None, nprobe: int = None, exact: bool = False,
+                    rowMask: np.ndarray = None) -> list:
+        """Scores many queries with a single matrix-matrix product.
+
+        Args:
+            embeddedQueries: An (M, D) matrix (or list of M vectors) of query embeddings.
+            k: The number of narratives to return per query.
+            minScore: An optional minimum cosine similarity.
+            nprobe: Overrides the ANN index's number of probed lists.
+            exact: Forces brute-force search even if an ANN index is attached.
+            rowMask: An optional boolean mask of the rows to search (see filterMask).
+
+        Returns:
+            A list of M (rows, scores) tuples, each ordered best first.
+        """
+        if (self.annIndex is not None or self.compactIndex is not None) and not exact:
+            # Each query has its own candidates, so the approximate path goes one query at a time
+            return [self.search(query, k=k, minScore=minScore, nprobe=nprobe, rowMask=rowMask)
+                    for query in self._normalizeQueries(embeddedQueries)]
+
+        allowed = self._allowedRows(rowMask)
+        similarityScores = self._normalizeQueries(embeddedQueries) @ self.embeddings.T
+        if allowed is not None:
+            similarityScores[:, ~allowed] = -np.inf
+
+        rows, scores = _topK(similarityScores, k, len(self) if allowed is None else int(allowed.sum()))
+        return [_applyMinScore(queryRows, queryScores, minScore) for queryRows, queryScores in zip(rows, scores)]
+
+    def hybridSearch(self, embeddedQuery, queryText: str, k: int = 1, minScore: float = None, nprobe: int = None,
+                     exact: bool = False, rowMask: np.ndarray = None):
+        """Fuses the vector ranking with the BM25 ranking of queryText (reciprocal rank fusion).
+
+        Returns the row numbers ordered by fused rank, with their cosine similarity as
+        the score. minScore only filters the vector ranking, so a row that matches an
+        exact name ("Goffman") is kept even when its embedding is a weak match. Without
+        a lexical index this is the same as search.
+        """
+        if self.lexicalIndex is None:
+            return self.search(embeddedQuery, k=k, minScore=minScore, nprobe=nprobe, exact=exact, rowMask=rowMask)
+
+        candidateCount = max(k, HYBRID_CANDIDATES)
+        vectorRows, _ = self.search(embeddedQuery, k=candidateCount, minScore=minScore, nprobe=nprobe, exact=exact,
+                                    rowMask=rowMask)
+        lexicalRows, _ = self.lexicalIndex.search(queryText, candidateCount, self._allowedRows(rowMask))
+        rows = _reciprocalRankFusion([vectorRows, lexicalRows], k)
+
+        query = self._normalizeQueries(embeddedQuery)[0]
+        return rows, np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+
+
+_shardSearchPools = {} # maxWorkers -> the ThreadPoolExecutor every ShardedSearchIndex of this process shares
+_shardSearchPoolsPid = None
+_shardSearchPoolsLock = threading.Lock()
+
+
+def _shardSearchPool(maxWorkers: int) -> ThreadPoolExecutor:
+    """Returns the process-wide pool for searching shards with `maxWorkers` threads.
+
+    The pools belong to the process rather than to an index, so a hot reload (which
+    builds a new ShardedSearchIndex while requests may still be using the old one)
+    neither leaks a pool nor has to shut down one that is still in use.
+    """
+    global _shardSearchPoolsPid
+    with _shardSearchPoolsLock:
+        # A pool inherited through fork (gunicorn preload) has no threads, so each process makes its own
+        if _shardSearchPoolsPid != os.getpid():
+            _shardSearchPools.clear()
+            _shardSearchPoolsPid = os.getpid()
+        pool = _shardSearchPools.get(maxWorkers)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="shard-search")
+            _shardSearchPools[maxWorkers] = pool
+        return pool
+
+
+class ShardedSearchIndex(SearchIndex):
+    """A SearchIndex over several shards, each an independent binary index (see shardedIndex.py).
+
+    A query is searched in every shard at once on a thread pool (NumPy's BLAS
+    releases the GIL while it multiplies) and the per-shard top-k lists are merged
+    with a heap. Rows are numbered across the shards in manifest order, so results
+    look the same as from one SearchIndex. Each shard keeps its own ANN, compact,
+    lexical and metadata indexes; validity, metadata and passage spans are small
+    and concatenated at load time, while embedding rows and texts are read from the
+    shards only when needed (see _ShardedRows and _ShardedSequence).
+    """
+
+    def __init__(self, shards: list, names: list = None, maxWorkers: int = None):
+        """
+        Args:
+            shards: The SearchIndex of each shard, in manifest order.
+            names: The shard names (for messages).
+            maxWorkers: Threads searching shards at once (default SHARD_SEARCH_WORKERS).
+
+        Raises:
+            ValueError: If there are no shards or they disagree on dimension or passage level.
+        """
+        if not shards:
+            raise ValueError("A sharded index needs at least one shard.")
+        if len({shard.dimension for shard in shards}) > 1:
+            raise ValueError(f"The shards have different embedding dimensions: {[shard.dimension for shard in shards]}.")
+        if len({shard.isPassageLevel for shard in shards}) > 1:
+            raise ValueError("Passage-level and narrative-level shards cannot be mixed.")
+
+        self.shards = shards
+        self.names = names or [str(i) for i in range(len(shards))]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in shards])
+        self.maxWorkers = min(len(shards), maxWorkers or SHARD_SEARCH_WORKERS)
+
+        # The same attributes as SearchIndex, numbered across the shards
+        self.embeddings = _ShardedRows([shard.embeddings for shard in shards], self.offsets)
+        self.texts = _ShardedSequence([shard.texts for shard in shards], self.offsets)
+        self.valid = np.concatenate([shard.valid for shard in shards])
+        self.hasInvalidRows = not self.valid.all()
+        self.annIndex = None # ANN and compact indexes are used inside each shard
+        self.compactIndex = None
+        self.lexicalIndex = None
+        if all(shard.lexicalIndex is not None for shard in shards):
+            self.lexicalIndex = _ShardedLexicalIndex([shard.lexicalIndex for shard in shards], self.offsets)
+
+        self.docIds = self.spans = self.documents = None
+        if shards[0].isPassageLevel:
+            documentOffsets = np.cumsum([0] + [len(shard.documents) for shard in shards])
+            self.docIds = np.concatenate([shard.docIds + offset for shard, offset in zip(shards, documentOffsets)])
+            self.spans = np.concatenate([shard.spans for shard in shards])
+            self.documents = _ShardedSequence([shard.documents for shard in shards], documentOffsets)
+
+        self.metadata = None
+        if any(shard.metadata is not None for shard in shards):
+            records = []
+            for shard in shards:
+                documentCount = len(shard.documents) if shard.isPassageLevel else len(shard)
+                records += shard.metadata.records() if shard.metadata is not None else [None] * documentCount
+            self.metadata = MetadataColumns.fromRecords(records)
+
+    def _mapShards(self, searchShard) -> list:
+        """Calls searchShard(shard, start, end) for every shard on the thread pool; results are in shard order."""
+        tasks = [(shard, int(start), int(end)) for shard, start, end in zip(self.shards, self.offsets, self.offsets[1:])]
+        if self.maxWorkers <= 1:
+            return [searchShard(*task) for task in tasks]
+        return list(_shardSearchPool(self.maxWorkers).map(lambda task: searchShard(*task), tasks))
+
+    def scores(self, embeddedQuery) -> np.ndarray:
+        return np.concatenate(self._mapShards(lambda shard, start, end: shard.scores(embeddedQuery)))
+
+    def search(self, embeddedQuery, k: int = 1, minScore: float = None, nprobe: int = None, exact: bool = False,
+               rerank: int = None, rowMask: np.ndarray = None):
+        """Searches every shard for its top k (see SearchIndex.search) and merges them."""
+        query = self._normalizeQueries(embeddedQuery)[0]
+        rankings = self._mapShards(lambda shard, start, end: shard.search(
+            query, k=k, minScore=minScore, nprobe=nprobe, exact=exact, rerank=rerank,
+            rowMask=rowMask[start:end] if rowMask is not None else None))
+        return _mergeTopK(rankings, self.offsets, k)
+
+    def searchBatch(self, embeddedQueries, k: int = 1, minScore: float = None, nprobe: int = None, exact: bool = False,
+                    rowMask: np.ndarray = None) -> list:
+        """Runs one batched search per shard (see SearchIndex.searchBatch) and merges each query's results."""
+        queries = self._normalizeQueries(embeddedQueries)
+        shardRankings = self._mapShards(lambda shard, start, end: shard.searchBatch(
+            queries, k=k, minScore=minScore, nprobe=nprobe, exact=exact,
+            rowMask=rowMask[start:end] if rowMask is not None else None))
+        return [_mergeTopK([rankings[query] for rankings in shardRankings], self.offsets, k)
+                for query in range(len(queries))]
+
+
+class _ShardedRows:
+    """The shards' embedding matrices seen as one (N, D) matrix indexed by row number.
+
+    Supports a single row or an array of rows, gathered from each shard's (memory-
+    mapped) matrix, so no embedding is copied when the index is opened.
+    """
+
+    def __init__(self, matrices: list, offsets: np.ndarray):
+        self.matrices = matrices
+        self.offsets = offsets
+        self.shape = (int(offsets[-1]), matrices[0].shape[1])
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(matrix.nbytes for matrix in self.matrices)
+
+    def __getitem__(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        shardOf = np.searchsorted(self.offsets, rows, side="right") - 1
+        if rows.ndim == 0:
+            return np.asarray(self.matrices[shardOf][rows - self.offsets[shardOf]], dtype=np.float32)
+
+        gathered = np.empty((len(rows), self.shape[1]), dtype=np.float32)
+        for shard in np.unique(shardOf):
+            selected = shardOf == shard
+            gathered[selected] = self.matrices[shard][rows[selected] - self.offsets[shard]]
+        return gathered
+
+
+class _ShardedSequence:
+    """The shards' texts (or passage documents) seen as one sequence indexed by row number."""
+
+    def __init__(self, sequences: list, offsets: np.ndarray):
+        self.sequences = sequences
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __getitem__(self, row):
+        row = int(row)
+        shard = int(np.searchsorted(self.offsets, row, side="right")) - 1
+        return self.sequences[shard][row - self.offsets[shard]]
+
+    def __iter__(self):
+        for sequence in self.sequences:
+            yield from sequence
+
+
+class _ShardedLexicalIndex:
+    """Searches each shard's BM25 index and merges the rankings.
 
+    BM25 statistics (document frequencies, average length) are per shard, so scores
+    from different shards are close to, but not exactly, those of a single index.
+    """
+
+    def __init__(self, lexicalIndexes: list, offsets: np.ndarray):
+        self.lexicalIndexes = lexicalIndexes
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def search(self, query: str, k: int = 10, valid: np.ndarray = None) -> tuple:
+        rankings = [lexicalIndex.search(query, k, valid[start:end] if valid is not None else None)
+                    for lexicalIndex, start, end in zip(self.lexicalIndexes, self.offsets, self.offsets[1:])]
+        return _mergeTopK(rankings, self.offsets, k)
+
+
+def _mergeTopK(rankings: list, offsets: np.ndarray, k: int) -> tuple:
+    """Merges per-shard best-first (rows, scores) lists into the overall top k with a heap.
+
+    Shard rows are shifted by their shard's offset; equal scores go to the lower row.
+    """
+    merged = heapq.merge(*[zip((-np.asarray(scores, dtype=np.float64)).tolist(), (rows + offset).tolist())
+                           for (rows, scores), offset in zip(rankings, offsets)])
+    best = list(itertools.islice(merged, k))
+    return (np.array([row for _, row in best], dtype=np.int64),
+            np.array([-score for score, _ in best], dtype=np.float32))
+
+
+def _reciprocalRankFusion(rankings: list, k: int) -> np.ndarray:
+    """Merges several best-first row rankings into the top-k rows by summed 1 / (RRF_K + rank)."""
+    rows = np.concatenate(rankings).astype(np.int64)
+    if not len(rows):
+        return rows
+    contributions = np.concatenate([1.0 / (RRF_K + 1 + np.arange(len(ranking))) for ranking in rankings])
+    uniqueRows, inverse = np.unique(rows, return_inverse=True)
+    fusedScores = np.bincount(inverse, weights=contributions)
+    return uniqueRows[np.argsort(-fusedScores, kind="stable")[:k]]
+
+
+def _maximalMarginalRelevance(searchIndex: SearchIndex, rows: np.ndarray, scores: np.ndarray, k: int,
+                              mmrLambda: float) -> tuple:
+    """Picks k diverse rows from ranked candidates by maximal marginal relevance.
+
+    Each pick maximizes mmrLambda * similarity to the query - (1 - mmrLambda) * the
+    highest similarity to an already picked row; 1.0 is plain relevance order, lower
+    values push near-identical essays apart. The candidate-candidate similarities are
+    one (N, N) product of the normalized rows, so N=200 costs about a millisecond.
+    """
+    k = min(k, len(rows))
+    if k <= 1 or mmrLambda >= 1.0:
+        return rows[:k], scores[:k]
 
-# In runtime.py
+    vectors = np.asarray(searchIndex.embeddings[rows], dtype=np.float32)
+    similarity = vectors @ vectors.T
+    relevance = mmrLambda * np.asarray(scores, dtype=np.float32)
+    redundancy = np.zeros(len(rows), dtype=np.float32) # Highest similarity to a picked row
+    available = np.ones(len(rows), dtype=bool)
+    picked = []
+    for _ in range(k):
+        marginal = np.where(available, relevance - (1.0 - mmrLambda) * redundancy, -np.inf)
+        best = int(np.argmax(marginal))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return rows[picked], scores[picked]
 
-def findNarrativeUsingDotProduct(embeddedQuery: list, searchIndex: list): # Note: No -> str return type
+
+def _topK(similarityScores: np.ndarray, k: int, validCount: int):
+    """Returns the top-k (rows, scores) of each row of an (M, N) score matrix, best first."""
+    k = min(k, validCount)
+    queryCount, narrativeCount = similarityScores.shape
+    if k <= 0:
+        return np.empty((queryCount, 0), dtype=np.int64), np.empty((queryCount, 0), dtype=np.float32)
+
+    if k < narrativeCount:
+        candidates = np.argpartition(-similarityScores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(narrativeCount), (queryCount, narrativeCount))
+    candidateScores = np.take_along_axis(similarityScores, candidates, axis=1)
+    order = np.argsort(-candidateScores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidateScores, order, axis=1)
+
+
+def _applyMinScore(rows: np.ndarray, scores: np.ndarray, minScore: float):
+    """Drops results below minScore; the inputs are sorted best first."""
+    if minScore is None:
+        return rows, scores
+    keep = scores >= minScore
+    return rows[keep], scores[keep]
+
+
+def buildSearchIndex(searchIndex) -> SearchIndex:
+    """Wraps a loaded index (binary dictionary or JSON list) in a SearchIndex."""
+    if isinstance(searchIndex, SearchIndex):
+        return searchIndex
+    if isinstance(searchIndex, dict):
+        return SearchIndex.fromBinaryIndex(searchIndex)
+    return SearchIndex.fromJSONList(searchIndex)
+
+
+def findNarrativeUsingDotProduct(embeddedQuery: list, searchIndex: SearchIndex, queryText: str = None): # Note: No -> str return type
     """
     Finds the most relevant narrative and its similarity score.
-    Filters out narratives with missing or invalid embeddings.
+    Narratives with missing or invalid embeddings are masked out.
 
     Args:
         embeddedQuery: A list of floats representing the query vector.
-        searchIndex: A list of dictionaries, where each dict *should* contain
-                     a narrative's text and its corresponding 'embedding' vector.
+        searchIndex: The SearchIndex returned by loadSearchIndex. A raw JSON list of
+                     dictionaries is still accepted, but is converted on every call.
+        queryText: The query string, for hybrid (BM25 + vector) search.
 
     Returns:
         A tuple of (narrative_text, score) on success.
         A tuple of (error_string, None) on failure.
     """
 
-    # 1. Extract all the narrative embeddings from the search index
-    narrativeEmbeddings = []
-    originalTexts = [] # Keep a parallel list of the text
-
-    for narrative in searchIndex:
-        embedding = narrative.get('embedding')
-        # Check if the embedding exists AND is a list (a valid vector)
-        if embedding is not None and isinstance(embedding, list):
-            narrativeEmbeddings.append(embedding)
-            originalTexts.append(narrative['text'])
-
-    if not narrativeEmbeddings:
-        return "Error: No valid narrative embeddings found in the search index.", None
-
-    # 2. Use numpy's dot product to calculate all similarity scores at once.
+    # 1. Make sure we have a preloaded search matrix
     try:
-        similarityScores = np.dot(embeddedQuery, np.transpose(narrativeEmbeddings))
+        searchIndex = buildSearchIndex(searchIndex)
     except ValueError as e:
-        return f"Error: Dot product failed. Check embedding dimensions. {e}", None
-
-    # 3. Find the index (position) of the highest score.
-    bestNarrativeIndex = np.argmax(similarityScores)
+        return f"Error: {e}", None
 
-    # 4. Get the actual score value from that index.
-    bestScore = similarityScores[bestNarrativeIndex]
+    if len(embeddedQuery) != searchIndex.dimension:
+        return f"Error: Dot product failed. Query has dimension {len(embeddedQuery)}, index has {searchIndex.dimension}.", None
 
-    # 5. Use that index to get the corresponding text.
-    bestNarrativeText = originalTexts[bestNarrativeIndex]
+    # 2. One matrix-vector product scores every narrative (or passage) at once.
+    narratives = findTopNarratives([embeddedQuery], searchIndex, k=1,
+                                   queryTexts=[queryText] if queryText is not None else None)[0]
+    if not narratives:
+        return "Error: No valid narrative embeddings found in the search index.", None
 
-    # 6. Return BOTH the text and the score as a tuple.
-    return bestNarrativeText, bestScore
+    # 3. Return BOTH the text and the score as a tuple.
+    return narratives[0]['text'], narratives[0]['score']
 
 
-#4. Construct output
-def generateFinalOutput(userConcept: str, narrativeText: str, client) -> str:
+def findTopNarratives(embeddedQueries, searchIndex: SearchIndex, k: int = 5, minScore: float = None,
+                      queryTexts: list = None, mmrLambda: float = None, filters: dict = None) -> list:
     """
-    Generates a structured final response using a generative LLM.
+    Finds the top-k narratives for one or many queries in a single matrix product.
+
+    For a passage-level index the best passages are grouped by parent narrative and
+    each narrative's text is an excerpt of its top passages with a little context.
 
     Args:
-        userConcept: The sociological concept the user asked about.
-        narrativeText: The full text of the most relevant narrative.
-        client: The initialized Gemini API client.
+        embeddedQueries: A list of query vectors (an (M, D) matrix).
+        searchIndex: The SearchIndex returned by loadSearchIndex.
+        k: The maximum number of narratives to return per query.
+        minScore: An optional minimum similarity; weaker narratives are dropped.
+        queryTexts: The M query strings. When given and the index has a lexical index,
+                    each query is a hybrid (BM25 + vector) search, see SearchIndex.hybridSearch.
+        mmrLambda: When given (0 to 1), the top MMR_CANDIDATES rows are re-ranked for
+                   diversity by maximal marginal relevance; lower values favour diversity.
+        filters: Metadata filters, e.g. {"assignment": "Synthesis Paper 3", "late": False}
+                 (see metadata.MetadataColumns.mask). They become a row mask applied
+                 before scoring, so a filtered query costs the same as an unfiltered one.
 
     Returns:
-        A formatted string containing the Quote, Summary, and Concept,
-        or an error message.
+        A list with one entry per query, each a list of dictionaries with
+        'row', 'docId', 'text' and 'score' keys ordered best first (plus 'metadata'
+        when the index has metadata columns).
+
+    Raises:
+        ValueError: If the query dimension does not match the index.
+        metadata.FilterError: If a filter is invalid or the index has no metadata.
     """
-    
-    # 1. Construct the detailed prompt for the LLM.
-    prompt = f"""
+    searchIndex = buildSearchIndex(searchIndex)
+    queries = np.atleast_2d(np.asarray(embeddedQueries, dtype=np.float32))
+    if queries.shape[1] != searchIndex.dimension:
+        raise ValueError(f"Query has dimension {queries.shape[1]}, index has {searchIndex.dimension}.")
+
+    rowCount = k * PASSAGE_OVERSAMPLE if searchIndex.isPassageLevel else k
+    candidateCount = max(rowCount, MMR_CANDIDATES) if mmrLambda is not None else rowCount
+    rowMask = searchIndex.filterMask(filters) if filters else None
+    if queryTexts is not None and searchIndex.lexicalIndex is not None:
+        rankings = [searchIndex.hybridSearch(query, queryText, k=candidateCount, minScore=minScore, rowMask=rowMask)
+                    for query, queryText in zip(queries, queryTexts)]
+    else:
+        rankings = searchIndex.searchBatch(queries, k=candidateCount, minScore=minScore, rowMask=rowMask)
+
+    if mmrLambda is not None:
+        rankings = [_maximalMarginalRelevance(searchIndex, rows, scores, rowCount, mmrLambda) for rows, scores in rankings]
+
+    if searchIndex.isPassageLevel:
+        return [_collapsePassages(searchIndex, rows, scores, k) for rows, scores in rankings]
+
+    results = []
+    for rows, scores in rankings:
+        results.append([
+            _withMetadata(searchIndex, {'row': int(row), 'docId': int(row), 'text': searchIndex.texts[row], 'score': float(score)})
+            for row, score in zip(rows, scores)
+        ])
+    return results
+
+
+def _withMetadata(searchIndex: SearchIndex, narrative: dict) -> dict:
+    """Adds the narrative's metadata record (source file, assignment, ...) when the index has one."""
+    if searchIndex.metadata is not None:
+        narrative['metadata'] = searchIndex.metadata.record(narrative['docId'])
+    return narrative
+
+
+def _collapsePassages(searchIndex: SearchIndex, rows: np.ndarray, scores: np.ndarray, k: int) -> list:
+    """Groups ranked passages by parent narrative and builds one excerpt per narrative."""
+    grouped = {} # docId -> list of (row, score), in rank order (dicts keep insertion order)
+    for row, score in zip(rows, scores):
+        docId = int(searchIndex.docIds[row])
+        if docId not in grouped:
+            if len(grouped) == k:
+                continue
+            grouped[docId] = []
+        if len(grouped[docId]) < PASSAGES_PER_NARRATIVE:
+            grouped[docId].append((int(row), float(score)))
+
+    narratives = []
+    for docId, passages in grouped.items():
+        spans = [tuple(searchIndex.spans[row]) for row, _ in passages]
+        narratives.append(_withMetadata(searchIndex, {
+            'row': passages[0][0],
+            'docId': docId,
+            'text': buildExcerpt(searchIndex.documents[docId], spans, PASSAGE_CONTEXT_CHARS),
+            'score': passages[0][1],
+        }))
+    return narratives
+
+
+#4. Construct output
+GENERATION_MODEL = "gemini-2.5-pro"
+GENERATION_ERROR_MESSAGE = "Sorry, an error occurred while generating the response."
+
+# The prompt sent to the generative model; {userConcept} and {narrativeText} are filled in per request.
+PROMPT_TEMPLATE = """
     You are a helpful sociological assistant. Your task is to explain a concept using a relevant personal story.
 
     The user wants to understand this sociological concept:
@@ -128,7 +842,7 @@ def generateFinalOutput(userConcept: str, narrativeText: str, client) -> str:
     {userConcept}
     ---
 
-    Here is a relevant personal narrative that illustrates this concept:
+    Here is a relevant personal narrative (or excerpts from one) that illustrates this concept:
     ---
     {narrativeText}
     ---
@@ -148,19 +862,200 @@ def generateFinalOutput(userConcept: str, narrativeText: str, client) -> str:
     * Bullet 2: Continue the academic description, elaborating on the concept.
     * Bullet 3: Begin to analyze the **Quote from Student Narrative** (the quote you selected in the first step) using the concept.
     * Bullet 4: Continue the analysis, explaining how the concept helps to understand the author's experience in the quote.
-    """ 
+    """
+
+# Changes whenever the template text changes, so cached responses for an old prompt are never reused
+PROMPT_VERSION = hashlib.sha256(PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+
+
+def buildPrompt(userConcept: str, narrativeText: str) -> str:
+    """Fills the prompt template with the concept and narrative."""
+    return PROMPT_TEMPLATE.format(userConcept=userConcept, narrativeText=narrativeText)
+
 
+def _recordUsage(usage: dict, prompt: str, response) -> None:
+    """Fills `usage` with the prompt size and the token counts the API reported (if any)."""
+    if usage is None:
+        return
+    usage['promptChars'] = len(prompt)
+    usageMetadata = getattr(response, "usage_metadata", None)
+    if usageMetadata is not None:
+        usage['promptTokens'] = usageMetadata.prompt_token_count or 0
+        usage['outputTokens'] = usageMetadata.candidates_token_count or 0
+
+
+def _callGenerativeModel(prompt: str, client, usage: dict = None) -> tuple:
+    """Calls the generative model, returning (text, succeeded) instead of raising."""
     try:
-        # 2. Call the generative model.
         response = client.models.generate_content(
-            model="gemini-2.5-pro",
+            model=GENERATION_MODEL,
             contents=prompt
         )
-        
-        # 3. Return the clean text from the response.
-        return response.text
-        
+        _recordUsage(usage, prompt, response)
+        return response.text, True
+
     except Exception as e:
         # Handle potential API errors
         print(f"❌ An error occurred during AI generation: {e}")
-        return "Sorry, an error occurred while generating the response."
\ No newline at end of file
+        return GENERATION_ERROR_MESSAGE, False
+
+
+def generateFinalOutput(userConcept: str, narrativeText: str, client) -> str:
+    """
+    Generates a structured final response using a generative LLM.
+
+    Args:
+        userConcept: The sociological concept the user asked about.
+        narrativeText: The text of the most relevant narrative, or excerpts of it
+                       from a passage-level index.
+        client: The initialized Gemini API client.
+
+    Returns:
+        A formatted string containing the Quote, Summary, and Concept,
+        or an error message.
+    """
+    # 1. Construct the detailed prompt for the LLM, 2. call the generative model
+    # and 3. return the clean text from the response.
+    text, _ = _callGenerativeModel(buildPrompt(userConcept, narrativeText), client)
+    return text
+
+
+def generateFinalOutputCached(userConcept: str, narrativeText: str, client, cache: ResponseCache,
+                              usage: dict = None) -> tuple:
+    """
+    Like generateFinalOutput, but answers repeat (concept, narrative) pairs from a ResponseCache.
+
+    The cache key combines the normalized concept, a fingerprint of the narrative text,
+    PROMPT_VERSION and GENERATION_MODEL, so editing the prompt or switching models
+    never serves a stale answer. Error messages are not cached.
+
+    If a `usage` dict is given and the model is called, it receives 'promptChars',
+    'promptTokens' and 'outputTokens'.
+
+    Returns:
+        A tuple of (output_text, cache_hit).
+    """
+    key = ResponseCache.makeKey(userConcept, narrativeText, PROMPT_VERSION, GENERATION_MODEL)
+    cachedText = cache.get(key)
+    if cachedText is not None:
+        return cachedText, True
+
+    text, succeeded = _callGenerativeModel(buildPrompt(userConcept, narrativeText), client, usage)
+    if succeeded:
+        cache.put(key, text)
+    return text, False
+
+
+def streamFinalOutput(userConcept: str, narrativeText: str, client, cache: ResponseCache = None, usage: dict = None):
+    """
+    Streams the structured final response chunk by chunk as the model produces it.
+
+    A cached answer (if a ResponseCache is given) is yielded in one piece; a freshly
+    streamed answer is stored in the cache once it completes without error. A `usage`
+    dict is filled as in generateFinalOutputCached as the chunks arrive, so it also
+    counts a stream that fails part way.
+
+    API errors are raised rather than yielded as GENERATION_ERROR_MESSAGE, so the
+    server can end the stream with an error event instead of a chunk of answer text.
+
+    Yields:
+        Text chunks.
+    """
+    key = None
+    if cache is not None:
+        key = ResponseCache.makeKey(userConcept, narrativeText, PROMPT_VERSION, GENERATION_MODEL)
+        cachedText = cache.get(key)
+        if cachedText is not None:
+            yield cachedText
+            return
+
+    chunks = []
+    prompt = buildPrompt(userConcept, narrativeText)
+    for chunk in client.models.generate_content_stream(
+        model=GENERATION_MODEL,
+        contents=prompt
+    ):
+        # Token counts arrive with the stream; the last chunk carries the totals
+        _recordUsage(usage, prompt, chunk)
+        if chunk.text:
+            chunks.append(chunk.text)
+            yield chunk.text
+
+    if cache is not None:
+        cache.put(key, "".join(chunks))
+
+
+#5. Async variants (used by asyncApp.py)
+# The caches are SQLite-backed, so their lookups and writes run on a worker thread
+# (asyncio.to_thread) instead of blocking the event loop
+async def embedUserQueryAsync(userQuery: str, client, cache: QueryEmbeddingCache = None) -> list:
+    """Like embedUserQuery, but awaits the embedding call through client.aio."""
+    if cache is not None:
+        cachedVector = await asyncio.to_thread(cache.get, userQuery)
+        if cachedVector is not None:
+            return cachedVector
+
+    response = await client.aio.models.embed_content(
+        model="gemini-embedding-001",
+        contents=["Experience of " + userQuery]
+    )
+    vector = response.embeddings[0].values
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, userQuery, vector)
+    return vector
+
+
+async def generateFinalOutputAsync(userConcept: str, narrativeText: str, client, cache: ResponseCache = None,
+                                   usage: dict = None) -> tuple:
+    """
+    Like generateFinalOutputCached (including `usage`), but awaits the generation call through client.aio.
+
+    API errors are raised rather than turned into GENERATION_ERROR_MESSAGE, so the
+    server can tell an upstream rate limit (which it answers with 429) from a bad answer.
+
+    Returns:
+        A tuple of (output_text, cache_hit).
+    """
+    key = ResponseCache.makeKey(userConcept, narrativeText, PROMPT_VERSION, GENERATION_MODEL)
+    if cache is not None:
+        cachedText = await asyncio.to_thread(cache.get, key)
+        if cachedText is not None:
+            return cachedText, True
+
+    prompt = buildPrompt(userConcept, narrativeText)
+    response = await client.aio.models.generate_content(
+        model=GENERATION_MODEL,
+        contents=prompt
+    )
+    _recordUsage(usage, prompt, response)
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, response.text)
+    return response.text, False
+
+
+async def streamFinalOutputAsync(userConcept: str, narrativeText: str, client, cache: ResponseCache = None,
+                                 usage: dict = None):
+    """Like streamFinalOutput (errors are raised too), but an async generator reading client.aio's stream."""
+    key = None
+    if cache is not None:
+        key = ResponseCache.makeKey(userConcept, narrativeText, PROMPT_VERSION, GENERATION_MODEL)
+        cachedText = await asyncio.to_thread(cache.get, key)
+        if cachedText is not None:
+            yield cachedText
+            return
+
+    chunks = []
+    prompt = buildPrompt(userConcept, narrativeText)
+    stream = await client.aio.models.generate_content_stream(
+        model=GENERATION_MODEL,
+        contents=prompt
+    )
+    async for chunk in stream:
+        _recordUsage(usage, prompt, chunk)
+        if chunk.text:
+            chunks.append(chunk.text)
+            yield chunk.text
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, "".join(chunks))
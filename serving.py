@@ -0,0 +1,68 @@
+from pathlib import Path
+import json
+
+'''Settings and request helpers shared by app.py (Flask) and asyncApp.py (Quart), so
+both servers read the same files and accept the same request bodies. Only the
+standard library is imported here, so main.py can use it without slowing its start'''
+
+INDEX_DIR = Path("./embeddingIndex") # Path to the binary index (see convertCache.py)
+CACHE_FILE = Path("./embeddingDatabase.json") # Fallback JSON cache
+MAX_K = 50 # Largest number of narratives a single query may ask for
+QUERY_CACHE_FILE = Path("./queryCache.sqlite") # Persisted query embeddings (survives restarts)
+RESPONSE_CACHE_FILE = Path("./responseCache.sqlite") # Generated answers keyed by (concept, narrative, prompt, model)
+RESPONSE_CACHE_TTL_SECONDS = 30 * 24 * 3600 # Regenerate answers older than a month
+
+
+def parse_search_options(data):
+    """Reads the optional 'k', 'minScore', 'mmrLambda' and 'filters' fields of a request body.
+
+    Returns:
+        A tuple of (k, minScore, mmrLambda, filters, error_message); error_message is None when valid.
+    """
+    k = data.get('k', 1)
+    minScore = data.get('minScore')
+    mmrLambda = data.get('mmrLambda')
+    filters = data.get('filters')
+
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_K:
+        return None, None, None, None, f"'k' must be an integer between 1 and {MAX_K}"
+    if minScore is not None and (isinstance(minScore, bool) or not isinstance(minScore, (int, float))):
+        return None, None, None, None, "'minScore' must be a number"
+    if mmrLambda is not None and (isinstance(mmrLambda, bool) or not isinstance(mmrLambda, (int, float))
+                                  or not 0 <= mmrLambda <= 1):
+        return None, None, None, None, "'mmrLambda' must be a number between 0 and 1"
+    if filters is not None and not isinstance(filters, dict):
+        return None, None, None, None, "'filters' must be an object, e.g. {\"assignment\": \"Synthesis Paper 3\"}"
+
+    return k, minScore, mmrLambda, filters, None
+
+
+def precomputed_answer(data, answerTable):
+    """The answer table's entry for the request's concept, if it asks for a default (k=1, unfiltered) search."""
+    concept = data.get('concept')
+    if not isinstance(concept, str) or data.get('k', 1) != 1:
+        return None
+    if any(data.get(option) is not None for option in ("minScore", "mmrLambda", "filters")):
+        return None
+    return answerTable.get(concept)
+
+
+def precomputed_response(entry):
+    """The /api/hawkai response body for an answer table entry."""
+    response = {"result": entry['answer'], "score": entry['score'], "cached": True, "precomputed": True}
+    if 'metadata' in entry:
+        response["metadata"] = entry['metadata']
+    return response
+
+
+def narrative_summary(narrative):
+    """The text and score of a retrieved narrative, plus its source metadata when the index has it."""
+    summary = {"text": narrative['text'], "score": narrative['score']}
+    if 'metadata' in narrative:
+        summary["metadata"] = narrative['metadata']
+    return summary
+
+
+def sse_event(event, payload):
+    """Formats one Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
@@ -1,19 +1,94 @@
 # Import Needed Libraries
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from google import genai
+import argparse
+import hashlib
 import json
+import numpy as np
+import random
+import threading
+import time
 import docx
 import fitz # PyMuPDF
+from chunking import chunkNarratives
+from indexStore import (writeBinaryIndex, appendToBinaryIndex, removeRowsFromBinaryIndex, compactBinaryIndex,
+                        loadBinaryIndex, loadSources, writeSources, MANIFEST_FILE, VALID_FILE, SOURCES_FILE)
+from metadata import describeDocument
+from dedup import minhashSignature, collapseDuplicates, printDuplicateReport, DUPLICATE_THRESHOLD
 
 
 ''' This file extracts text from word & pdf documents, and creates JSON with the file text and it's embedding text'''
 
 #1. Load Word Docs
-def loadNarrativesFromWordDocs(folderPath: Path) -> list:
+def readWordDocument(file: Path) -> str:
+    """Returns the text of one .docx file, one line per paragraph."""
+    doc = docx.Document(file)
+    allParagraphs = [p.text for p in doc.paragraphs]
+    return "\n".join(allParagraphs)
+
+def readPDFDocument(file: Path) -> str:
+    """Returns the text of one .pdf file, one block per page."""
+    # Open the PDF document using fitz; the pages are joined once instead of concatenated one by one
+    with fitz.open(file) as doc:
+        fullText = "\n".join(page.get_text() for page in doc) # Add newline between pages
+    return fullText.strip() # Remove leading/trailing whitespace
+
+DOCUMENT_READERS = {".docx": readWordDocument, ".pdf": readPDFDocument}
+
+def _extractDocument(file: Path) -> tuple:
+    """Worker for extractDocuments: reads one file and never raises."""
+    start = time.perf_counter()
+    metadata = {'fileType': file.suffix.lower().lstrip("."), 'bytes': file.stat().st_size}
+    try:
+        text = DOCUMENT_READERS[file.suffix.lower()](file)
+        metadata['chars'] = len(text)
+    except Exception as e:
+        text = None
+        metadata['error'] = f"{type(e).__name__}: {e}"
+    metadata['seconds'] = time.perf_counter() - start
+    return str(file), text, metadata
+
+def extractDocuments(files: list, maxWorkers: int = None):
     """
-    Reads all .docx files from a folder into a list of dictionaries.
+    Extracts the text of .docx/.pdf files in a process pool, yielding results as they finish.
+
+    Args:
+        files: The paths to extract.
+        maxWorkers: The number of worker processes (default: one per CPU; 1 runs in-process).
+
+    Yields:
+        (path, text, metadata) tuples in completion order. If a file could not be read,
+        text is None and metadata['error'] describes why; the other files carry on.
     """
+    files = [Path(file) for file in files if Path(file).suffix.lower() in DOCUMENT_READERS]
+    if maxWorkers == 1 or len(files) <= 1:
+        for file in files:
+            yield _extractDocument(file)
+        return
+
+    with ProcessPoolExecutor(max_workers=maxWorkers) as pool:
+        futures = [pool.submit(_extractDocument, file) for file in files]
+        for future in as_completed(futures):
+            yield future.result()
+
+def _loadNarratives(files: list, maxWorkers: int = None) -> list:
+    """Extracts files in parallel into narrative dictionaries, reporting unreadable files."""
     narrativeData = []
+    for source, text, metadata in extractDocuments(files, maxWorkers=maxWorkers):
+        if text is None:
+            print(f"  ⚠️ Warning: Could not read file {Path(source).name}. Error: {metadata['error']}. Skipping.")
+            continue
+        narrativeData.append({'text': text, 'source': source, 'metadata': describeDocument(source, text)})
+
+    # Results arrive in completion order; keep the folder order stable between runs
+    narrativeData.sort(key=lambda narrative: narrative['source'])
+    return narrativeData
+
+def loadNarrativesFromWordDocs(folderPath: Path, maxWorkers: int = None) -> list:
+    """
+    Reads all .docx files from a folder into a list of dictionaries.
+    """
     print(f"Loading narratives from: {folderPath}")
     filesFound = list(folderPath.glob("*.docx")) # Get a count upfront
 
@@ -22,26 +97,16 @@ def loadNarrativesFromWordDocs(folderPath: Path) -> list:
         return [] # Return empty list if no files
 
     print(f"Found {len(filesFound)} .docx files. Reading content...")
-    for file in filesFound:
-        try:
-            doc = docx.Document(file)
-            allParagraphs = [p.text for p in doc.paragraphs]
-            fullText = "\n".join(allParagraphs)
-            narrativeData.append({'text': fullText})
-        except Exception as e:
-            print(f"  ⚠️ Warning: Could not read file {file.name}. Error: {e}. Skipping.")
-
+    narrativeData = _loadNarratives(filesFound, maxWorkers=maxWorkers)
     print(f"Successfully loaded content from {len(narrativeData)} files.")
     return narrativeData
 
-def loadNarrativesFromPDFs(folderPath: Path) -> list:
+def loadNarrativesFromPDFs(folderPath: Path, maxWorkers: int = None) -> list:
     """
     Reads all .pdf files from a folder into a list of dictionaries.
     Each dictionary contains the extracted text content.
     """
-    narrativeData = []
     print(f"Loading narratives from PDF files in: {folderPath}")
-    # 1. Look for .pdf files
     filesFound = list(folderPath.glob("*.pdf"))
 
     if not filesFound:
@@ -49,24 +114,7 @@ def loadNarrativesFromPDFs(folderPath: Path) -> list:
         return []
 
     print(f"Found {len(filesFound)} .pdf files. Reading content...")
-    for file in filesFound:
-        fullText = "" # Initialize empty string for this file's text
-        try:
-            # 2. Open the PDF document using fitz
-            doc = fitz.open(file)
-            # 3. Loop through each page in the PDF
-            for page in doc:
-                # 4. Extract text from the page and add it to the string
-                fullText += page.get_text() + "\n" # Add newline between pages
-            doc.close() # Close the document
-
-            # 5. Append the dictionary with the extracted text
-            narrativeData.append({'text': fullText.strip()}) # Remove leading/trailing whitespace
-
-        except Exception as e:
-            # Handle potential errors opening or reading the PDF
-            print(f"  ⚠️ Warning: Could not read PDF file {file.name}. Error: {e}. Skipping.")
-
+    narrativeData = _loadNarratives(filesFound, maxWorkers=maxWorkers)
     print(f"Successfully loaded content from {len(narrativeData)} PDF files.")
     return narrativeData
 
@@ -74,33 +122,130 @@ def loadNarrativesFromPDFs(folderPath: Path) -> list:
 
 
 #2.
-# @params: list of dictionaries; keys=['fileName', 'text']
-# @returns: dictionary with key of 'embedded' added
-def embedNarrativeText(narrativeData: list, client) -> list:
+EMBEDDING_MODEL = "gemini-embedding-001"
+EMBED_BATCH_SIZE = 100 # The embedding API accepts at most 100 contents per request
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Spaces out request start times so at most `requestsPerMinute` start per minute."""
+
+    def __init__(self, requestsPerMinute: float = None):
+        self.interval = 60.0 / requestsPerMinute if requestsPerMinute else 0.0
+        self.nextStart = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            startAt = max(now, self.nextStart)
+            self.nextStart = startAt + self.interval
+        time.sleep(max(0.0, startAt - now))
+
+
+def textFingerprint(text: str) -> str:
+    """Returns the SHA-256 hex digest of a narrative's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def loadEmbeddingCheckpoint(checkpointPath: Path) -> dict:
+    """Reads a checkpoint written by embedNarrativeText into {text hash: embedding}."""
+    done = {}
+    if checkpointPath is None or not checkpointPath.exists():
+        return done
+    with open(checkpointPath, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                done[record['hash']] = record['embedding']
+            except (json.JSONDecodeError, KeyError):
+                # A crash mid-write leaves at most one truncated last line; re-embed it
+                continue
+    return done
+
+
+def embedBatchWithRetry(texts: list, client, rateLimiter: RateLimiter = None, maxRetries: int = 6,
+                        baseDelay: float = 1.0, maxDelay: float = 60.0) -> list:
+    """
+    Embeds one batch of texts, retrying 429 and 5xx errors with exponential backoff and jitter.
+    Other errors (e.g. 400 bad request) are raised immediately.
+    """
+    for attempt in range(maxRetries + 1):
+        if rateLimiter is not None:
+            rateLimiter.wait()
+        try:
+            result = client.models.embed_content(model=EMBEDDING_MODEL, contents=texts)
+            return [embedding.values for embedding in result.embeddings]
+        except Exception as e:
+            statusCode = getattr(e, 'code', None) or getattr(e, 'status_code', None)
+            if statusCode not in RETRYABLE_STATUS_CODES or attempt == maxRetries:
+                raise
+            delay = min(maxDelay, baseDelay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"  ⚠️ Warning: Embedding batch failed ({statusCode}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+# @params: list of dictionaries; keys=['text', ...]
+# @returns: the same dictionaries with the key 'embedding' added
+def embedNarrativeText(narrativeData: list, client, batchSize: int = EMBED_BATCH_SIZE, maxWorkers: int = 4,
+                       requestsPerMinute: float = None, checkpointPath: Path = None, maxRetries: int = 6) -> list:
     '''
-    This function adds the embedded value of each text as a key to the dictionary
+    This function adds the embedded value of each text as a key to the dictionary.
+
+    Texts are sent in batches of `batchSize` by up to `maxWorkers` concurrent requests,
+    optionally capped at `requestsPerMinute`. Each finished batch is appended to
+    `checkpointPath` (JSON lines keyed by text hash), so re-running after a crash only
+    embeds what is missing. Batches that still fail after retrying are reported and
+    their narratives are left without an 'embedding' key.
     '''
-    #create a list of all text strings to embed
-    toEmbed = []
-    for narrative in narrativeData:
-        toEmbed.append(narrative['text'])
-
-    # single api call to embed the entire list texts
-    result = client.models.embed_content(
-        model="gemini-embedding-001", # You might want to update this to "embedding-001"
-        contents=toEmbed
-    )
-
-    # list of the vectors from the result
-    embeddings = []
-    for embedding in result.embeddings: # Loop through each embedding returned by the API
-        vectors = embedding.values # Get the list of embedding values from the object
-        embeddings.append(vectors) # Add that list of numbers to our list
-
-    # Loop through the orignal data and new embeddings together
-    for narrative, embedding in zip(narrativeData, embeddings):
-        # Add the 'embedding' key to each existing dictionary
-        narrative['embedding'] = embedding
+    done = loadEmbeddingCheckpoint(checkpointPath)
+    hashes = [textFingerprint(narrative['text']) for narrative in narrativeData]
+
+    # Only embed each distinct missing text once
+    missing = list(dict.fromkeys(h for h in hashes if h not in done))
+    textByHash = {h: narrative['text'] for h, narrative in zip(hashes, narrativeData)}
+    batches = [missing[i:i + batchSize] for i in range(0, len(missing), batchSize)]
+    print(f"Embedding {len(missing)} texts in {len(batches)} batches ({len(narrativeData) - len(missing)} already done)...")
+
+    if batches:
+        rateLimiter = RateLimiter(requestsPerMinute)
+        checkpointLock = threading.Lock()
+        checkpointFile = None
+        if checkpointPath is not None:
+            checkpointPath.parent.mkdir(parents=True, exist_ok=True)
+            checkpointFile = open(checkpointPath, "a")
+
+        def embedBatch(batchHashes):
+            embeddings = embedBatchWithRetry([textByHash[h] for h in batchHashes], client, rateLimiter, maxRetries)
+            with checkpointLock:
+                for h, embedding in zip(batchHashes, embeddings):
+                    done[h] = embedding
+                    if checkpointFile is not None:
+                        checkpointFile.write(json.dumps({'hash': h, 'embedding': embedding}) + "\n")
+                if checkpointFile is not None:
+                    checkpointFile.flush()
+            return len(batchHashes)
+
+        try:
+            with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+                futures = [pool.submit(embedBatch, batch) for batch in batches]
+                completed = 0
+                for future in as_completed(futures):
+                    try:
+                        completed += future.result()
+                        print(f"  -> Embedded {completed}/{len(missing)} texts")
+                    except Exception as e:
+                        print(f"  ⚠️ Warning: An embedding batch failed permanently. Error: {e}")
+        finally:
+            if checkpointFile is not None:
+                checkpointFile.close()
+
+    # Loop through the orignal data and add the 'embedding' key where one is available
+    for narrative, h in zip(narrativeData, hashes):
+        if h in done:
+            narrative['embedding'] = done[h]
 
     return narrativeData
 
@@ -124,23 +269,290 @@ def buildCache(narrativeData: list, cachePath: Path) -> None:
         print(f"❌ Error saving cache file: {e}")
 
 
+#4. Build a passage-level binary index
+def buildPassageIndex(narrativeData: list, client, indexDir: Path, maxChars: int = 1200, overlapSentences: int = 1) -> None:
+    """
+    Splits narratives into overlapping passages, embeds every passage and writes a
+    passage-level binary index that also keeps the full parent narratives.
+    """
+    passageData = chunkNarratives(narrativeData, maxChars=maxChars, overlapSentences=overlapSentences)
+    print(f"Split {len(narrativeData)} narratives into {len(passageData)} passages.")
+
+    passageData = embedNarrativeText(passageData, client=client)
+
+    print(f"\nSaving passage index to: {indexDir}...")
+    writeBinaryIndex(passageData, indexDir, documents=[narrative['text'] for narrative in narrativeData])
+    print("✅ Save complete.")
+
+
+#5. Incrementally update a binary index from document folders
+def _collapseNearDuplicates(toEmbed: list, signatures: dict, sources: dict, staleRows: list,
+                            threshold: float = DUPLICATE_THRESHOLD, apply: bool = True) -> tuple:
+    """
+    Finds near-duplicates of each other and of already-indexed documents in toEmbed,
+    and with `apply` drops them.
+
+    Indexed documents take part through the MinHash signatures kept in the source
+    registry; an indexed duplicate of another indexed document has its rows tombstoned.
+    Every collapsed file is recorded with 'duplicateOf' and no rows, so it is skipped
+    on later runs until it changes. Without `apply` nothing is changed.
+
+    Returns:
+        (the documents left to embed, {collapsed (or collapsible) source: canonical source}).
+    """
+    pending = {source for source, _, _, _ in toEmbed}
+    indexedSources = [source for source, record in sources.items() if 'minhash' in record and source not in pending]
+    names = indexedSources + [source for source, _, _, _ in toEmbed]
+    clusterSignatures = ([np.array(sources[source]['minhash'], dtype=np.uint32) for source in indexedSources]
+                         + [signatures[source] for source, _, _, _ in toEmbed])
+    lengths = [sources[source]['chars'] for source in indexedSources] + [len(text) for _, _, text, _ in toEmbed]
+    collapsed = collapseDuplicates(names, clusterSignatures, lengths, indexed=set(range(len(indexedSources))),
+                                   threshold=threshold)
+    if not apply:
+        return toEmbed, collapsed
+
+    for source in indexedSources:
+        if source in collapsed:
+            record = sources[source]
+            staleRows.extend(range(*record.pop('rows')))
+            del record['minhash']
+            record.update(rows=[0, 0], duplicateOf=collapsed[source])
+
+    kept = []
+    for source, stat, text, fingerprint in toEmbed:
+        if source in collapsed:
+            # A modified file's old rows are already in staleRows
+            sources[source] = {'hash': fingerprint, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                               'rows': [0, 0], 'duplicateOf': collapsed[source]}
+        else:
+            kept.append((source, stat, text, fingerprint))
+    return kept, collapsed
+
+
+def _unregisteredRows(indexDir: Path) -> dict:
+    """Maps the text fingerprint of each document already in an index without a source
+    registry (e.g. one converted from the JSON caches by convertCache.py) to its [start, end) rows."""
+    binaryIndex = loadBinaryIndex(indexDir)
+    if binaryIndex is None:
+        raise ValueError(f"The index in '{indexDir}' could not be opened.")
+
+    rows = {}
+    if binaryIndex['manifest'].get('passageLevel'):
+        docIds = binaryIndex['docIds']
+        for docId, text in enumerate(binaryIndex['documents']):
+            docRows = np.flatnonzero((docIds == docId) & binaryIndex['valid'])
+            if len(docRows) and docRows[-1] - docRows[0] + 1 == len(docRows):
+                rows.setdefault(textFingerprint(text), [int(docRows[0]), int(docRows[-1]) + 1])
+    else:
+        for row, text in enumerate(binaryIndex['texts']):
+            if binaryIndex['valid'][row]:
+                rows.setdefault(textFingerprint(text), [row, row + 1])
+    return rows
+
+
+def incrementalIngest(folders: list, indexDir: Path, client, passageLevel: bool = False,
+                      compactThreshold: float = 0.25, maxWorkers: int = None, deduplicate: bool = False,
+                      **embedOptions) -> dict:
+    """
+    Brings a binary index up to date with the .docx/.pdf files in the given folders.
+
+    Every ingested file is recorded in the index's source registry with its size,
+    modification time and the SHA-256 of its extracted text. On a re-run:
+      * files whose size and mtime are unchanged are skipped without being opened,
+      * files whose extracted text hashes the same are skipped without being embedded,
+      * new or modified files are embedded and appended to the index in place,
+      * new or modified files that are near-duplicates (MinHash over word shingles,
+        see dedup.py) of each other or of indexed files are reported; with
+        `deduplicate` they are also not embedded (one canonical document per cluster
+        is kept),
+      * rows of modified and deleted files are tombstoned, and the index is compacted
+        once tombstones make up more than `compactThreshold` of its rows.
+    Changed files are extracted by `maxWorkers` processes (see extractDocuments).
+
+    An existing index without a registry (e.g. one written by convertCache.py) is
+    adopted on the first run: files whose text is already in the index are recorded
+    against those rows instead of being embedded and appended a second time.
+
+    Returns:
+        A summary dictionary with 'added', 'modified', 'deleted', 'unchanged',
+        'adopted' and 'duplicates' counts ('duplicates' counts the near-duplicates
+        found, collapsed or not; they are also counted as added or modified).
+
+    Raises:
+        ValueError: If `passageLevel` does not match an existing index.
+    """
+    sources = loadSources(indexDir)
+    indexExists = (indexDir / MANIFEST_FILE).exists()
+    if indexExists:
+        with open(indexDir / MANIFEST_FILE, "r") as f:
+            indexIsPassageLevel = json.load(f).get("passageLevel", False)
+        if indexIsPassageLevel != passageLevel:
+            raise ValueError(f"'{indexDir}' is a {'passage' if indexIsPassageLevel else 'narrative'}-level index; "
+                             f"{'pass' if indexIsPassageLevel else 'drop'} --passage-level or use a new --index.")
+    unregisteredRows = _unregisteredRows(indexDir) if indexExists and not (indexDir / SOURCES_FILE).exists() else {}
+    summary = {'added': 0, 'modified': 0, 'deleted': 0, 'unchanged': 0, 'adopted': 0, 'duplicates': 0}
+
+    # A duplicate whose canonical file is gone is treated as new, so it can take its place
+    for source in [source for source, record in sources.items()
+                   if 'duplicateOf' in record and not Path(record['duplicateOf']).exists()]:
+        del sources[source]
+    staleRows = []
+    toEmbed = [] # (source, stat, text, hash)
+
+    # 1. Find new and modified files (only files whose size or mtime changed are opened)
+    seen = set()
+    candidates = []
+    for folder in folders:
+        for file in sorted(folder.iterdir()):
+            if file.suffix.lower() not in DOCUMENT_READERS:
+                continue
+            source = str(file)
+            seen.add(source)
+            stat = file.stat()
+            record = sources.get(source)
+            if record and record['size'] == stat.st_size and record['mtime'] == stat.st_mtime:
+                summary['unchanged'] += 1
+                continue
+            candidates.append(file)
+
+    for source, text, metadata in extractDocuments(candidates, maxWorkers=maxWorkers):
+        if text is None:
+            print(f"  ⚠️ Warning: Could not read file {Path(source).name}. Error: {metadata['error']}. Skipping.")
+            continue
+
+        stat = Path(source).stat()
+        record = sources.get(source)
+        fingerprint = textFingerprint(text)
+        if record is None and fingerprint in unregisteredRows:
+            # Already in the index, just not registered yet
+            sources[source] = {'hash': fingerprint, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                               'rows': unregisteredRows.pop(fingerprint), 'chars': len(text)}
+            signature = minhashSignature(text)
+            if signature is not None:
+                sources[source]['minhash'] = signature.tolist()
+            summary['adopted'] += 1
+            continue
+        if record and record['hash'] == fingerprint:
+            # Touched but not changed: only refresh the fast-path fields
+            record['size'], record['mtime'] = stat.st_size, stat.st_mtime
+            summary['unchanged'] += 1
+            continue
+
+        if record:
+            staleRows.extend(range(*record['rows']))
+            summary['modified'] += 1
+        else:
+            summary['added'] += 1
+        toEmbed.append((source, stat, text, fingerprint))
+
+    if summary['adopted'] and unregisteredRows:
+        print(f"  ⚠️ Warning: {len(unregisteredRows)} narratives already in '{indexDir}' match no file; they are kept but not tracked.")
+    toEmbed.sort(key=lambda item: item[0]) # completion order varies; keep row order stable
+
+    # 2. Forget deleted files
+    for source in [source for source in sources if source not in seen]:
+        staleRows.extend(range(*sources.pop(source)['rows']))
+        summary['deleted'] += 1
+
+    # 3. Report near-duplicates (drafts, "(1)" copies, mirrored folders) and, if asked, collapse them before
+    # paying to embed them. Collapsing is opt-in until the threshold has been checked against the report
+    signatures = {source: minhashSignature(text) for source, _, text, _ in toEmbed}
+    toEmbed, collapsed = _collapseNearDuplicates(toEmbed, signatures, sources, staleRows, apply=deduplicate)
+    summary['duplicates'] = len(collapsed)
+    if collapsed:
+        printDuplicateReport(collapsed, applied=deduplicate)
+
+    # 4. Embed the new and modified documents (passage-level indexes embed each passage)
+    narrativeData = [{'text': text, 'metadata': describeDocument(source, text)} for source, _, text, _ in toEmbed]
+    rowData = chunkNarratives(narrativeData) if passageLevel else narrativeData
+    rowData = embedNarrativeText(rowData, client=client, **embedOptions)
+
+    rowsPerDocument = [[] for _ in toEmbed]
+    for position, row in enumerate(rowData):
+        rowsPerDocument[row['docId'] if passageLevel else position].append(row)
+
+    # Documents with any failed embedding are left out (and not recorded) so the next run retries them
+    complete = [i for i, rows in enumerate(rowsPerDocument) if rows and all('embedding' in row for row in rows)]
+    appendData = []
+    documents = []
+    for newDocId, i in enumerate(complete):
+        for row in rowsPerDocument[i]:
+            appendData.append({**row, 'docId': newDocId} if passageLevel else row)
+        documents.append(toEmbed[i][2])
+
+    # 5. Write the rows and the registry
+    if appendData:
+        if indexExists:
+            rowRange = appendToBinaryIndex(appendData, indexDir, documents=documents if passageLevel else None)
+            firstRow = rowRange.start
+        else:
+            writeBinaryIndex(appendData, indexDir, documents=documents if passageLevel else None)
+            firstRow = 0
+        for i in complete:
+            source, stat, text, fingerprint = toEmbed[i]
+            rowCount = len(rowsPerDocument[i])
+            sources[source] = {'hash': fingerprint, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                               'rows': [firstRow, firstRow + rowCount], 'chars': len(text)}
+            if signatures[source] is not None:
+                sources[source]['minhash'] = signatures[source].tolist()
+            firstRow += rowCount
+
+    if staleRows:
+        removeRowsFromBinaryIndex(indexDir, staleRows)
+    if indexExists or appendData:
+        writeSources(indexDir, sources)
+
+    # 6. Reclaim tombstoned rows once they are a large share of the index
+    if staleRows:
+        valid = np.load(indexDir / VALID_FILE)
+        rowCount, tombstoned = len(valid), int((~valid).sum())
+        if rowCount and tombstoned / rowCount > compactThreshold:
+            print(f"Compacting index ({tombstoned} of {rowCount} rows are stale)...")
+            compactBinaryIndex(indexDir)
+
+    print(f"✅ Ingest complete: {summary}")
+    return summary
+
+
 # --- Main Execution Block ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and embed the narrative documents.")
+    parser.add_argument("--ingest", type=Path, nargs="+", default=None,
+                        help="Bring --index up to date with these document folders (only new or changed files are embedded)")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Binary index directory kept by --ingest")
+    parser.add_argument("--passage-level", action="store_true", help="Embed passages instead of whole narratives (must match an existing index)")
+    parser.add_argument("--dedup", action="store_true", help="Skip embedding near-duplicate files (otherwise they are only reported)")
+    args = parser.parse_args()
 
     client = genai.Client()
 
-    ''''''
-    CURRENT_PDF_PATH = Path('./documentNarrativeDatabase/papersToAdd/wordProcessed')
-    CURRENT_EMBEDDING_PATH = Path('./newWordpapers.json')
-    ''''''
+    if args.ingest:
+        # keep a binary index in sync with the document folders, e.g.
+        # python setup.py --ingest ./documentNarrativeDatabase/AllWordFiles ./documentNarrativeDatabase/AllPDFfiles
+        try:
+            incrementalIngest(args.ingest, indexDir=args.index, client=client, passageLevel=args.passage_level,
+                              deduplicate=args.dedup)
+        except ValueError as e:
+            raise SystemExit(f"❌ Error: {e}")
+    else:
+        ''''''
+        CURRENT_PDF_PATH = Path('./documentNarrativeDatabase/papersToAdd/wordProcessed')
+        CURRENT_EMBEDDING_PATH = Path('./newWordpapers.json')
+        ''''''
     
-    # set path 
-    listOfNarrativeDictionaries = loadNarrativesFromWordDocs(CURRENT_PDF_PATH)
+        # set path 
+        listOfNarrativeDictionaries = loadNarrativesFromWordDocs(CURRENT_PDF_PATH)
+
+        # embed (batched and checkpointed, so a crash resumes instead of starting over)
+        listOfNarrativeDictionariesWithEmbedding = embedNarrativeText(
+            listOfNarrativeDictionaries, client=client,
+            checkpointPath=CURRENT_EMBEDDING_PATH.with_suffix('.checkpoint.jsonl')
+        )
 
-    # embed
-    listOfNarrativeDictionariesWithEmbedding = embedNarrativeText(listOfNarrativeDictionaries, client=client)
+        # dump to JSON
+        buildCache(listOfNarrativeDictionariesWithEmbedding, CURRENT_EMBEDDING_PATH)
 
-    # dump to JSON
-    buildCache(listOfNarrativeDictionariesWithEmbedding, CURRENT_EMBEDDING_PATH)
+        # or, for passage-level retrieval, embed overlapping passages into a binary index:
+        # buildPassageIndex(listOfNarrativeDictionaries, client=client, indexDir=Path('./embeddingIndex'))
 
-    # build embedding files
+        # build embedding files
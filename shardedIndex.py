@@ -0,0 +1,125 @@
+from pathlib import Path
+import argparse
+import shutil
+import json
+from indexStore import writeBinaryIndex, MANIFEST_FILE, VALID_FILE
+
+'''This file manages a sharded index: a directory of independent binary indexes
+(one per JSON cache batch or document folder) listed in a small manifest, so one
+shard can be added or rebuilt without touching the others'''
+
+SHARD_FORMAT_VERSION = 1
+SHARD_MANIFEST_FILE = "shards.json"
+SHARDS_DIR = "shards"
+
+
+def shardDirectory(indexDir: Path, name: str) -> Path:
+    """The directory of one shard; it is a complete binary index (see indexStore.py)."""
+    return indexDir / SHARDS_DIR / name
+
+
+def loadShardManifest(indexDir: Path) -> list:
+    """Returns the shard names listed in indexDir's manifest, or None if indexDir is not sharded."""
+    try:
+        with open(indexDir / SHARD_MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("formatVersion") != SHARD_FORMAT_VERSION:
+        raise ValueError(f"Unsupported shard manifest version {manifest.get('formatVersion')} in '{indexDir}'.")
+    return manifest["shards"]
+
+
+def _writeShardManifest(indexDir: Path, names: list) -> None:
+    indexDir.mkdir(parents=True, exist_ok=True)
+    temporaryPath = indexDir / (SHARD_MANIFEST_FILE + ".tmp")
+    with open(temporaryPath, "w") as f:
+        json.dump({"formatVersion": SHARD_FORMAT_VERSION, "shards": names}, f, indent=4)
+    temporaryPath.replace(indexDir / SHARD_MANIFEST_FILE)
+
+
+def registerShard(indexDir: Path, name: str) -> None:
+    """Adds a shard directory that already holds a binary index (e.g. one written by
+    setup.incrementalIngest) to the manifest."""
+    if not (shardDirectory(indexDir, name) / MANIFEST_FILE).exists():
+        raise ValueError(f"The shard '{name}' has no binary index in '{shardDirectory(indexDir, name)}'.")
+    names = loadShardManifest(indexDir) or []
+    if name not in names:
+        _writeShardManifest(indexDir, names + [name])
+
+
+def writeShard(narrativeData: list, indexDir: Path, name: str, dtype: str = "float32", documents: list = None) -> None:
+    """Writes (or rebuilds) one shard and lists it in the manifest; the other shards are left as they are.
+
+    The shard's own manifest is written last, so a server reloading mid-write sees
+    either the old or the new shard.
+    """
+    writeBinaryIndex(narrativeData, shardDirectory(indexDir, name), dtype=dtype, documents=documents)
+    registerShard(indexDir, name)
+
+
+def removeShard(indexDir: Path, name: str) -> None:
+    """Drops a shard from the manifest first, then deletes its files."""
+    names = loadShardManifest(indexDir) or []
+    if name not in names:
+        raise ValueError(f"'{name}' is not a shard of '{indexDir}'.")
+    _writeShardManifest(indexDir, [shard for shard in names if shard != name])
+    shutil.rmtree(shardDirectory(indexDir, name), ignore_errors=True)
+
+
+def convertJSONCachesToShards(jsonFiles: list, indexDir: Path, dtype: str = "float32") -> int:
+    """Writes one shard per JSON cache, named after the file (e.g. 'wordEmbeddingA').
+
+    Returns:
+        The number of narratives written across the shards.
+    """
+    total = 0
+    for jsonFile in jsonFiles:
+        with open(jsonFile, "r") as f:
+            batch = json.load(f)
+        writeShard(batch, indexDir, Path(jsonFile).stem, dtype=dtype)
+        print(f"  -> Wrote shard '{Path(jsonFile).stem}' ({len(batch)} narratives)")
+        total += len(batch)
+    return total
+
+
+def watchedIndexFiles(indexDir: Path) -> list:
+    """The files whose change means the index was rebuilt: the manifest and validity
+    mask of the index, or of every shard (plus the shard manifest) when it is sharded."""
+    try:
+        names = loadShardManifest(indexDir)
+    except (ValueError, json.JSONDecodeError):
+        names = None
+    if names is None:
+        return [indexDir / MANIFEST_FILE, indexDir / VALID_FILE]
+    files = [indexDir / SHARD_MANIFEST_FILE]
+    for name in names:
+        files += [shardDirectory(indexDir, name) / MANIFEST_FILE, shardDirectory(indexDir, name) / VALID_FILE]
+    return files
+
+
+# --- Main Execution Block ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List, add, register or remove the shards of a sharded index.")
+    parser.add_argument("--index", type=Path, default=Path("./embeddingIndex"), help="Sharded index directory")
+    parser.add_argument("--add", type=Path, nargs="+", default=[], help="JSON caches to (re)build as shards, named after the file")
+    parser.add_argument("--register", nargs="+", default=[], help="Shards already ingested into <index>/shards/<name>")
+    parser.add_argument("--remove", nargs="+", default=[], help="Shards to delete")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="On-disk dtype of new shards")
+    args = parser.parse_args()
+
+    if args.add:
+        print(f"✅ Wrote {convertJSONCachesToShards(args.add, args.index, dtype=args.dtype)} narratives.")
+    for name in args.register:
+        registerShard(args.index, name)
+    for name in args.remove:
+        removeShard(args.index, name)
+
+    names = loadShardManifest(args.index)
+    if names is None:
+        raise SystemExit(f"❌ Error: '{args.index}' is not a sharded index.")
+    print(f"{len(names)} shards in '{args.index}':")
+    for name in names:
+        with open(shardDirectory(args.index, name) / MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+        print(f"  {name}: {manifest['count']} rows, {manifest['dimension']}-d {manifest['dtype']}")
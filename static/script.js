@@ -7,6 +7,58 @@ document.addEventListener('DOMContentLoaded', function() {
     const resultsOutput = document.getElementById('resultsOutput');
     const similarityScoreOutput = document.getElementById('similarityScore');
 
+    // Handles one Server-Sent Event: the score arrives first, then the analysis in chunks (or an error)
+    function handleEvent(event, data) {
+        if (event === 'narrative') {
+            similarityScoreOutput.innerHTML = data.score.toFixed(4);
+            resultsOutput.innerHTML = '';
+        } else if (event === 'chunk') {
+            // Escape the text before turning newlines into line breaks
+            const chunk = document.createElement('span');
+            chunk.textContent = data.text;
+            resultsOutput.insertAdjacentHTML('beforeend', chunk.innerHTML.replace(/\n/g, '<br>'));
+        } else if (event === 'error') {
+            // Generation failed (or the server was busy) after the stream opened; keep any partial text
+            const message = document.createElement('p');
+            message.className = 'text-danger';
+            message.textContent = data.retryAfter ? `${data.error} (retry in ${data.retryAfter}s)` : data.error;
+            resultsOutput.appendChild(message);
+        }
+    }
+
+    // Reads a text/event-stream body and passes each complete event to handleEvent
+    async function readEventStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                for (const line of frame.split('\n')) {
+                    if (line.startsWith('event: ')) {
+                        event = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                }
+                handleEvent(event, JSON.parse(data || '{}'));
+            }
+        }
+    }
+
     // Add event listener to the button - run this function when clicked
     submitButton.addEventListener('click', function() {
 
@@ -29,8 +81,8 @@ document.addEventListener('DOMContentLoaded', function() {
             concept: userConcept
         };
 
-        // 3. Use the fetch API to send the data to our Flask backend
-        fetch('/api/hawkai', {
+        // 3. Use the fetch API to send the data to the streaming endpoint of our Flask backend
+        fetch('/api/hawkai/stream', {
             method: 'POST', // Specify the post request
             headers: {
                 'Content-Type': 'application/json' // Tell the server we're sending JSON
@@ -43,21 +95,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     throw new Error(errorData.error || `Server responded with status: ${response.status}`);
                 }); // this 'throw' will trigger the '.catch()' block below
             }
-            // If 200 ok, parse the JSON response body
-            return response.json();
-        })
-        .then(data => {
-            // data object looks like: { "result": "...", "score": 0.85 }
-
-            // 1. Get the AI-generated text (a string)
-            const formattedResult = data.result.replace(/\n/g, '<br>');
-            
-            // 2. Get the score (a number) and format it
-            const formattedScore = data.score.toFixed(4);
-
-            // 3. Populate the two divs separately
-            resultsOutput.innerHTML = formattedResult;
-            similarityScoreOutput.innerHTML = formattedScore;
+            // If 200 ok, read the Server-Sent Events as they arrive
+            return readEventStream(response);
         })
         .catch(error => {
             // Handle any errors that occurred during the fetch process
@@ -0,0 +1,37 @@
+from pathlib import Path
+import sys
+import pytest
+
+# The modules live at the repo root (there is no package), so make them importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fakeClient import FakeClient, fakeEmbedding
+
+
+@pytest.fixture
+def client():
+    """An offline stand-in for genai.Client() with small embeddings."""
+    return FakeClient(dimension=16)
+
+
+@pytest.fixture
+def narratives():
+    """A small corpus of distinct narratives with fake embeddings."""
+    texts = [f"Essay {i}: " + " ".join(f"word{i}x{j}" for j in range(80)) for i in range(12)]
+    return [{'text': text, 'embedding': fakeEmbedding(text, 16)} for text in texts]
+
+
+@pytest.fixture
+def writeDocx():
+    """Writes a .docx whose first paragraph is the given text."""
+    import docx
+
+    def write(path: Path, text: str, headerText: str = None) -> Path:
+        document = docx.Document()
+        if headerText is not None:
+            document.sections[0].header.paragraphs[0].text = headerText
+        document.add_paragraph(text)
+        document.save(path)
+        return path
+    return write
+
@@ -0,0 +1,41 @@
+import json
+import pytest
+import answerTable
+from answerTable import AnswerTable, buildAnswerTable
+from indexStore import writeBinaryIndex
+from runtime import loadSearchIndex
+
+
+@pytest.fixture
+def builtTable(tmp_path, narratives, client):
+    writeBinaryIndex(narratives, tmp_path / "index")
+    searchIndex = loadSearchIndex(tmp_path / "index")
+    tablePath = tmp_path / "answerTable.json"
+    buildAnswerTable(["Anomie", "Gender pay"], searchIndex, client, tablePath)
+    return tablePath, searchIndex
+
+
+def test_rerunRegeneratesNothing(builtTable, client):
+    tablePath, searchIndex = builtTable
+    calls = client.models.generateCalls
+
+    summary = buildAnswerTable(["Anomie", "Gender pay"], searchIndex, client, tablePath)
+
+    assert summary['unchanged'] == 2 and client.models.generateCalls == calls
+    assert AnswerTable.load(tablePath, searchIndex).get("  anomie ")['answer']
+
+
+def test_tableFromAnotherPromptIsIgnored(builtTable, monkeypatch):
+    tablePath, searchIndex = builtTable
+    monkeypatch.setattr(answerTable, "PROMPT_VERSION", "another prompt")
+
+    assert len(AnswerTable.load(tablePath, searchIndex)) == 0
+
+
+def test_entriesOfARebuiltIndexAreDropped(builtTable, tmp_path, narratives):
+    tablePath, _ = builtTable
+    writeBinaryIndex(narratives[::-1], tmp_path / "index")
+
+    assert len(AnswerTable.load(tablePath, loadSearchIndex(tmp_path / "index"))) == 0
+    with open(tablePath) as f:
+        assert len(json.load(f)["entries"]) == 2
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+import asyncApp
+from fakeClient import fakeEmbedding, FakeAPIError
+from indexStore import writeBinaryIndex
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The Quart app on a small index, the fake client and in-memory caches."""
+    texts = [f"narrative {i}" for i in range(8)]
+    writeBinaryIndex([{'text': text, 'embedding': fakeEmbedding(text)} for text in texts], tmp_path / "index")
+    monkeypatch.setenv("HAWKAI_FAKE_CLIENT", "1")
+    monkeypatch.setenv("HAWKAI_FAKE_LATENCY", "0")
+    monkeypatch.setattr(asyncApp, "INDEX_DIR", tmp_path / "index")
+    monkeypatch.setattr(asyncApp, "ANSWER_TABLE_FILE", tmp_path / "answerTable.json")
+    monkeypatch.setattr(asyncApp, "QUERY_CACHE_FILE", None)
+    monkeypatch.setattr(asyncApp, "RESPONSE_CACHE_FILE", None)
+    return asyncApp.app
+
+
+def test_eachMissIsCountedOnce(app):
+    async def scenario():
+        async with app.test_app():
+            testClient = app.test_client()
+            first = await testClient.post("/api/hawkai", json={"concept": "Anomie"})
+            second = await testClient.post("/api/hawkai", json={"concept": "Anomie"})
+            return (await first.get_json())["cached"], (await second.get_json())["cached"]
+
+    assert asyncio.run(scenario()) == (False, True)
+    assert (asyncApp.responseCache.stats()["hits"], asyncApp.responseCache.stats()["misses"]) == (1, 1)
+    assert (asyncApp.queryCache.stats()["hits"], asyncApp.queryCache.stats()["misses"]) == (1, 1)
+
+
+def test_streamNeverReadHoldsNoSlot(app):
+    async def scenario():
+        async with app.test_app():
+            for _ in range(asyncApp.upstreamLimiter.maxConcurrent + 1):
+                async with app.test_request_context("/api/hawkai/stream", method="POST", json={"concept": "Anomie"}):
+                    response = await asyncApp.handle_hawkai_stream_query()
+                    del response # the client disconnected before the body started
+            testClient = app.test_client()
+            streamed = await testClient.post("/api/hawkai/stream", json={"concept": "Anomie"})
+            return streamed.status_code, await streamed.get_data(as_text=True), asyncApp.upstreamLimiter.stats()
+
+    status, body, stats = asyncio.run(scenario())
+    assert status == 200 and body.endswith("event: done\ndata: {}\n\n")
+    assert stats["active"] == 0 and stats["rejected"] == 0
+
+
+def test_streamRecordsUsage(app):
+    async def scenario():
+        async with app.test_app():
+            testClient = app.test_client()
+            before = dict(asyncApp.generationUsage)
+            streamed = await testClient.post("/api/hawkai/stream", json={"concept": "Anomie"})
+            body = await streamed.get_data(as_text=True)
+            status = await (await testClient.get("/api/hawkai/status")).get_json()
+            return body, before, status["usage"]
+
+    body, before, after = asyncio.run(scenario())
+    assert body.endswith("event: done\ndata: {}\n\n")
+    assert after["generations"] == before["generations"] + 1
+    assert after["promptTokens"] > before["promptTokens"] and after["outputTokens"] > before["outputTokens"]
+
+
+def test_streamFailureEndsWithAnErrorEvent(app):
+    async def rateLimited(model, contents, config=None):
+        raise FakeAPIError(429, "Injected failure")
+
+    async def scenario():
+        async with app.test_app():
+            asyncApp.client.aio.models.generate_content_stream = rateLimited
+            testClient = app.test_client()
+            streamed = await testClient.post("/api/hawkai/stream", json={"concept": "Anomie"})
+            return streamed.status_code, await streamed.get_data(as_text=True)
+
+    status, body = asyncio.run(scenario())
+    assert status == 200
+    assert "event: chunk" not in body and "event: done" not in body
+    assert body.endswith('event: error\ndata: {"error": "The Gemini API is rate limiting requests, please retry shortly", '
+                         '"retryAfter": 2}\n\n')
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from concurrency import UpstreamLimiter, UpstreamBusyError
+
+
+def test_cancelledWaiterGivesItsPermitBack():
+    async def scenario():
+        limiter = UpstreamLimiter(maxConcurrent=1, maxWaiting=4, waitTimeout=5.0)
+        holding = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot():
+                holding.set()
+                await finish.wait()
+
+        async def waiter():
+            async with limiter.slot():
+                pass
+
+        holderTask = asyncio.ensure_future(holder())
+        await holding.wait()
+        waiterTask = asyncio.ensure_future(waiter())
+        await asyncio.sleep(0)
+
+        # Free the slot and cancel the waiter in the same step, so its acquire is granted as it is abandoned
+        finish.set()
+        await holderTask
+        waiterTask.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiterTask
+        await asyncio.sleep(0)
+
+        async with limiter.slot():
+            pass
+        return limiter.semaphore._value, limiter.stats()
+
+    permits, stats = asyncio.run(scenario())
+    assert permits == 1
+    assert stats["active"] == 0 and stats["waiting"] == 0
+
+
+def test_waitTimeoutRejectsAndKeepsThePermitCount():
+    async def scenario():
+        limiter = UpstreamLimiter(maxConcurrent=1, maxWaiting=4, waitTimeout=0.01)
+        async with limiter.slot():
+            with pytest.raises(UpstreamBusyError):
+                async with limiter.slot():
+                    pass
+        await asyncio.sleep(0)
+        return limiter.semaphore._value, limiter.stats()
+
+    permits, stats = asyncio.run(scenario())
+    assert permits == 1
+    assert stats["rejected"] == 1 and stats["waiting"] == 0
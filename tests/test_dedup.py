@@ -0,0 +1,50 @@
+import itertools
+import numpy as np
+import dedup
+from dedup import findDuplicateClusters, minhashSignature, estimatedJaccard, NUM_PERMUTATIONS, LSH_BANDS
+
+
+def test_similarDraftsCluster():
+    words = [f"w{i}" for i in range(300)]
+    draft = " ".join(words)
+    revised = " ".join(words[:290] + ["changed"] * 10)
+    other = " ".join(f"x{i}" for i in range(300))
+
+    signatures = np.stack([minhashSignature(text) for text in (draft, revised, other)])
+
+    assert estimatedJaccard(signatures[0], signatures[1]) > 0.8
+    assert findDuplicateClusters(signatures) == [[0, 1]]
+    assert minhashSignature("too short") is None
+
+
+def test_clustersDoNotDependOnOrder():
+    # a shares one band with b, but is not similar; b and c are near-duplicates
+    rng = np.random.default_rng(1)
+    b = rng.integers(0, 2 ** 32, NUM_PERMUTATIONS, dtype=np.uint64).astype(np.uint32)
+    c = b.copy()
+    c[-3:] += 1
+    a = rng.integers(0, 2 ** 32, NUM_PERMUTATIONS, dtype=np.uint64).astype(np.uint32)
+    a[:NUM_PERMUTATIONS // LSH_BANDS] = b[:NUM_PERMUTATIONS // LSH_BANDS]
+    named = {"a": a, "b": b, "c": c}
+
+    for order in itertools.permutations("abc"):
+        clusters = findDuplicateClusters(np.stack([named[name] for name in order]))
+        assert [sorted(order[row] for row in cluster) for cluster in clusters] == [["b", "c"]]
+
+
+def test_oversizedBucketIsCheckedAgainstOneRepresentative(monkeypatch):
+    # 200 unrelated documents sharing one boilerplate band, plus one near-copy of the first
+    rng = np.random.default_rng(2)
+    signatures = rng.integers(0, 2 ** 32, (201, NUM_PERMUTATIONS), dtype=np.uint64).astype(np.uint32)
+    signatures[:, :NUM_PERMUTATIONS // LSH_BANDS] = signatures[0, :NUM_PERMUTATIONS // LSH_BANDS]
+    signatures[200] = signatures[0]
+    signatures[200, -2:] += 1
+
+    compared = []
+    def countingJaccard(a, b):
+        compared.append(1)
+        return float(np.mean(a == b))
+    monkeypatch.setattr(dedup, "estimatedJaccard", countingJaccard)
+
+    assert findDuplicateClusters(signatures) == [[0, 200]]
+    assert len(compared) < 201 * LSH_BANDS # far fewer than the ~20,000 pairs of the shared bucket
@@ -0,0 +1,55 @@
+import json
+import pytest
+import setup
+from fakeClient import FakeClient, FakeAPIError
+
+
+@pytest.fixture(autouse=True)
+def noBackoff(monkeypatch):
+    """Retries back off with time.sleep; skip the waiting."""
+    monkeypatch.setattr(setup.time, "sleep", lambda seconds: None)
+
+
+def corpus(count: int) -> list:
+    return [{'text': f"narrative {i}"} for i in range(count)]
+
+
+def test_retryableFailuresAreRetried():
+    client = FakeClient(dimension=8, failureRate=0.5)
+
+    narratives = setup.embedNarrativeText(corpus(250), client, batchSize=50, maxWorkers=2)
+
+    assert all(len(narrative['embedding']) == 8 for narrative in narratives)
+    assert client.models.embedCalls > 5
+
+
+def test_nonRetryableErrorIsNotRetried(monkeypatch):
+    delays = []
+    monkeypatch.setattr(setup.time, "sleep", delays.append)
+    client = FakeClient(dimension=8, maxBatchSize=10) # a batch over the limit is a 400
+
+    with pytest.raises(FakeAPIError):
+        setup.embedBatchWithRetry([f"text {i}" for i in range(20)], client)
+    assert delays == []
+
+
+def test_checkpointResumesOnlyMissingBatches(tmp_path):
+    checkpointPath = tmp_path / "embeddings.checkpoint.jsonl"
+    failing = FakeClient(dimension=8, failureRate=0.5, seed=3)
+
+    first = setup.embedNarrativeText(corpus(200), failing, batchSize=20, maxWorkers=1, maxRetries=0,
+                                     checkpointPath=checkpointPath)
+    embedded = sum('embedding' in narrative for narrative in first)
+    assert 0 < embedded < 200
+    with open(checkpointPath, "a") as f:
+        f.write('{"hash": "truncated') # a crash mid-write
+
+    healthy = FakeClient(dimension=8)
+    second = setup.embedNarrativeText(corpus(200), healthy, batchSize=20, maxWorkers=1, checkpointPath=checkpointPath)
+
+    assert all('embedding' in narrative for narrative in second)
+    assert healthy.models.embedCalls == -(-(200 - embedded) // 20)
+    with open(checkpointPath) as f:
+        assert len([line for line in f if line.endswith("\n")]) == 200
+    assert [n['embedding'] for n in first if 'embedding' in n] == \
+           [n['embedding'] for n, m in zip(second, first) if 'embedding' in m]
@@ -0,0 +1,118 @@
+import json
+import pytest
+import setup
+from indexStore import convertJSONCachesToBinary, loadBinaryIndex, loadSources
+from fakeClient import fakeEmbedding
+
+
+def essay(i: int, words: int = 80) -> str:
+    return f"Essay {i}: " + " ".join(f"word{i}x{j}" for j in range(words))
+
+
+def ingest(folder, indexDir, client, **options):
+    return setup.incrementalIngest([folder], indexDir, client, maxWorkers=1, **options)
+
+
+def test_rerunOnlyEmbedsChangedFiles(tmp_path, client, writeDocx):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    for i in range(4):
+        writeDocx(folder / f"essay{i}.docx", essay(i))
+    indexDir = tmp_path / "index"
+
+    assert ingest(folder, indexDir, client)['added'] == 4
+    callsAfterFirstRun = client.models.embedCalls
+    assert ingest(folder, indexDir, client)['unchanged'] == 4
+    assert client.models.embedCalls == callsAfterFirstRun
+
+    writeDocx(folder / "essay1.docx", essay(101))
+    (folder / "essay3.docx").unlink()
+    summary = ingest(folder, indexDir, client)
+
+    assert (summary['modified'], summary['deleted'], summary['unchanged']) == (1, 1, 2)
+    binaryIndex = loadBinaryIndex(indexDir)
+    liveTexts = sorted(text for text, valid in zip(binaryIndex['texts'], binaryIndex['valid']) if valid)
+    assert liveTexts == sorted([essay(0), essay(101), essay(2)])
+
+
+def test_tombstonesAreCompactedPastTheThreshold(tmp_path, client, writeDocx):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    for i in range(4):
+        writeDocx(folder / f"essay{i}.docx", essay(i))
+    indexDir = tmp_path / "index"
+    ingest(folder, indexDir, client)
+
+    for i in range(2):
+        writeDocx(folder / f"essay{i}.docx", essay(100 + i))
+    ingest(folder, indexDir, client, compactThreshold=0.25)
+
+    binaryIndex = loadBinaryIndex(indexDir)
+    assert binaryIndex['manifest']['count'] == 4 and binaryIndex['valid'].all()
+    sources = loadSources(indexDir)
+    for i, text in enumerate([essay(100), essay(101), essay(2), essay(3)]):
+        start, end = sources[str(folder / f"essay{i}.docx")]['rows']
+        assert list(binaryIndex['texts'][start:end]) == [text]
+
+
+def test_convertedIndexIsAdoptedInsteadOfAppendedAgain(tmp_path, client, writeDocx):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    files = [writeDocx(folder / f"essay{i}.docx", essay(i)) for i in range(3)]
+    cachePath = tmp_path / "cache.json"
+    with open(cachePath, "w") as f:
+        json.dump([{'text': setup.readWordDocument(file), 'embedding': fakeEmbedding(essay(i), 16)}
+                   for i, file in enumerate(files[:2])], f)
+    indexDir = tmp_path / "index"
+    convertJSONCachesToBinary([cachePath], indexDir)
+
+    summary = ingest(folder, indexDir, client)
+
+    assert (summary['adopted'], summary['added']) == (2, 1)
+    assert loadBinaryIndex(indexDir)['manifest']['count'] == 3
+    assert ingest(folder, indexDir, client)['unchanged'] == 3
+
+
+def writeDrafts(folder, writeDocx):
+    folder.mkdir()
+    writeDocx(folder / "draft.docx", essay(7))
+    writeDocx(folder / "draft (1).docx", essay(7) + " one more sentence")
+    writeDocx(folder / "other.docx", essay(8))
+
+
+def test_nearDuplicatesAreOnlyReportedByDefault(tmp_path, client, writeDocx, capsys):
+    folder = tmp_path / "docs"
+    writeDrafts(folder, writeDocx)
+    indexDir = tmp_path / "index"
+
+    summary = ingest(folder, indexDir, client)
+
+    assert summary['duplicates'] == 1
+    assert "report only" in capsys.readouterr().out
+    assert loadBinaryIndex(indexDir)['manifest']['count'] == 3
+    assert not any('duplicateOf' in record for record in loadSources(indexDir).values())
+
+
+def test_nearDuplicatesAreNotEmbeddedWithDeduplicate(tmp_path, client, writeDocx):
+    folder = tmp_path / "docs"
+    writeDrafts(folder, writeDocx)
+    indexDir = tmp_path / "index"
+
+    summary = ingest(folder, indexDir, client, deduplicate=True)
+
+    assert summary['duplicates'] == 1
+    assert loadBinaryIndex(indexDir)['manifest']['count'] == 2
+    assert loadSources(indexDir)[str(folder / "draft.docx")]['duplicateOf'] == str(folder / "draft (1).docx")
+
+
+def test_passageLevelMustMatchTheIndex(tmp_path, client, writeDocx):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    writeDocx(folder / "essay0.docx", essay(0))
+    indexDir = tmp_path / "index"
+    ingest(folder, indexDir, client)
+    writeDocx(folder / "essay1.docx", essay(1))
+
+    with pytest.raises(ValueError, match="narrative-level"):
+        ingest(folder, indexDir, client, passageLevel=True)
+    assert loadBinaryIndex(indexDir)['manifest']['count'] == 1
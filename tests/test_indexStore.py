@@ -0,0 +1,63 @@
+from pathlib import Path
+import json
+import numpy as np
+import pytest
+from indexStore import (writeBinaryIndex, loadBinaryIndex, appendToBinaryIndex, removeRowsFromBinaryIndex, _appendNpyRows,
+                        compactBinaryIndex, MANIFEST_FILE, EMBEDDINGS_FILE, VALID_FILE, TEXTS_FILE)
+from runtime import loadSearchIndex, findTopNarratives
+
+
+def writeFirstFormatIndex(indexDir: Path, narratives: list) -> None:
+    """Writes an index the way the first binary format did: raw float32 rows, texts.json and no 'normalized' key."""
+    indexDir.mkdir()
+    embeddings = np.array([narrative['embedding'] for narrative in narratives], dtype=np.float32) * 3.0
+    np.save(indexDir / EMBEDDINGS_FILE, embeddings)
+    np.save(indexDir / VALID_FILE, np.ones(len(narratives), dtype=bool))
+    with open(indexDir / TEXTS_FILE, "w") as f:
+        json.dump([narrative['text'] for narrative in narratives], f)
+    with open(indexDir / MANIFEST_FILE, "w") as f:
+        json.dump({"formatVersion": 1, "count": len(narratives), "dimension": embeddings.shape[1],
+                   "dtype": "float32"}, f)
+
+
+def test_firstFormatIndexLoadsAndIsNormalized(tmp_path, narratives):
+    writeFirstFormatIndex(tmp_path / "index", narratives)
+
+    searchIndex = loadSearchIndex(tmp_path / "index")
+
+    assert searchIndex is not None
+    assert np.allclose(np.linalg.norm(searchIndex.embeddings, axis=1), 1.0, atol=1e-5)
+    best = findTopNarratives([narratives[3]['embedding']], searchIndex, k=1)[0][0]
+    assert best['text'] == narratives[3]['text']
+    assert best['score'] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_appendThenCompactKeepsOnlyLiveRows(tmp_path, narratives):
+    indexDir = tmp_path / "index"
+    writeBinaryIndex(narratives[:8], indexDir)
+    assert appendToBinaryIndex(narratives[8:], indexDir) == range(8, 12)
+
+    removeRowsFromBinaryIndex(indexDir, [0, 9])
+    assert loadBinaryIndex(indexDir)['valid'].sum() == 10
+    compactBinaryIndex(indexDir)
+
+    binaryIndex = loadBinaryIndex(indexDir)
+    expected = [narrative['text'] for row, narrative in enumerate(narratives) if row not in (0, 9)]
+    assert list(binaryIndex['texts']) == expected
+    assert binaryIndex['valid'].all()
+
+
+
+def test_appendAfterACrashedAppendStaysAligned(tmp_path):
+    indexDir = tmp_path / "index"
+    writeBinaryIndex([{'text': "a", 'embedding': [1.0, 0.0, 0.0]}, {'text': "b", 'embedding': [0.0, 1.0, 0.0]}], indexDir)
+    # An append that wrote its embedding row but crashed before the manifest
+    _appendNpyRows(indexDir / EMBEDDINGS_FILE, np.array([[0.0, 0.0, 1.0]], dtype=np.float32), 2)
+    assert loadBinaryIndex(indexDir)['manifest']['count'] == 2
+
+    assert appendToBinaryIndex([{'text': "c", 'embedding': [0.6, 0.8, 0.0]}], indexDir) == range(2, 3)
+
+    binaryIndex = loadBinaryIndex(indexDir)
+    assert list(binaryIndex['texts']) == ["a", "b", "c"]
+    assert np.allclose(binaryIndex['embeddings'][2], [0.6, 0.8, 0.0])
+    assert np.load(indexDir / EMBEDDINGS_FILE).shape == (3, 3)
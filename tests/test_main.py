@@ -0,0 +1,36 @@
+import pytest
+import main
+from indexStore import writeBinaryIndex
+
+
+@pytest.fixture
+def session(tmp_path, narratives, monkeypatch):
+    monkeypatch.setattr("answerTable.ANSWER_TABLE_FILE", tmp_path / "answerTable.json")
+    writeBinaryIndex(narratives, tmp_path / "index")
+    session = main.QuerySession(tmp_path / "index", fakeClient=True)
+    yield session
+    session.close()
+
+
+def test_resultsStreamInInputOrder(session):
+    queries = [f"concept {i}" for i in range(20)]
+
+    results = list(main.answerStream(session, iter(queries), concurrency=4))
+
+    assert [result['query'] for result in results] == queries
+    assert all(result['source'] == "generated" for result in results)
+
+
+def test_readErrorsReachTheCaller(session, tmp_path):
+    with pytest.raises(OSError):
+        list(main.answerStream(session, main.readQueries(tmp_path / "missing.txt")))
+
+    def brokenQueries():
+        yield "Anomie"
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    results = []
+    with pytest.raises(UnicodeDecodeError):
+        for result in main.answerStream(session, brokenQueries()):
+            results.append(result)
+    assert [result['query'] for result in results] == ["Anomie"]
@@ -0,0 +1,40 @@
+import pytest
+from metadata import MetadataColumns, FilterError, describeDocument
+
+
+@pytest.fixture
+def columns():
+    return MetadataColumns.fromRecords([
+        describeDocument("Fall 2024/ana_LATE_111_9001_Synthasis paper 3.docx", "word " * 400),
+        describeDocument("Fall 2024/ben_222_9002_SOC 101 Reflection essay 1.pdf", "word " * 1200),
+        describeDocument("Spring 2025/cam_333_9003_Final.docx", "word " * 2500),
+    ])
+
+
+def test_describeDocumentParsesTheFileName():
+    record = describeDocument("Fall 2024/ana_LATE_111_9001_Synthasis paper 3.docx", "one two three")
+    assert record['assignment'] == "Synthesis Paper 3"
+    assert record['term'] == "Fall 2024"
+    assert (record['late'], record['submissionId'], record['wordCount']) == (True, 9001, 3)
+
+
+def test_filtersCombine(columns):
+    assert columns.mask({"term": "Fall 2024"}).tolist() == [True, True, False]
+    assert columns.mask({"docType": ["docx"], "late": False}).tolist() == [False, False, True]
+    assert columns.mask({"wordCount": {"min": 1000, "max": 2000}}).tolist() == [False, True, False]
+    assert columns.mask({"assignment": "Midterm Paper"}).tolist() == [False, False, False]
+
+
+@pytest.mark.parametrize("filters", [
+    {"grade": "A"},
+    {"term": 2024},
+    {"wordCount": "many"},
+    {"wordCount": {"min": "abc"}},
+    {"wordCount": {"max": None}},
+    {"wordCount": {"min": True}},
+    {"wordCount": {"above": 3}},
+    {"late": {"min": 0}},
+])
+def test_invalidFiltersRaiseFilterError(columns, filters):
+    with pytest.raises(FilterError):
+        columns.mask(filters)
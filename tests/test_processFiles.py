@@ -0,0 +1,36 @@
+from pathlib import Path
+import sys
+import types
+import docx
+from docx.enum.section import WD_SECTION
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "exampleAPIUsage"))
+import process_files
+
+
+class FakeNER:
+    """Tags any text containing "Smith" as a PERSON, through the nlp.pipe interface."""
+
+    def pipe(self, texts, as_tuples=False, **options):
+        for text, context in texts:
+            entities = [types.SimpleNamespace(label_="PERSON")] if "Smith" in text else []
+            yield types.SimpleNamespace(ents=entities), context
+
+
+def test_linkedHeadersAreRedactedOnce(tmp_path):
+    document = docx.Document()
+    document.sections[0].header.paragraphs[0].text = "Jane Smith"
+    document.add_paragraph("Jane Smith")
+    document.add_paragraph("The first section.")
+    document.add_section(WD_SECTION.NEW_PAGE) # its header links to the first one
+    document.add_paragraph("The second section.")
+    document.save(tmp_path / "essay.docx")
+    (tmp_path / "out").mkdir()
+
+    report = process_files.redact_docx_files([tmp_path / "essay.docx"], tmp_path / "out", FakeNER())
+
+    assert [(entry['file'], entry['removed']) for entry in report] == [("essay.docx", 2)]
+    redacted = docx.Document(tmp_path / "out" / "essay.docx")
+    assert [p.text for p in redacted.paragraphs if p.text] == ["The first section.", "The second section."]
+    assert all("Smith" not in p.text for section in redacted.sections for p in section.header.paragraphs)
+    assert (tmp_path / "out" / process_files.REDACTION_CACHE_FILE).exists()
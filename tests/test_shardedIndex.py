@@ -0,0 +1,28 @@
+import threading
+import pytest
+from shardedIndex import writeShard
+import runtime
+from runtime import loadSearchIndex, findTopNarratives, ShardedSearchIndex
+
+
+def test_reloadsShareOneShardSearchPool(tmp_path, narratives, monkeypatch):
+    monkeypatch.setattr(runtime, "SHARD_SEARCH_WORKERS", 2) # search the shards on the pool even on one CPU
+    indexDir = tmp_path / "index"
+    writeShard(narratives[:6], indexDir, "a")
+    writeShard(narratives[6:], indexDir, "b")
+
+    first = loadSearchIndex(indexDir)
+    assert isinstance(first, ShardedSearchIndex)
+    findTopNarratives([narratives[7]['embedding']], first, k=1)
+    threadsAfterFirst = threading.active_count()
+
+    # Each hot reload builds a new index; it must reuse the pool, not start another one
+    for _ in range(5):
+        reloaded = loadSearchIndex(indexDir)
+        best = findTopNarratives([narratives[7]['embedding']], reloaded, k=1)[0][0]
+        assert best['text'] == narratives[7]['text']
+        assert best['score'] == pytest.approx(1.0, abs=1e-5)
+
+    assert threading.active_count() == threadsAfterFirst
+    # The index swapped out keeps working for requests still holding it
+    assert findTopNarratives([narratives[2]['embedding']], first, k=1)[0][0]['text'] == narratives[2]['text']
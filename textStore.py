@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from pathlib import Path
+import mmap
+import threading
+import zlib
+import numpy as np
+
+'''This file keeps the narrative texts of an index in one append-only blob with an
+offset/length table, so a server only reads and decodes the few texts a request
+actually returns instead of holding every essay in memory'''
+
+TEXT_COMPRESSIONS = ("zlib", "none")
+TEXT_CACHE_SIZE = 64 # Decoded texts kept in memory per store
+ZLIB_LEVEL = 6
+
+
+class TextStore:
+    """A read-only, list-like view of texts stored back to back in a blob file.
+
+    Text i is blob[table[i, 0]:table[i, 0] + table[i, 1]], UTF-8 encoded and, with
+    "zlib" compression, compressed on its own, so any one text can be decoded without
+    the others. The blob is memory-mapped when the store is created, which reads
+    nothing yet: only the pages of texts actually requested are paged in, and they are
+    shared between processes. The `cacheSize` most recently read texts are kept decoded.
+    """
+
+    def __init__(self, blobPath: Path, table: np.ndarray, compression: str = "zlib", cacheSize: int = TEXT_CACHE_SIZE):
+        """
+        Args:
+            blobPath: The blob file written by writeTextStore.
+            table: An (N, 2) int64 array of each text's (offset, length) in the blob.
+            compression: "zlib" or "none".
+            cacheSize: The number of decoded texts kept in the LRU.
+        """
+        if compression not in TEXT_COMPRESSIONS:
+            raise ValueError(f"Unknown text compression '{compression}'.")
+        self.blobPath = blobPath
+        self.table = table
+        self.compression = compression
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        # Mapped now rather than on first use, so a blob renamed into place later is never mixed with this table
+        with open(blobPath, "rb") as f:
+            # An empty file cannot be mapped (and holds no texts)
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else b""
+
+    @classmethod
+    def open(cls, blobPath: Path, tablePath: Path, count: int, compression: str = "zlib") -> "TextStore":
+        """Opens a store's first `count` texts; rows appended after the manifest are ignored."""
+        return cls(blobPath, np.load(tablePath)[:count], compression)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _decode(self, row: int) -> str:
+        offset, length = self.table[row]
+        data = self.blob[offset:offset + length]
+        if self.compression == "zlib":
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Text {row} is out of range for a store of {len(self)} texts.")
+
+        with self.lock:
+            text = self.cache.get(row)
+            if text is not None:
+                self.cache.move_to_end(row)
+                return text
+        text = self._decode(row)
+        with self.lock:
+            self.cache[row] = text
+            if len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+        return text
+
+    def __iter__(self):
+        """Yields every text in order without filling the cache (for rebuilds and backfills)."""
+        for row in range(len(self)):
+            yield self._decode(row)
+
+
+def _encodeTexts(texts: list, compression: str, start: int = 0) -> tuple:
+    """Returns the blob bytes of the texts and their (offset, length) table, offsets counted from start."""
+    records = [text.encode("utf-8") for text in texts]
+    if compression == "zlib":
+        records = [zlib.compress(record, ZLIB_LEVEL) for record in records]
+    lengths = np.array([len(record) for record in records], dtype=np.int64)
+    offsets = start + np.cumsum(lengths) - lengths
+    return b"".join(records), np.stack([offsets, lengths], axis=1).reshape(-1, 2)
+
+
+def _saveTable(tablePath: Path, table: np.ndarray) -> None:
+    temporaryPath = tablePath.with_name(tablePath.name + ".tmp.npy")
+    np.save(temporaryPath, table)
+    temporaryPath.replace(tablePath)
+
+
+def writeTextStore(blobPath: Path, tablePath: Path, texts: list, compression: str = "zlib") -> None:
+    """Writes a new store; both files are renamed into place, so a server with the
+    old blob mapped keeps reading the old texts."""
+    if compression not in TEXT_COMPRESSIONS:
+        raise ValueError(f"Unknown text compression '{compression}'.")
+    blob, table = _encodeTexts(texts, compression)
+    temporaryPath = blobPath.with_name(blobPath.name + ".tmp")
+    with open(temporaryPath, "wb") as f:
+        f.write(blob)
+    temporaryPath.replace(blobPath)
+    _saveTable(tablePath, table)
+
+
+def appendToTextStore(blobPath: Path, tablePath: Path, texts: list, count: int, compression: str = "zlib") -> None:
+    """Appends texts after the store's first `count` texts.
+
+    The new records are written at the end of the blob and the table is replaced;
+    existing bytes never move, so readers of the old table are unaffected. Bytes
+    left by an interrupted append are skipped rather than reused.
+    """
+    table = np.load(tablePath)[:count]
+    with open(blobPath, "ab") as f:
+        f.seek(0, 2)
+        blob, newTable = _encodeTexts(texts, compression, start=f.tell())
+        f.write(blob)
+    _saveTable(tablePath, np.concatenate([table, newTable]))